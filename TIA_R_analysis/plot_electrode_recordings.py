@@ -1,105 +1,118 @@
 # Copyright (c) 2020 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
 
 """
+Plot the electrode potentials recorded with different analog routing resistances, and the
+CV reads taken through them.
 
+The workbooks are loaded through excel_cache, so after the first run only the cached columns
+are read.  Call the plot functions with the loaded frames to remake the figure without
+loading the data again, e.g. in an interactive session.
 """
 
 __author__ = "Kyle Vitatus Lopin"
 
 # installed libraries
 import matplotlib.pyplot as plt
-import pandas as pd
+# local files
+import excel_cache
 
-plt.style.use("seaborn-bright")
+RECORDINGS_FILE = "Electrode_recordings.xlsx"
+CV_FILE = "CV_reads_10k.xlsx"
+RECORDING_ROWS = slice(2, 20105)  # rows of the recordings with data
+CV_POINTS = 2001
+# time_columns = ['ch1', 'ch2', 'ch1.1', 'ch2.1', 'ch1.2', 'ch2.2', 'ch1.3', 'ch2.3']
+TIME_COLUMNS = ['ch1.3', 'ch1.2', 'ch2.2']
+LABELS = ["Ideal WE potential",
+          "Actual WE potential",
+          "Voltage Error",
+          "D"]
 
-data = pd.read_excel("Electrode_recordings.xlsx")
 
-print(data)
-print(data.columns)
-time = data["Time"].iloc[2:20105]
+def load_data(recordings_file=RECORDINGS_FILE, cv_file=CV_FILE):
+    """ Load the workbooks
+    :return: DataFrame of the electrode recordings and DataFrame of the CV reads
+    """
+    return excel_cache.load_frame(recordings_file), excel_cache.load_frame(cv_file)
 
-print(time)
-time_series = -data.iloc[2:20105, 1:]
-print(time_series)
-print("columns: ", time_series.columns)
-time_columns = ['ch1', 'ch2', 'ch1.1', 'ch2.1', 'ch1.2', 'ch2.2', 'ch1.3', 'ch2.3']
-time_columns = ['ch1.3', 'ch1.2', 'ch2.2']
 
-# time_columns = ['ch2', 'ch2.1', 'ch2.2', 'ch2.3']
+def plot_electrode_potentials(ax, recordings, time_columns=TIME_COLUMNS):
+    """ Plot the electrode potential recordings
+    :param ax: matplotlib axis to plot on
+    :param recordings: DataFrame from load_data
+    :param time_columns: columns of the recordings to plot
+    """
+    time = recordings["Time"].iloc[RECORDING_ROWS]
+    time_series = -recordings.iloc[RECORDING_ROWS, 1:]
+    i = 0
+    for column in time_columns:
+        if ".1" in column:
+            continue
+        color = 'orangered'
+        style = '--'
+        if ".3" in column:
+            color = 'red'
+            style = '-'
+        elif ".2" in column:
+            style = ':'
+            color = 'red'
+        if "ch1" in column:
+            color = 'gray'
+            if ".3" in column:
+                style = '-'
+                color = "black"
+        if i == 2:
+            ax.plot(time, -time_series[column],
+                    color=color, ls=style, label=LABELS[i])
+        else:
+            ax.plot(time, time_series[column],
+                    color=color, ls=style, label=LABELS[i])
+        i += 1
+    ax.set_xlabel("Time (seconds)", size=11)
+    ax.set_ylabel("Potential (V)", size=11)
+    ax.set_title("Voltage Readings of\nElectrodes", size=11)
+    ax.legend(prop={'size': 9})
 
-# ax = time_series.plot(color=['red', 'black', 'red', 'black', 'red', 'black'])
 
-# fig, (ax1, ax2) = plt.subplots(ncols=2, nrows=1, figsize=(10, 6))
-fig, (ax2) = plt.subplots(ncols=1, nrows=1, figsize=(4.5, 4.5))
-labels = ["Ideal WE potential",
-          "Actual WE potential",
-          "Voltage Error",
-          "D"]
-i = 0
-for column in time_columns:
-    if ".1" in column:
-        continue
-    color = 'orangered'
-    type = " WE"
-    restance = u" 2.5k \u03A9"
-    style = '--'
-    if ".3" in column:
-        color = 'red'
-        style = '-'
-        restance = u" ideal   "
-    elif ".2kjlkjl" in column:
-        style = '-'
-        restance = u" 1.6k \u03A9"
-    elif ".2" in column:
-        print('kkklk', time_series[column])
-        style = ':'
-        color = 'red'
-        restance = u" 1k \u03A9   "
-    if "ch1" in column:
-        color = 'gray'
-        type = " RE - WE"
-        if ".3" in column:
+def plot_cv_reads(ax, cv_data):
+    """ Plot the CV reads taken with each routing resistance
+    :param ax: matplotlib axis to plot on
+    :param cv_data: DataFrame from load_data
+    """
+    voltage = cv_data['voltage'].iloc[:CV_POINTS] / 1000
+    for column in cv_data.columns:
+        style = '--'
+        color = "forestgreen"
+        if column == 'voltage':
+            continue
+        if 'ideal' in column:
+            color = 'black'
+            style = ':'
+        elif column == '1k':
+            color = "red"
             style = '-'
-            color = "black"
+        ax.plot(voltage, cv_data[column].iloc[:CV_POINTS], label=column, color=color, ls=style)
+    ax.set_xlabel("Voltage (V)")
+    ax.set_ylabel("Current (\u00B5A)")
+    ax.set_title("CV reading")
+    ax.legend(title='Analog Routing\nResistance', loc='lower right')
+    ax.annotate('A)', (-0.27, 1.05), xycoords='axes fraction', size=18)
+
 
-    print(column)
-    if i == 2:
-        ax2.plot(time, -time_series[column],
-                 color=color, ls=style, label=labels[i])
+def main(with_cv=False):
+    """ Make the figure
+    :param with_cv: True to put the CV reads next to the electrode potentials
+    """
+    plt.style.use("seaborn-bright")
+    recordings, cv_data = load_data()
+    if with_cv:
+        fig, (ax1, ax2) = plt.subplots(ncols=2, nrows=1, figsize=(10, 6))
+        plot_cv_reads(ax1, cv_data)
     else:
-        ax2.plot(time, time_series[column],
-                 color=color, ls=style, label=labels[i])
-    i += 1
-# ax.set_xticklabels(time)
-ax2.set_xlabel("Time (seconds)", size=11)
-ax2.set_ylabel("Potential (V)", size=11)
-ax2.set_title("Voltage Readings of\nElectrodes", size=11)
-# ax.set_ylim([-1, 1])
-ax2.legend(prop={'size': 9})
-# ax2.annotate('B)', (-0.27, 1.05), xycoords='axes fraction', size=18)
-cv_data = pd.read_excel("CV_reads_10k.xlsx")
+        fig, ax2 = plt.subplots(ncols=1, nrows=1, figsize=(4.5, 4.5))
+    plot_electrode_potentials(ax2, recordings)
+    plt.tight_layout()
+    plt.show()
 
-print(cv_data)
-voltage = cv_data['voltage'].iloc[:2001] / 1000
-print(voltage)
-for column in cv_data.columns:
-    style = '--'
-    color = "forestgreen"
-    if column == 'voltage':
-        continue
-    print(column)
-    if 'ideal' in column:
-        color = 'black'
-        style = ':'
-    elif column == '1k':
-        color = "red"
-        style = '-'
-#     ax1.plot(voltage, cv_data[column].iloc[:2001], label=column, color=color, ls=style)
-# ax1.set_xlabel("Voltage (V)")
-# ax1.set_ylabel("Current (\u00B5A)")
-# ax1.set_title("CV reading")
-# ax1.legend(title='Analog Routing\nResistance', loc='lower right')
-# ax1.annotate('A)', (-0.27, 1.05), xycoords='axes fraction', size=18)
 
-plt.tight_layout()
-plt.show()
+if __name__ == '__main__':
+    main()
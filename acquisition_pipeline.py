@@ -0,0 +1,220 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Move the reading and converting of data from the device off the tkinter thread.
+
+A Pipeline has three stages:
+    read: a thread that reads from the device at a steady rate
+    convert: a thread that converts the data read into what is graphed
+    the user interface: tkinter after calls that take the converted data and graph it
+The stages are joined by bounded queues.  If a later stage falls behind, the stage before it
+waits for room in the queue, and the time it waited is counted in the stage's stats so it can
+be seen which stage is holding the others up.  A slow redraw of the graph then only delays
+the graph, the device is still read on time.
+
+run_in_background is for the one off reads at the end of a CV or ASV scan, it runs the read
+in a thread and calls back on the tkinter thread with the result.
+
+Only the user interface stage should touch tkinter widgets, tkinter is not thread safe.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import logging
+import queue
+import threading
+import time
+
+QUEUE_SIZE = 32  # items each queue can hold before the stage putting to it has to wait
+PUT_TIMEOUT = 0.1  # seconds to wait for room in a queue before checking if stopped
+BACKGROUND_POLL = 20  # ms between checks if a background task is done
+SLOW_PUT_WARNING = 0.5  # seconds a stage waits for room before a warning is logged
+IDLE_WAIT = 0.005  # seconds to wait after an empty read if there is no poll interval
+
+
+class StageStats(object):
+    """ Count the work done by a stage and how long it was held up by the next stage """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0  # items put into the next queue
+        self.errors = 0
+        self.blocked_time = 0.0  # seconds spent waiting for room in the next queue
+        self.full_count = 0  # times the next queue was full
+        self.max_depth = 0  # most items seen waiting in the next queue
+
+    def as_dict(self):
+        return {'items': self.items, 'errors': self.errors,
+                'blocked_time': self.blocked_time, 'full_count': self.full_count,
+                'max_depth': self.max_depth}
+
+
+class Pipeline(object):
+    """ Read data in a thread, convert it in another thread and pass it to the user
+    interface through a queue
+    """
+    def __init__(self, read, convert=None, name="acquisition", queue_size=QUEUE_SIZE,
+                 poll_interval=None):
+        """
+        :param read: function that reads from the device, returns None if nothing was read,
+        called over and over in the read thread
+        :param convert: function that converts what read returns, called in the convert thread,
+        None passes the data on as it is
+        :param name: name used for the threads and in the logs
+        :param queue_size: number of items each queue can hold
+        :param poll_interval: function that returns the seconds to wait between reads, None to
+        read again straight away after a read that got data
+        """
+        self.read = read
+        self.convert = convert
+        self.name = name
+        self.poll_interval = poll_interval
+        self.raw_queue = queue.Queue(queue_size)
+        self.out_queue = queue.Queue(queue_size)
+        self.stats = {'read': StageStats('read'), 'convert': StageStats('convert'),
+                      'display': StageStats('display')}
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        """ Start the read and convert threads """
+        if self.running:
+            return
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._read_loop, daemon=True,
+                                          name=self.name + "-read"),
+                         threading.Thread(target=self._convert_loop, daemon=True,
+                                          name=self.name + "-convert")]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=2.0):
+        """ Stop the threads, data that was already converted can still be drained
+        :param timeout: seconds to wait for each thread to finish its current read
+        """
+        self._stop.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        logging.debug("%s pipeline stopped: %s", self.name, self.report())
+
+    def drain(self, max_items=None):
+        """ Get the converted data that is waiting, call this from the user interface thread
+        :param max_items: most items to get, None for all of them
+        :return: list of the converted items in the order they were read
+        """
+        items = []
+        self._note_depth(self.stats['display'], self.out_queue)
+        while max_items is None or len(items) < max_items:
+            try:
+                items.append(self.out_queue.get_nowait())
+            except queue.Empty:
+                break
+        self.stats['display'].items += len(items)
+        return items
+
+    def report(self):
+        """ Get the stats of each stage, blocked_time of the read stage growing means the
+        convert or display stage is too slow
+        :return: dict of stage name: dict of its stats
+        """
+        stats = {name: stage.as_dict() for name, stage in self.stats.items()}
+        stats['read']['queued'] = self.raw_queue.qsize()
+        stats['convert']['queued'] = self.out_queue.qsize()
+        return stats
+
+    def _read_loop(self):
+        stats = self.stats['read']
+        while not self._stop.is_set():
+            try:
+                item = self.read()
+            except Exception as error:
+                stats.errors += 1
+                logging.error("%s read failed: %s", self.name, error)
+                item = None
+            if item is not None:
+                self._put(self.raw_queue, item, stats)
+            if self.poll_interval:
+                self._stop.wait(self.poll_interval())
+            elif item is None:
+                self._stop.wait(IDLE_WAIT)  # do not spin while there is nothing to read
+
+    def _convert_loop(self):
+        stats = self.stats['convert']
+        while not self._stop.is_set():
+            try:
+                item = self.raw_queue.get(timeout=PUT_TIMEOUT)
+            except queue.Empty:
+                continue
+            if self.convert:
+                try:
+                    item = self.convert(item)
+                except Exception as error:
+                    stats.errors += 1
+                    logging.error("%s convert failed: %s", self.name, error)
+                    continue
+            self._put(self.out_queue, item, stats)
+
+    def _put(self, _queue, item, stats):
+        """ Put an item in the next queue, waiting for room, until the pipeline is stopped """
+        self._note_depth(stats, _queue)
+        start = time.perf_counter()
+        if _queue.full():
+            stats.full_count += 1
+        while not self._stop.is_set():
+            try:
+                _queue.put(item, timeout=PUT_TIMEOUT)
+                break
+            except queue.Full:
+                continue
+        else:
+            return  # stopped while waiting, the item is dropped
+        waited = time.perf_counter() - start
+        stats.blocked_time += waited
+        stats.items += 1
+        if waited > SLOW_PUT_WARNING:
+            logging.warning("%s %s stage waited %.2f s for the next stage", self.name,
+                            stats.name, waited)
+
+    @staticmethod
+    def _note_depth(stats, _queue):
+        stats.max_depth = max(stats.max_depth, _queue.qsize())
+
+
+def run_in_background(master, work, on_done, on_error=None):
+    """ Run work in a thread and call on_done with its result on the tkinter thread
+    :param master: tkinter widget to schedule the callbacks with
+    :param work: function to run in the thread, it should not use tkinter
+    :param on_done: called with the result of work
+    :param on_error: called with the exception if work raises one, None logs it
+    :return: the thread work is running in
+    """
+    results = queue.Queue(1)
+
+    def run():
+        try:
+            results.put((True, work()))
+        except Exception as error:
+            results.put((False, error))
+
+    def check():
+        try:
+            finished, result = results.get_nowait()
+        except queue.Empty:
+            master.after(BACKGROUND_POLL, check)
+            return
+        if finished:
+            on_done(result)
+        elif on_error:
+            on_error(result)
+        else:
+            logging.error("background task failed: %s", result)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    master.after(BACKGROUND_POLL, check)
+    return thread
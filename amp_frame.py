@@ -14,7 +14,10 @@ except:
     from tkinter import filedialog as fd
 import tkinter as tk
 from tkinter import ttk
+# installed libraries
+import numpy as np
 # local files
+import acquisition_pipeline
 import change_toplevel
 import tkinter_pyplot
 
@@ -25,12 +28,90 @@ OPTIONS_BACKGROUND = 'LightCyan4'
 USB_IN_BYTE_SIZE = 64
 USB_UINT16_SIZE = 32
 
+TARGET_LATENCY = 0.1  # seconds a sample should take to be shown on the graph
+MIN_PACKET_SIZE = 1  # data points in each packet the device sends
+MAX_PACKET_SIZE = 4000
+MIN_POLL_INTERVAL = 10  # ms between checking for packets
+MAX_POLL_INTERVAL = 100
+DISPLAY_INTERVAL = int(TARGET_LATENCY * 1000)  # ms between updating the graph
+CANCEL_STOP_TIMEOUT = 0.2  # seconds the tkinter thread waits for each pipeline thread to stop
+
+
+class PacketSizer(object):
+    """ Pick how many data points the device should put in each amperometry packet and how
+    often to check for packets, from the rate the data actually arrives and how many packets
+    are waiting to be read.
+
+    The packet size is sent with the command that starts a run so it is picked at the start
+    of each run, to show the data within about TARGET_LATENCY.  If packets backed up during
+    the last run the packets are made bigger so fewer have to be read.  The poll interval is
+    changed as each packet arrives to check about twice per packet, or as fast as allowed
+    while packets are waiting.
+    """
+    def __init__(self, sampling_rate):
+        """
+        :param sampling_rate: samples per second the device will be set to
+        """
+        self.sampling_rate = sampling_rate
+        self.arrival_rate = None  # measured samples per second of the last run
+        self.packet_size = size_for_rate(sampling_rate)
+        self.poll_interval = MAX_POLL_INTERVAL
+        self.backlogged = False  # if packets were waiting to be read in this run
+        self._start_time = None
+        self._samples = 0
+
+    def start_run(self, sampling_rate):
+        """ Pick the packet size for a new run
+        :param sampling_rate: samples per second the device is set to
+        :return: int - number of data points in each packet
+        """
+        if sampling_rate != self.sampling_rate:  # the last run's measurements do not apply
+            self.sampling_rate = sampling_rate
+            self.arrival_rate = None
+            self.backlogged = False
+        size = size_for_rate(self.arrival_rate or sampling_rate)
+        if self.backlogged:
+            size = max(size, 2 * self.packet_size)
+        self.packet_size = min(max(size, MIN_PACKET_SIZE), MAX_PACKET_SIZE)
+        self.poll_interval = self._interval_for(self.arrival_rate or sampling_rate)
+        self.backlogged = False
+        self._start_time = time.perf_counter()
+        self._samples = 0
+        return self.packet_size
+
+    def packet_received(self, samples, backlog, now=None):
+        """ Update the arrival rate and poll interval after a packet is read
+        :param samples: number of data points read
+        :param backlog: number of packets still waiting to be read
+        :param now: time.perf_counter() of the read, for testing
+        """
+        now = time.perf_counter() if now is None else now
+        self._samples += samples
+        if self._start_time is not None and now > self._start_time:
+            self.arrival_rate = self._samples / (now - self._start_time)
+        if backlog:
+            self.backlogged = True
+            self.poll_interval = MIN_POLL_INTERVAL
+        else:
+            self.poll_interval = self._interval_for(self.arrival_rate or self.sampling_rate)
+
+    def _interval_for(self, rate):
+        """ Poll twice for each packet, in ms """
+        interval = int(round(500.0 * self.packet_size / rate)) if rate > 0 else MAX_POLL_INTERVAL
+        return min(max(interval, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+
+def size_for_rate(rate):
+    """ Number of data points that arrive in TARGET_LATENCY at a sampling rate """
+    return min(max(int(rate * TARGET_LATENCY), MIN_PACKET_SIZE), MAX_PACKET_SIZE)
+
 
 class AmpFrame(ttk.Frame):
     """ Frame to hold widgets and information to perform amperometry experiments,
     also includes the data calls and handles usb commands for amperometry experiments
     NOTE: Make a parent class to hold this and cv_frame
     """
+    run_text = "Amperometry"  # name of the technique on the run button
 
     def __init__(self, master, parent_notebook, graph_properties):
         ttk.Frame.__init__(self, parent_notebook)
@@ -44,14 +125,23 @@ class AmpFrame(ttk.Frame):
         buttons_frame.pack(side='bottom', fill=tk.X)
 
         device = self.USBHandler(self.graph, master.device, master)
-        self.settings_frame = self.AmpSettingsDisplay(master, options_frame,
-                                                      self.graph, device,
-                                                      master.device_params)
+        self.device = device
+        self.settings_frame = self.make_settings_display(master, options_frame, device)
         self.settings_frame.pack(side="top", fill=tk.X)
         self.make_buttons(buttons_frame, self.graph, device)
 
+    def make_settings_display(self, master, options_frame, device):
+        """ Make the frame that shows the settings of the technique
+        :param master: root application
+        :param options_frame: frame to put the settings frame in
+        :param device: USBHandler of the frame
+        :return: the settings frame
+        """
+        return self.AmpSettingsDisplay(master, options_frame, self.graph, device,
+                                       master.device_params)
+
     def make_graph_area(self, master, graph_props):
-        if check_display_type() == 'matplotlib':
+        if tkinter_pyplot.check_display_type() == 'matplotlib':
             # current_lim = 1.2 * 1000. / master.device_params.adc_tia.tia_resistor
             current_lim = master.device_params.adc_tia.current_lims
             # 1's are not needed, the properties will override this
@@ -71,7 +161,7 @@ class AmpFrame(ttk.Frame):
         """
         # make a button to run a amperometry scan
         self.run_button = tk.Button(frame,
-                                    text="Start Amperometry",
+                                    text="Start " + self.run_text,
                                     command=lambda: self.toggle_amp_run(device, graph))
         self.run_button.pack(side='bottom', fill=tk.BOTH)
         tk.Button(frame,
@@ -81,12 +171,12 @@ class AmpFrame(ttk.Frame):
 
     def toggle_amp_run(self, device, graph):
         if self.running:  # stop reading data and tell the device to stop running
-            self.run_button.config(text="Start Amperometry")
+            self.run_button.config(text="Start " + self.run_text)
             self.running = False
             device.cancel_run()
         else:
-            logging.info("starting amperometry run")
-            self.run_button.config(text="Stop Amperometry")
+            logging.info("starting %s run", self.run_text.lower())
+            self.run_button.config(text="Stop " + self.run_text)
             self.running = True
             device.amp_run(graph, self)
 
@@ -106,6 +196,35 @@ class AmpFrame(ttk.Frame):
                     # print(device.time[i], device.data[i])
                     writer.writerow([device.time[i], f" {device.data[i]}"])
             # _file.close()
+            device.master.catalog_runs(_file, 'csv', [{'technique': 'amp',
+                                                       'label': "amperometry",
+                                                       'run_info': device.run_info}])
+
+    def session_runs(self):
+        """ Make the run of the amperometry data to save in a session file
+        :return: list with one run dict for session_file.save_session, or an empty list if
+        there is no data
+        """
+        if len(self.device.data) == 0:
+            return []
+        return [{'technique': 'amp', 'label': "amperometry", 'notes': " ", 'color': None,
+                 'run_info': self.device.run_info,
+                 'x': np.asarray(self.device.time, dtype=np.float64),
+                 'y': np.asarray(self.device.data, dtype=np.float64)}]
+
+    def open_data(self, saved_data):
+        """ Display amperometry data read from a saved file, the data replaces the data of the
+        last run so it can be saved again
+        :param saved_data: dict from pyplot_data_class.read_csv_data with the time in 'x' and
+        the current in 'y'
+        """
+        if self.running or not saved_data['y'] or len(saved_data['y'][0]) == 0:
+            return
+        self.device.time = saved_data['x'][0].tolist()
+        self.device.data = saved_data['y'][0].tolist()
+        self.device.run_info = saved_data.get('run_info', [{}])[0]
+        self.graph.update_amp_data(self.device.time, self.device.data,
+                                   self.device.time[-1] - self.device.time[0])
 
     def set_tia_current_lim(self, _value, current_limit):
         """ The TIA setting has been changed so update the value shown to the user in the
@@ -131,106 +250,143 @@ class AmpFrame(ttk.Frame):
             self.settings = master.device_params.amp_settings
             self.running = None
             self.device_samples_smooth = 1
-            sampling_rate = self.settings.sampling_rate
-            if sampling_rate >= 1000:
-                # calculate the number of data points in a usb packets from the sampling rate by
-                # dividing by 5 (so that you update the data every 200 ms, i.e. 1s/5)
-                self.data_packet_size = int((sampling_rate / 5.0))
-
-            else:
-                # if the sampling rate is less than 1 kHz just update every 500 ms
-                self.data_packet_size = int(sampling_rate / 2.0)
-            # calculate the number of packets of data you should get every 200 ms by adding one
-            # to the data packet size to account for the termination code at the end and divide by
-            # 32 for the number of data points per packet
-            # (packets are 64 bytes - 2 bytes per uint16 data points
-            self.number_packets = (int((self.data_packet_size + 1.0) / 32.0)
-                                   + ((self.data_packet_size + 1.0) % 32 > 0))  # round the packet up
+            self.sizer = PacketSizer(self.settings.sampling_rate)
+            self.set_packet_size(self.sizer.packet_size)
             self.time_step = 1.0 / self.settings.sampling_rate
             self.endpoint = None  # placeholder, assign it correctly when an amperometry run starts
             self.uint16_array = [0] * 256
             self.t_ptr = -self.time_step
             self.data = []
             self.time = []
+            self.run_info = {}  # settings and calibration of the last run
             self.first_read_dumbed = False
             self.t_lenght_fixed = False
             self._reader = None
-            self.number_packets = 16
+            self.pipeline = None  # acquisition_pipeline.Pipeline of the run
+
+        def set_packet_size(self, packet_size):
+            """ Set the number of data points the device sends in each packet
+            :param packet_size: int - number of data points
+            """
+            self.data_packet_size = packet_size
+            # calculate the number of USB packets each data packet takes by adding one to the
+            # data packet size to account for the termination code at the end and divide by
+            # 32 for the number of data points per packet
+            # (packets are 64 bytes - 2 bytes per uint16 data points
+            self.number_packets = (int((self.data_packet_size + 1.0) / USB_UINT16_SIZE)
+                                   + ((self.data_packet_size + 1.0) % USB_UINT16_SIZE > 0))
 
         def amp_run(self, graph, amp_frame):
             # reinitialize the data, time and time pointer
             self.t_ptr = -self.time_step
             self.data = []
             self.time = []
+            self.run_info = self.master.device_params.run_info('amp')
             self.running = True
+            if self.device.deframer:
+                self.device.deframer.reset()  # accept any packet number for the new run
+            self.device.take_lost_samples()
             self.device_samples_smooth = self.device.samples_to_smooth
             self.device.samples_smooth = 50
             # set the sampling rate if it is not set correctly
             if (self.device.device_params.pwm_period_value !=
                     self.settings.pwm_period_value):
                 self.set_sample_rate(self.settings.sampling_rate)
+            self.set_packet_size(self.sizer.start_run(self.settings.sampling_rate))
+            logging.debug("amperometry packets of %s points, polled every %s ms",
+                          self.data_packet_size, self.sizer.poll_interval)
             # calculate the number to sent do the device to set the DAC for the voltage read
-            formatted_packets_size = '{0:04}'.format(self.data_packet_size)
-            self.device.usb_write("M|" + self.format_voltage(self.settings.voltage) + '|'
-                                  + formatted_packets_size)
+            self.device.send_command('amperometry', self.format_voltage(self.settings.voltage),
+                                     self.data_packet_size)
             time.sleep(0.1)
             self.endpoint = self.device.device[0][(0, 0)][0].bEndpointAddress  #
-            self.master.after(300, self.running_read)
+            self.master.after(300, self.start_reading)
+
+        def start_reading(self):
+            """ Start the threads that read and convert the data, and graph it as it comes """
+            self.pipeline = acquisition_pipeline.Pipeline(
+                self.read_packet, self.convert_packet, name="amperometry",
+                poll_interval=lambda: self.sizer.poll_interval / 1000.0)
+            self.pipeline.start()
+            self.running_read()
 
         def running_read(self):
-            self._reader = self.master.after(50, self.running_read)
-            if self.running:
-                get = self.device.usb_read_message()
-                if get:
-                    logging.debug("getting channel: %s", get[4])
-                    self.device.usb_write("F" + get[4])
-                    got_data = self.data_try()  # have to read in data packets
-                    if got_data:
-                        self.graph.update_amp_data(self.time, self.data, 10)
-
-        def data_try(self):
-            while True:
-                try:
-                    usb_input = self.device.get_data()
-                    data = self.device.process_data(usb_input)
-                except Exception as error:
-                    logging.error("missed data read: %s", error)
-                # dump the first read of the USB incase it is garbate
-                # TODO: Check this is still needed
-                if not self.first_read_dumbed:
-                    self.first_read_dumbed = True
-                    return False
-
-                if usb_input:
-                    self.data.extend(data)
-                    len_data = len(data)
-                    self.time.extend([x * self.time_step + self.t_ptr for x in range(1, len_data + 1)])
-                    self.t_ptr += len_data * self.time_step
-                    return True
-                # if usb_input:
-                #     len_input = len(data)
-                #     # down sampling hack
-                #     down_sampled_data = []
-                #     first_index = 0
-                #     len_sampled = len_input / self.settings.down_sample
-                #     for i in range(len_sampled):
-                #         first_index += self.settings.down_sample
-                #         down_sampled_data.append(sum(data[first_index:first_index + 9]) / self.settings.down_sample)
-                #
-                #     self.data.extend(down_sampled_data)
-                #     self.time.extend(
-                #         [x * self.time_step + self.t_ptr for x in range(1, len_sampled + 1)])
-                #     self.t_ptr += len_input * self.time_step
-                #     return True
+            """ Graph the data the pipeline has converted, runs on the tkinter thread """
+            self._reader = self.master.after(DISPLAY_INTERVAL, self.running_read)
+            if self.running and self.pipeline:
+                self.show_packets(self.pipeline.drain())
+
+        def show_packets(self, packets):
+            """ Add converted packets to the run's data and graph them
+            :param packets: list of the tuples of times and currents from convert_packet
+            """
+            for times, data in packets:
+                self.time.extend(times)
+                self.data.extend(data)
+            if packets:
+                self.graph.update_amp_data(self.time, self.data, 10)
+
+        def read_packet(self):
+            """ Read a packet of data if the device has one ready, runs in the pipeline's read
+            thread
+            :return: tuple of the adc counts and the number of samples lost before them, or
+            None if there was no data
+            """
+            # hold the device for the whole command and read so a cancel's reset can not go
+            # between them, and do not start a read after the run was cancelled
+            with self.device.io_lock:
+                if not self.running:
+                    return None
+                return self._read_packet()
+
+        def _read_packet(self):
+            get = self.device.usb_read_message()
+            if not get:
+                return None
+            logging.debug("getting channel: %s", get[4])
+            self.device.send_command('export_amp', int(get[4]))
+            usb_input = self.device.get_data(self.number_packets)
+            # dump the first read of the USB incase it is garbate
+            # TODO: Check this is still needed
+            if not self.first_read_dumbed:
+                self.first_read_dumbed = True
+                return None
+            if not usb_input:
+                return None
+            # data points plus the termination code, 2 bytes each
+            backlog = self.device.bytes_waiting() // (2 * (self.data_packet_size + 1))
+            self.sizer.packet_received(len(usb_input), backlog)
+            return usb_input, self.device.take_lost_samples()
+
+        def convert_packet(self, packet):
+            """ Convert a packet to currents and make the time of each, runs in the pipeline's
+            convert thread
+            :param packet: tuple returned by read_packet
+            :return: tuple of the list of times and list of currents
+            """
+            usb_input, lost_samples = packet
+            data = self.device.process_data(usb_input)
+            # skip the time of any framed packets that were lost so the times stay right
+            self.t_ptr += lost_samples * self.time_step
+            times = [x * self.time_step + self.t_ptr for x in range(1, len(data) + 1)]
+            self.t_ptr += len(data) * self.time_step
+            return times, data
 
         def cancel_run(self):
             self.running = False
             if self._reader:
                 self.master.after_cancel(self._reader)
+            if self.pipeline:
+                # only wait a short time for the threads, the io_lock below keeps a read that
+                # is still going from being mixed with the reset
+                self.pipeline.stop(CANCEL_STOP_TIMEOUT)
+                # keep the packets converted before the cancel
+                self.show_packets(self.pipeline.drain())
             self.device.samples_to_smooth = self.device_samples_smooth
             self._reader = None
-            self.device.usb_write('X')
-            self.device.clear_in_buffer()
+            with self.device.io_lock:
+                self.device.send_command('reset')
+                self.device.clear_in_buffer()
             self.first_read_dumbed = False
 
         def set_sample_rate(self, rate):
@@ -238,14 +394,15 @@ class AmpFrame(ttk.Frame):
             PWM timer period register
             :param rate: the sampling rate desired (in kHz)
             """
-            formatted_period, self.pwm_timer_period_amp = self.format_period(rate)
-            self.device.usb_write('T|' + formatted_period)
+            self.pwm_timer_period_amp = self.format_period(rate)
+            self.device.send_state('pwm_period',
+                                   self.device.command('pwm_period', self.pwm_timer_period_amp))
             self.device.device_params.PWM_period = self.pwm_timer_period_amp
 
         def set_voltage(self, voltage):
-            self.device.device_params.amp_settings.voltage = voltage
-            formatted_voltage = self.format_voltage(voltage)
-            self.device.usb_write('D|' + formatted_voltage)
+            amp_settings = self.device.device_params.amp_settings
+            amp_settings.update_settings(voltage, amp_settings.sampling_rate)
+            self.device.send_command('anode_voltage', self.format_voltage(voltage))
 
         def set_adc_tia(self, *args):
             self.device.set_adc_tia(*args)
@@ -254,19 +411,17 @@ class AmpFrame(ttk.Frame):
             """ Take the users desired sampling rate and convert it to the number to put in the
             PWM used to time the interrupts.
             :param rate: int (kHz) sampling rate the user desires in kHz
-            :return:  the int to put in the PWM period register, padded with 0's as the device
-            requires
+            :return:  the int to put in the PWM period register
             """
             clk_freq = self.device.device_params.clk_freq_isr_pwm
             # user entered kHz value so convert to Hz
             raw_divider = int(round(clk_freq / (rate))) - 1  # PWM is 0 indexed
-            return '{0:05d}'.format(raw_divider), raw_divider
+            return raw_divider
 
         def format_voltage(self, in_voltage):
             input_voltage = self.device.device_params.virtual_ground_shift - in_voltage  # mV
 
-            dac_value = self.device.device_params.dac.get_dac_count(input_voltage)
-            return '{0:04d}'.format(dac_value)
+            return self.device.device_params.dac.get_dac_count(input_voltage)
 
     class AmpSettingsDisplay(tk.Frame):
 
@@ -321,19 +476,6 @@ class AmpFrame(ttk.Frame):
             change_toplevel.AmpSettingsChanges(self, self.master, self.graph, self.device)
 
 
-def check_display_type():
-    """ Check if matplotlib graph can be used,
-    :return: type that can be used to make display graph, matplotlib or canvas as a string
-    """
-    try:
-        import matplotlib
-        import matplotlib.pyplot
-        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-        return "matplotlib"
-    except ImportError:
-        return "canvas"
-
-
 def open_file(_type):
     """ Make a method to return an open file or a file name depending on the type asked for
     :param _type: what type of file dialog to use
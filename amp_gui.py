@@ -3,30 +3,46 @@
 
 """ Graphical user interface to control PSoC electrochemical device main file
 """
+# time the imports if asked to, this has to be before the other imports so they are timed
+import startup_profile
+startup_profile.install_if_requested()
 # standard libraries
-import csv
 import ctypes
+import importlib
 import time
 import logging
 import os
+import sqlite3
 import sys
 import tkinter.font
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk
 # local files
-import amp_frame
-import asv_frame
 import change_toplevel as change_top
 import cv_frame
+import experiment_catalog
 import graph_properties
 import option_menu
 import properties
+import pyplot_data_class as data_class
+import session_file
+import tkinter_pyplot
 import usb_comm
 
 __author__ = 'Kyle Vitautas Lopin'
 
 OPTIONS_BACKGROUND = 'LightCyan4'
+# the frame for each technique is only made, and its module imported, when its tab is
+# first shown: (name, module, class, tab text)
+TECHNIQUE_TABS = [('cv', 'cv_frame', 'CVFrame', "Cyclic Voltammetry"),
+                  ('amp', 'amp_frame', 'AmpFrame', "Amperometry"),
+                  ('asv', 'asv_frame', 'ASVFrame', "Anode Stripping Voltammetry"),
+                  ('chrono', 'chrono_frame', 'ChronoFrame', "Chronoamperometry")]
+# technique of the runs in a session file: frame name
+SESSION_FRAMES = {'CV': 'cv', 'ASV': 'asv', 'amp': 'amp', 'chrono': 'chrono'}
+SINGLE_RUN_TECHNIQUES = ('amp', 'chrono')  # the frames of these only show one run
+SESSION_RUNS_SHOWN = 20  # CV or ASV runs shown when a session is opened, the rest on request
 logging.getLogger('PIL').setLevel(logging.WARNING)
 
 try:  # works for windows 8.1 and newer
@@ -51,7 +67,7 @@ class ElectroChemGUI(tk.Tk):
 
         self.data_save_type = "Converted"
         self.device_params = properties.DeviceParameters()
-        self.display_type = check_display_type()
+        self.display_type = tkinter_pyplot.check_display_type()
         tk.Tk.__init__(self, parent)
         self.parent = parent
         self.voltage_source_label = tk.StringVar()
@@ -60,19 +76,21 @@ class ElectroChemGUI(tk.Tk):
         # device starts in 3 electrode config
         self.electrode_config_label.set("3 electrode configuration")
         self.device = usb_comm.AmpUsb(self, self.device_params)
-        graph_props = graph_properties.GraphProps()
+        self.catalog = experiment_catalog.ExperimentCatalog()
+        self.session = None  # session_file.SessionFile the runs shown were opened from
+        self.graph_props = graph_properties.GraphProps()
         # frame to put the connection button, graph toolbar and label for VDAC source
         self.frames = self.make_bottom_frames()
 
-        # Make Notebooks to separate the CV and amperometry methods
+        # Make Notebooks to separate the CV and amperometry methods, each tab starts with an
+        # empty frame that is replaced by the technique's frame when the tab is first shown
         self.notebook = ttk.Notebook(self)
-        self.cv = cv_frame.CVFrame(self, self.notebook, graph_props)
-        self.amp = amp_frame.AmpFrame(self, self.notebook, graph_props)
-        self.asv = asv_frame.ASVFrame(self, self.notebook, graph_props)
-
-        self.notebook.add(self.cv, text="Cyclic Voltammetry")
-        self.notebook.add(self.amp, text="Amperometry")
-        self.notebook.add(self.asv, text="Anode Stripping Voltammetry")
+        self.technique_frames = {}  # name from TECHNIQUE_TABS: frames made so far
+        self._making_frame = False
+        for _, _, _, text in TECHNIQUE_TABS:
+            self.notebook.add(ttk.Frame(self.notebook), text=text)
+        self.get_frame('cv')  # the first tab is shown when the program starts
+        self.notebook.bind("<<NotebookTabChanged>>", self.tab_changed)
 
         self.notebook.pack(side='top', expand=True, fill=tk.BOTH)
         tk.Label(self.frames[2], textvariable=self.voltage_source_label, font=("Bookman", 10)
@@ -85,6 +103,50 @@ class ElectroChemGUI(tk.Tk):
         self.connect_button.pack(side='bottom')
         option_menu.OptionMenu(self)
 
+    @property
+    def cv(self):
+        return self.get_frame('cv')
+
+    @property
+    def amp(self):
+        return self.get_frame('amp')
+
+    @property
+    def asv(self):
+        return self.get_frame('asv')
+
+    def tab_changed(self, event=None):
+        """ Make the frame of the tab the user selected if it has not been made yet """
+        if self._making_frame:
+            return
+        index = self.notebook.index(self.notebook.select())
+        self.get_frame(TECHNIQUE_TABS[index][0])
+
+    def get_frame(self, name):
+        """ Get the frame for a technique, importing its module and making it the first time
+        :param name: str - 'cv', 'amp', 'asv' or 'chrono'
+        :return: the technique's frame
+        """
+        if name in self.technique_frames:
+            return self.technique_frames[name]
+        index = [tab[0] for tab in TECHNIQUE_TABS].index(name)
+        _, module_name, class_name, text = TECHNIQUE_TABS[index]
+        self._making_frame = True  # ignore the tab changes made while swapping the frames
+        try:
+            module = importlib.import_module(module_name)
+            frame = getattr(module, class_name)(self, self.notebook, self.graph_props)
+            placeholder = self.notebook.tabs()[index]
+            was_selected = self.notebook.select() == placeholder
+            self.notebook.insert(index, frame, text=text)
+            if was_selected:
+                self.notebook.select(frame)
+            self.notebook.forget(placeholder)
+        finally:
+            self._making_frame = False
+        self.technique_frames[name] = frame
+        startup_profile.report("making the {0} tab".format(text))
+        return frame
+
     def set_data_type(self, _type):
         """ Developer option to have the device not convert the incoming data and just report and
         save the raw numbers
@@ -117,33 +179,112 @@ class ElectroChemGUI(tk.Tk):
         self.voltage_source_label.set(message)
 
     def update_current_range(self, _value, current_limit):
-        self.cv.set_tia_current_lim(_value, current_limit)
-        self.amp.set_tia_current_lim(_value, current_limit)
-        self.asv.set_tia_current_lim(_value, current_limit)
+        # frames that have not been made yet get the current range when they are made
+        for frame in self.technique_frames.values():
+            frame.set_tia_current_lim(_value, current_limit)
 
     def open_data(self):
         """ Open a csv file that has the data saved in it, in the same format as this program
-        saves the data.  Check what type of
-        NOTE:
-        _data_hold - holds the data as its being pulled from the file with the structure
-        _data_hold = [ [x-data-array], [y1-data-array], [y2-data-array], .., [yn-data] ]
+        saves the data.  Check what type of data is in the file and send it to the frame for
+        that technique
         """
         logging.debug("opening data")
         _file_name = cv_frame.open_file('open')  # get a filename
         # Confirm that the user supplied a file
         if _file_name:
-
             logging.debug("a file named %s opened", _file_name)
-            with open(_file_name, 'rb') as _file:
-                _reader = csv.reader(_file)  # create reader from file
-
-                first_array = _reader.next()  # get the first line that has the data labels
-
-                # figure out what type of data was opened
-                if first_array[0] == 'voltage':
-                    # this is a cyclic voltammetry data
-                    self.cv.open_data(_reader, first_array)
-            _file.close()
+            if _file_name.endswith(session_file.SESSION_EXTENSION):
+                self.open_session(_file_name)
+                return
+            try:
+                saved_data = data_class.read_csv_data(_file_name)
+            except (ValueError, OSError) as error:
+                logging.error("could not open %s: %s", _file_name, error)
+                return
+            # figure out what type of data was opened
+            if saved_data['type'] == 'cv':
+                self.cv.open_data(saved_data)
+            elif saved_data['type'] == 'amp':
+                self.amp.open_data(saved_data)
+
+    def save_session(self):
+        """ Save the data of every technique, with the settings used for each run, in one
+        session file
+        """
+        runs = []
+        for frame in self.technique_frames.values():
+            runs.extend(frame.session_runs())
+        if self.session:  # keep the runs of the opened session that were not shown
+            runs.extend(self.session.copy_runs(self.session.unloaded_indexes()))
+        if not runs:
+            logging.info("No data to save")
+            return
+        _file_name = cv_frame.open_file('save_session')
+        if _file_name:
+            if self.session and os.path.abspath(_file_name) == os.path.abspath(
+                    self.session.filename):
+                self.close_session()  # its runs were copied, release the file to write it
+            session_file.save_session(_file_name, runs)
+            self.catalog_runs(_file_name, 'session', runs)
+
+    def catalog_runs(self, _file_name, file_type, runs):
+        """ Add runs that were saved to the experiment catalog, a catalog error is logged so
+        it does not stop the data from being saved
+        :param _file_name: name of the file the runs were saved to
+        :param file_type: str - 'csv' or 'session'
+        :param runs: list of dicts with the 'technique', 'label', 'notes' and 'run_info' of
+        each run, in the order they are in the file
+        """
+        try:
+            self.catalog.add_runs(_file_name, file_type, runs)
+        except sqlite3.Error as error:
+            logging.error("could not add %s to the catalog: %s", _file_name, error)
+
+    def open_session(self, _file_name):
+        """ Open a session file and show the first runs of each technique in the frame for
+        that technique.  The file stays memory mapped so only the runs shown are read, the
+        others are opened with select_session_runs
+        :param _file_name: name of the session file
+        """
+        try:
+            session = session_file.SessionFile(_file_name)
+        except (ValueError, OSError) as error:
+            logging.error("could not open %s: %s", _file_name, error)
+            return
+        self.close_session()
+        self.session = session
+        for technique in SESSION_FRAMES:
+            shown = 1 if technique in SINGLE_RUN_TECHNIQUES else SESSION_RUNS_SHOWN
+            self.open_session_runs(session.unloaded_indexes(technique)[:shown])
+        if session.unloaded_indexes():
+            logging.info("%i runs of %s not shown, open them from the Data menu",
+                         len(session.unloaded_indexes()), _file_name)
+
+    def open_session_runs(self, indexes):
+        """ Show runs of the opened session in the frames of their techniques, only the last
+        run is shown for the techniques that show one run
+        :param indexes: list of the index of the runs in the session
+        """
+        for technique, name in SESSION_FRAMES.items():
+            runs = [i for i in indexes if self.session.runs[i]['technique'] == technique]
+            if runs and technique in SINGLE_RUN_TECHNIQUES:
+                runs = runs[-1:]
+            if runs:
+                # the frames copy the runs out of the memory map
+                self.get_frame(name).open_data(self.session.load_runs(technique, runs))
+
+    def select_session_runs(self):
+        """ Let the user pick runs of the opened session that are not shown yet """
+        if not self.session or not self.session.unloaded_indexes():
+            logging.info("No more session runs to open")
+            return
+        change_top.SessionRunSelect(self, self.session)
+
+    def close_session(self):
+        """ Close the opened session, the runs already shown are kept """
+        if self.session:
+            self.session.close()
+            self.session = None
 
     def user_select_delete_some_data(self):
         change_top.UserSelectDataDelete(self)
@@ -213,43 +354,28 @@ class ElectroChemGUI(tk.Tk):
 
 def destroyer():
     # app.quit()
+    app.device_params.settings_store.close()  # save any settings changes still waiting
+    app.close_session()
     app.destroy()
     sys.exit()
 
 
 def get_data_from_csv_file(_filename):
-    with open(_filename, 'rb') as _file:
-        _reader = csv.reader(_file)  # create reader from file
-
-        first_array = _reader.next()  # get the first line that has the data labels
-        _data_hold = []  # create a list to hold the data
-        # Make lists to hold the voltage and data arrays
-        for i in range(len(first_array)):  # make as many list as there columns in the csv file
-            _data_hold.append([])
-
-        for row in _reader:
-            for i, data in enumerate(row):
-                _data_hold[i].append(float(data))
-    _file.close()
-    return _data_hold
-
-
-def check_display_type():
-    """ Check if matplotlib graph can be used,
-    :return: type that can be used to make display graph, matplotlib or canvas as a string
+    """ Get the columns of a saved data file
+    :param _filename: name of the file to open
+    :return: list of arrays, [x-data-array, y1-data-array, y2-data-array, .., yn-data]
     """
-    try:
-        import matplotlib
-        import matplotlib.pyplot as plt
-        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-        return "matplotlib"
-    except ImportError as e:
-        return "canvas"
+    saved_data = data_class.read_csv_data(_filename)
+    if not saved_data['x']:
+        return []
+    return [saved_data['x'][0]] + saved_data['y']
+
 
 if __name__ == '__main__':
     app = ElectroChemGUI()
     app.protocol("WM_DELETE_WINDOW", destroyer)
     app.title("Amperometry Device")
     app.geometry("950x600")
+    app.after_idle(startup_profile.report)
     app.mainloop()
 
@@ -6,12 +6,16 @@ voltammetry experiments
 """
 # standard libraries
 import logging
+import math
 import time
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk
 # local files
+import acquisition_pipeline
+import asv_sequencer
 import change_toplevel as change_top
+import data_trace
 import cv_frame
 import properties  # type hinting
 import pyplot_data_class as data_class
@@ -22,6 +26,9 @@ __author__ = 'Kyle Vitautas Lopin'
 OPTIONS_BACKGROUND = 'lightsteelblue'
 
 COMPLETE_MESSAGE = "Done"
+SEQUENCER_POLL = 50  # ms between checks if the ASV phases are done
+TIMER_UPDATE = 200  # ms between updates of the time left
+PHASE_LABELS = {'clean': "Cleaning", 'plate': "Plating", 'strip': "Stripping"}
 USB_IN_BYTE_SIZE = 64
 
 
@@ -29,6 +36,7 @@ class ASVFrame(cv_frame.CVFrame):
     """ Frame to hold all the widgets and information to perform anode stripping
     voltammetry experiments
     """
+    technique = "ASV"  # what the runs are saved as
 
     def __init__(self, *args):
         cv_frame.CVFrame.__init__(self, *args, bg=OPTIONS_BACKGROUND, initialize=False)
@@ -78,30 +86,27 @@ class ASVFrame(cv_frame.CVFrame):
             # TODO: bind this in the begining
             self.run_button = None  # placeholder, the first run will assign it
             self.after_function = None
+            self.sequencer = None  # asv_sequencer.ASVSequencer of the run
 
         def send_cv_parameters(self):
             # TODO: send the commands to run a linear sweep at the end of the asv
             logging.debug("sending asv params here")
             # DEPRICATE THE NEXT 3 STATEMENTS
-            formatted_start_volt, start_dac_value = \
-                self.format_voltage_with_gnd(self.settings.low_voltage)
-            formatted_end_volt, end_dac_value = \
-                self.format_voltage_with_gnd(self.settings.high_voltage)
-            formatted_freq_divider, pwm_period = \
-                self.format_divider(self.settings.sweep_rate)
+            start_dac_value = self.format_voltage_with_gnd(self.settings.low_voltage)
+            end_dac_value = self.format_voltage_with_gnd(self.settings.high_voltage)
+            pwm_period = self.format_divider(self.settings.sweep_rate)
 
             self.params.PWM_period = pwm_period
 
             sweep_type_to_send = self.settings.sweep_type
 
             if sweep_type_to_send == 'LS':
-                print("sending linear sweep")
+                logging.debug("sending linear sweep")
                 # send those values to the device in the proper format for the PSoC amperometry device
-                to_amp_device = '|'.join(["S", formatted_start_volt,
-                                          formatted_end_volt, formatted_freq_divider,
-                                          sweep_type_to_send])
+                to_amp_device = self.device.command('cv_sweep', start_dac_value, end_dac_value,
+                                                    pwm_period, sweep_type_to_send)
             elif sweep_type_to_send == 'DPV':  # DPV
-                print("Sending DPV settings")
+                logging.debug("Sending DPV settings")
                 # The pulse period depends on step width not scan rate
 
                 # self.params.PWM_period = int(self.settings.pulse_width / 2)
@@ -110,16 +115,12 @@ class ASVFrame(cv_frame.CVFrame):
                 self.params.PWM_period = int((self.settings.pulse_width * self.params.clk_freq_isr_pwm
                                               / 1000) / 2) - 1
                 pwm_period = self.params.PWM_period
-                print("DPV timer: ", self.params.PWM_period)
+                logging.debug("DPV timer: %s", self.params.PWM_period)
                 pulse_height = int(self.settings.pulse_height / self.params.dac.voltage_step_size)
                 pulse_increment = int(self.settings.pulse_inc / self.params.dac.voltage_step_size)
-
-                # to_amp_device = '|'.join(["G", formatted_start_volt,
-                #                           formatted_end_volt, formatted_freq_divider,
-                #                           sweep_type_to_send])
-                to_amp_device = "G|{0}|{1}|{2:03d}|{3:03d}|{4:05d}" \
-                                "".format(formatted_start_volt, formatted_end_volt,
-                                          pulse_height, pulse_increment, self.params.PWM_period)
+                to_amp_device = self.device.command('dpv_sweep', start_dac_value, end_dac_value,
+                                                    pulse_height, pulse_increment,
+                                                    self.params.PWM_period)
             else:
                 raise ValueError("Unknown sweep type for ASV: {0}| Use LS or DPV"
                                  "".format(sweep_type_to_send))
@@ -132,8 +133,8 @@ class ASVFrame(cv_frame.CVFrame):
             # calculate what the actual voltage the device will make.  This might be slightly
             # different from the user input because of the VDAC's resolution
 
-            self.device.usb_write(to_amp_device)
-            time.sleep(0.01)
+            if self.device.send_state('lut', to_amp_device):
+                time.sleep(0.01)
             # Write to the timing PWM compare register so the dac adc timing is correct
             compare_value = pwm_period / 2
 
@@ -143,114 +144,130 @@ class ASVFrame(cv_frame.CVFrame):
             self.device.set_adc_tia(*args)
 
         def asv_run(self, graph, run_button):
-
-            TimerToplevel(self.master, self.params.asv_settings.clean_time, self.params.asv_settings.plate_time)
-            # TODO;  when button is pressed have it run an ASV protocol
-            # Set the device working electrode to the cleaning voltage
-            self.device.start_hardware()
-
+            """ Run the clean, plate and strip phases of an ASV protocol, the phases are run by
+            an asv_sequencer.ASVSequencer in a thread so their timing does not depend on the
+            tkinter thread
+            """
             if not self.run_button:
                 self.run_button = run_button
 
             self.run_button.config(text="Stop ASV", command=self.stop, relief=tk.SUNKEN)
-
-            # short the tia resistor so the working electrode can sink more current
-            self.device.short_tia_resistor()
-
-            # DEBUGGING
-            print(self.params)
-            print(dir(self.params))
-
-            # Tell the device to hold the Anode at the cleaning voltage
-            self.device.set_anode_voltage(self.params.asv_settings.clean_volt)
-
-            # set an after method
-            self.after_function = self.master.after(int(self.params.asv_settings.clean_time * 1000),
-                                                    self.change_to_plating_voltage)
-
-        def change_to_plating_voltage(self):
-            self.device.set_anode_voltage(self.params.asv_settings.plate_volt)
-
-            self.after_function = self.master.after(int(self.params.asv_settings.plate_time * 1000),
-                                                    self.give_stripping_step)
-
-        def give_stripping_step(self):
-            self.device.stop_shorting_tia_resistor()
-            time.sleep(0.005)
-            self.send_cv_parameters()
-            time.sleep(0.005)
-            delay_time = self.params.asv_settings.delay_time
-            self.run_scan(delay_time)
-
-            self.device.last_experiment = "ASV"  # Let the device know the look up table will
-            # be for an ASV run in case they want to run a CV later
-
-        def run_scan(self, delay):
-            self.run_button.config(state='disabled')
-            self.device.usb_write('R')
-            if self.device.working:
-                logging.debug("device reading")
-                print('delay: ', int(delay))
-                self.master.after(int(delay), lambda: self.run_scan_continue())
-            else:
-                logging.debug("Couldn't find out endpoint to send message to run")
+            self.sequencer = asv_sequencer.ASVSequencer(
+                asv_sequencer.make_phases(self.device, self.params.asv_settings,
+                                          self.send_cv_parameters))
+            TimerToplevel(self.master, self.sequencer)
+            self.sequencer.start()
+            self.after_function = self.master.after(SEQUENCER_POLL, self.check_sequencer)
+
+        def check_sequencer(self):
+            """ Wait for the sequencer to finish the strip and then get the data """
+            if not self.sequencer.finished:
+                self.after_function = self.master.after(SEQUENCER_POLL, self.check_sequencer)
+                return
+            self.after_function = None
+            self.sequencer.report()
+            if self.sequencer.cancelled:  # stopped by the user or a command failed
+                if self.sequencer.error is not None:
+                    logging.error("ASV run stopped, the %s phase failed: %s",
+                                  self.sequencer.failed_phase, self.sequencer.error)
+                self.end_run()
+                return
+            self.device.set_last_run("ASV")
+            self.run_scan_continue()
 
         def run_scan_continue(self, fails=0):
+            """ Check if the device is done and get the data, read_scan is run in a background
+            thread so the program does not freeze while the data is read
+            :param fails: int, running count of how many attempts have been tried
+            """
+            acquisition_pipeline.run_in_background(self.master, self.read_scan,
+                                                   lambda scan: self.show_scan(scan, fails))
 
-            check_message = self.device.usb_read_message()  # step 3
-            print('check message: ', check_message)
-
-            if check_message == COMPLETE_MESSAGE:
-                self.get_and_display_data()
-            else:
-                logging.error("Error reading ASV")
-                if fails > 5:
-                    self.master.after(500, lambda: self.run_scan_continue(fails + 1))
+        def show_scan(self, scan, fails):
+            """ Display the data read_scan got, or try again if the device was not done
+            :param scan: what read_scan returned
+            :param fails: int, running count of how many attempts have been tried
+            """
+            if scan is not None:
+                self.display_data(*scan)
+                return
+            logging.error("Error reading ASV")
+            if fails < 5:
+                self.master.after(500, lambda: self.run_scan_continue(fails + 1))
 
         def get_and_display_data(self):
-            self.device.usb_write('E0')
+            self.display_data(*self.read_data())
+
+        def read_data(self, _channel=0):
+            """ Get the data of a scan from the device and convert it to currents
+            :param _channel: which adc channel to read
+            :return: tuple of the raw adc counts and the currents, the currents are None if no
+            data was read
+            """
+            self.device.send_command('export', _channel)
             raw_data = self.device.get_data(self.usb_packet_count)
-            raw_data.pop(0)
-            self.run_button.config(state='active')
+            if raw_data:
+                raw_data.pop(0)
             if not raw_data:  # if something is wrong just return
-                return
-
+                return raw_data, None
             # call function to convert the raw ADC values into the current that passed
             # through the working electrode
-            self.data = self.device.process_data(raw_data)  # bind data to cv_frame master
+            return raw_data, self.device.process_data(raw_data)
 
-            print("get and display data: ", self.params.asv_settings.sweep_type)
+        def display_data(self, raw_data, data):
+            """ Display the data of a scan
+            :param raw_data: list of the adc counts read
+            :param data: list of the currents
+            """
+            self.run_button.config(state='active')
+            if not raw_data:  # if something is wrong just return
+                return
+            self.data = data  # bind data to cv_frame master
+
+            data_trace.event(data_trace.DEBUG, "asv read", "%s points of %s sweep",
+                             len(raw_data), self.params.asv_settings.sweep_type)
             if self.params.asv_settings.sweep_type == "DPV":
                 # hack the data
-                print(self.data)
                 index = 0
                 new_data = []
                 while index <= len(self.data) - 2:
                     new_data.append(self.data[index] - self.data[index + 1])
                     # print("index = ", index, len(self.data))
                     index += 2
-                print('new data: ', new_data)
                 self.data = new_data
 
             # make the voltages for the x-axis that correspond to the currents read
-            print('make x line: ', self.params.asv_settings.pulse_inc)
             x_line = cv_frame.make_x_line(self.params.asv_settings.low_voltage,
                                           self.params.asv_settings.high_voltage,
                                           self.params.dac.voltage_step_size,
                                           self.params.asv_settings.sweep_type,
                                           self.params.asv_settings.sweep_start_type,
                                           self.params.asv_settings.pulse_inc)
-            self.graph.update_data(x_line, self.data, raw_data)  # send raw data for testing purposes
+            self.graph.update_data(x_line, self.data, raw_data,  # send raw data for testing purposes
+                                   run_info=self.params.run_info("ASV"))
             self.run_button.config(text="Run ASV",
                                    command=lambda: self.asv_run(self.graph, self.run_button),
                                    relief=tk.RAISED)
 
         def stop(self):
-            # tell the device to stop
+            """ Stop the run, if the sequencer is in the middle of a phase it is only told to
+            stop and check_sequencer ends the run when the phase is done, so the tkinter thread
+            does not wait on it
+            """
+            if self.sequencer and not self.sequencer.finished:
+                self.run_button.config(state=tk.DISABLED)
+                self.sequencer.stop()
+                return
+            if self.after_function:
+                self.master.after_cancel(self.after_function)
+                self.after_function = None
+            self.end_run()
+
+        def end_run(self):
+            """ Put the run button back and tell the device to stop """
             self.run_button.config(text="Run ASV",
                                    command=lambda: self.asv_run(self.graph, self.run_button),
-                                   relief=tk.RAISED)
-            self.master.after_cancel(self.after_function)
+                                   relief=tk.RAISED, state=tk.NORMAL)
             self.device.reset()
 
     class CVSettingDisplay(tk.Frame):
@@ -316,35 +333,40 @@ class ASVFrame(cv_frame.CVFrame):
 
 
 class TimerToplevel(tk.Toplevel):
-    def __init__(self, master, clean_time, plate_time):
+    """ Show the time left in each phase of an ASV run, the times are read from the sequencer's
+    clock so they do not drift """
+    def __init__(self, master, sequencer):
+        """
+        :param master: tkinter parent of the window
+        :param sequencer: asv_sequencer.ASVSequencer running the phases
+        """
         tk.Toplevel.__init__(self, master)
         self.transient(master)
         self.geometry("300x300")
         tk.Label(self, text="toplevel").pack()
 
-        self.clean_time = clean_time
-        self.plate_time = plate_time
-        self.type = 'clean'
-        self.toplabel = tk.Label(self, text="Cleaning time left: {0}".format(clean_time))
+        self.sequencer = sequencer
+        self.toplabel = tk.Label(self, text="Cleaning time left: {0}".format(
+            math.ceil(sequencer.phases[0].duration)))
         self.toplabel.pack()
-        self.bottomlabel = tk.Label(self, text="Total time left: {0}".format(plate_time + clean_time))
+        self.bottomlabel = tk.Label(self, text="Total time left: {0}".format(
+            math.ceil(sequencer.total_time)))
         self.bottomlabel.pack()
-        self.after(1000, self.run)
+        self.after(TIMER_UPDATE, self.run)
 
     def run(self):
-        if self.type == 'clean':
-            self.clean_time -= 1
-
-            if self.clean_time <= 0:
-                self.type = 'plate'
-                self.toplabel.config(text="Plating time left: {0}".format(self.plate_time))
-            else:
-                self.toplabel.config(text="Cleaning time left: {0}".format(self.clean_time))
-
-        elif self.type == 'plate':
-            self.plate_time -= 1
-            self.toplabel.config(text="Plating time left: {0}".format(self.plate_time))
-
-        self.bottomlabel.config(text="Total time left: {0}".format(self.plate_time + self.clean_time))
-        if self.plate_time > 0:
-            self.after(1000, self.run)
+        if self.sequencer.finished:
+            if self.sequencer.error is None:
+                self.destroy()
+                return
+            # leave the window up to show the user why the run stopped
+            self.toplabel.config(text="{0} failed".format(
+                PHASE_LABELS.get(self.sequencer.failed_phase, self.sequencer.failed_phase)))
+            self.bottomlabel.config(text=str(self.sequencer.error))
+            return
+        phase, phase_left, total_left = self.sequencer.status()
+        if phase:
+            self.toplabel.config(text="{0} time left: {1}".format(
+                PHASE_LABELS.get(phase, phase), math.ceil(phase_left)))
+            self.bottomlabel.config(text="Total time left: {0}".format(math.ceil(total_left)))
+        self.after(TIMER_UPDATE, self.run)
@@ -0,0 +1,197 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Run the phases of an anode stripping voltammetry protocol (clean, plate and strip) on a
+schedule kept with a monotonic clock, in a thread so the tkinter thread being busy can not
+change how long a phase lasts.
+
+Each phase ends at the time its planned offset from the start of the run says, not a set time
+after the last phase started, so any lateness in starting a phase is not added to the run.
+The time each phase actually started is recorded so the real phase times can be reported.
+
+A device that lists DEVICE_PROGRAM_CAPABILITY in its reply to the identify command can be sent
+the whole clean and plate program at once and times it itself, see make_phases; the host then
+only follows along to show the time left.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import collections
+import logging
+import threading
+import time
+
+DEVICE_PROGRAM_CAPABILITY = b"ASV1"
+SWITCH_SETTLE_TIME = 0.005  # seconds to let the TIA switch settle before the strip is loaded
+
+# name: str, duration: seconds, action: function run at the start of the phase or None
+Phase = collections.namedtuple('Phase', ['name', 'duration', 'action'])
+# name: str, planned: seconds after the start the phase should start, actual: when it did
+Transition = collections.namedtuple('Transition', ['name', 'planned', 'actual'])
+
+
+class ASVSequencer(object):
+    """ Run a list of Phases in a thread on a fixed schedule """
+    def __init__(self, phases, clock=time.monotonic):
+        """
+        :param phases: list of Phase to run in order
+        :param clock: function that gives the time in seconds, must never go backwards
+        """
+        self.phases = list(phases)
+        self.clock = clock
+        self.transitions = []
+        self.start_time = None
+        self.end_time = None
+        self.error = None  # exception raised by a phase's action
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        self._thread = None
+
+    @property
+    def total_time(self):
+        return sum(phase.duration for phase in self.phases)
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    @property
+    def cancelled(self):
+        return self._stop.is_set()
+
+    @property
+    def failed_phase(self):
+        """ Name of the phase whose action raised self.error, or None """
+        if self.error is None or not self.transitions:
+            return None
+        return self.transitions[-1].name
+
+    def start(self):
+        """ Start running the phases """
+        self._thread = threading.Thread(target=self._run, daemon=True, name="asv-sequencer")
+        self._thread.start()
+
+    def stop(self):
+        """ Stop before the next phase, a phase's action that has started is finished first.
+        This does not wait for the thread, check finished or call wait to know when it is done
+        """
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """ Wait for the phases to finish
+        :return: True if they finished
+        """
+        return self._finished.wait(timeout)
+
+    def status(self):
+        """ Get what phase is running and how long is left, from the clock so it does not drift
+        :return: tuple of the name of the phase, seconds left in it and seconds left in the run,
+        the name is None before the start and after the end
+        """
+        if self.start_time is None or self.finished:
+            return None, 0.0, 0.0
+        elapsed = self.clock() - self.start_time
+        phase_end = 0.0
+        for phase in self.phases:
+            phase_end += phase.duration
+            if elapsed < phase_end:
+                return phase.name, phase_end - elapsed, self.total_time - elapsed
+        return self.phases[-1].name, 0.0, 0.0
+
+    def durations(self):
+        """ Get how long each phase that ran really lasted
+        :return: dict of phase name: seconds
+        """
+        times = {}
+        for i, transition in enumerate(self.transitions):
+            if i + 1 < len(self.transitions):
+                end = self.transitions[i + 1].actual
+            elif self.end_time is not None:
+                end = self.end_time - self.start_time
+            else:
+                continue
+            times[transition.name] = end - transition.actual
+        return times
+
+    def report(self):
+        """ Log the planned and real time of each phase
+        :return: list of the lines logged
+        """
+        planned = {phase.name: phase.duration for phase in self.phases}
+        lines = []
+        for name, duration in self.durations().items():
+            lines.append("ASV {0}: {1:.3f} s, planned {2:.3f} s".format(name, duration,
+                                                                      planned[name]))
+        for line in lines:
+            logging.info(line)
+        return lines
+
+    def _run(self):
+        self.start_time = self.clock()
+        offset = 0.0  # planned start of the phase, in seconds from the start
+        try:
+            for phase in self.phases:
+                if self._stop.is_set():
+                    break
+                self.transitions.append(Transition(phase.name, offset,
+                                                   self.clock() - self.start_time))
+                if phase.action:
+                    phase.action()
+                offset += phase.duration
+                # wait until the planned end, the wait can return early so check the clock
+                while not self._stop.is_set():
+                    remaining = self.start_time + offset - self.clock()
+                    if remaining <= 0:
+                        break
+                    self._stop.wait(remaining)
+        except Exception as error:
+            logging.error("ASV phase failed: %s", error)
+            self.error = error
+            self._stop.set()
+        finally:
+            self.end_time = self.clock()
+            self._finished.set()
+
+
+def make_phases(device, settings, send_strip_parameters):
+    """ Make the phases of an ASV run
+    :param device: usb_comm.AmpUsb to send the commands with
+    :param settings: properties.ASVSettings of the run
+    :param send_strip_parameters: function that loads the stripping sweep into the device
+    :return: list of Phase
+    """
+    strip_time = settings.delay_time / 1000.0
+    if device.has_capability(DEVICE_PROGRAM_CAPABILITY):
+        def send_program():
+            # the device switches the TIA, times the clean and plate and runs the strip itself
+            send_strip_parameters()
+            device.send_command('asv_program',
+                                device.device_params.dac.get_dac_count(settings.clean_volt,
+                                                                       actual=True),
+                                int(round(settings.clean_time * 1000)),
+                                device.device_params.dac.get_dac_count(settings.plate_volt,
+                                                                       actual=True),
+                                int(round(settings.plate_time * 1000)))
+        return [Phase('clean', settings.clean_time, send_program),
+                Phase('plate', settings.plate_time, None),
+                Phase('strip', strip_time, None)]
+
+    def clean():
+        device.start_hardware()
+        # short the tia resistor so the working electrode can sink more current
+        device.short_tia_resistor()
+        device.set_anode_voltage(settings.clean_volt)
+
+    def plate():
+        device.set_anode_voltage(settings.plate_volt)
+
+    def strip():
+        device.stop_shorting_tia_resistor()
+        time.sleep(SWITCH_SETTLE_TIME)
+        send_strip_parameters()
+        device.send_command('run')
+
+    return [Phase('clean', settings.clean_time, clean),
+            Phase('plate', settings.plate_time, plate),
+            Phase('strip', strip_time, strip)]
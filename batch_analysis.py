@@ -0,0 +1,305 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Re-analyze many saved csv and session files at once and put the results in one table.
+
+The files are split between the processes of a process pool, a chunk of files at a time so
+the cost of sending the work to the processes is spread out.  Each analysis in ANALYSES turns
+the runs of a file into rows of the summary table, one row for each run.
+
+The rows of every file are kept in a json cache with the size and modified time of the file,
+so a file that has not changed since the last batch is not opened again.
+
+Run it from the command line with the files or folders to analyze, e.g.
+    python batch_analysis.py data_folder --analyses peaks fit --output summary.csv
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import argparse
+import concurrent.futures
+import csv
+import json
+import logging
+import os
+import sys
+import time
+# installed libraries
+import numpy as np
+# local files
+import cv_analysis
+import pyplot_data_class as data_class
+import resistance_fit
+import session_file
+
+CACHE_FILE = "batch_analysis_cache.json"
+DATA_EXTENSIONS = (".csv", session_file.SESSION_EXTENSION)
+CHUNKS_PER_WORKER = 4  # chunks given to each process, more chunks even out slow files
+BASELINE_FRACTION = 0.1  # part of the start of a run used for the baseline analysis
+SUMMARY_COLUMNS = ['file', 'technique', 'run', 'label']  # columns put first in the summary
+
+
+def load_runs(filename):
+    """ Read the runs of a saved file
+    :param filename: csv file saved by the program or a session file
+    :return: list of dicts with the keys 'technique', 'label', 'run_info', 'x' and 'y'
+    """
+    runs = []
+    if filename.endswith(session_file.SESSION_EXTENSION):
+        session = session_file.SessionFile(filename)
+        try:
+            for technique in sorted(set(run['technique'] for run in session.runs)):
+                saved_data = session.saved_data(technique)
+                runs.extend(_split_runs(saved_data, technique))
+        finally:
+            session.close()
+    else:
+        saved_data = data_class.read_csv_data(filename)
+        runs.extend(_split_runs(saved_data, 'CV' if saved_data['type'] == 'cv' else 'amp'))
+    return runs
+
+
+def _split_runs(saved_data, technique):
+    """ Make a run dict for each run of a saved data dict, the arrays are copied so a session
+    file can be closed """
+    run_info = saved_data.get('run_info') or len(saved_data['y']) * [{}]
+    return [{'technique': technique, 'label': label, 'run_info': info,
+             'x': np.array(x, dtype=np.float64), 'y': np.array(y, dtype=np.float64)}
+            for label, info, x, y in zip(saved_data['labels'], run_info,
+                                         saved_data['x'], saved_data['y'])]
+
+
+def peak_analysis(runs):
+    """ Find the CV peaks of the voltammetry runs with cv_analysis, the other runs get no
+    values """
+    voltammetry = [i for i, run in enumerate(runs) if run['technique'] in ('CV', 'ASV')]
+    rows = [{} for _ in runs]
+    if not voltammetry:
+        return rows
+    data = data_class.PyplotData()
+    data.add_runs([runs[i]['x'] for i in voltammetry], [runs[i]['y'] for i in voltammetry],
+                  labels=[runs[i]['label'] for i in voltammetry],
+                  run_info=[runs[i]['run_info'] for i in voltammetry])
+    results = cv_analysis.analyze_data(data)
+    for j, i in enumerate(voltammetry):
+        rows[i] = {field: float(results[field][j]) for field in cv_analysis.RESULT_FIELDS}
+    return rows
+
+
+def fit_analysis(runs):
+    """ Fit a straight line to the current against the x axis of each run with resistance_fit,
+    for voltammetry runs the resistance of the line is kept too
+    """
+    if not runs:
+        return []
+    x_block, y_block = resistance_fit.pad_columns([run['x'] for run in runs],
+                                                  [run['y'] for run in runs])
+    results = resistance_fit.fit_lines(x_block, y_block, cutoff=None)
+    rows = []
+    for i, run in enumerate(runs):
+        row = {field: float(results[field][i]) for field in ('slope', 'intercept', 'residual')}
+        if run['technique'] != 'amp':
+            row['resistance'] = float(results['resistance'][i])
+        rows.append(row)
+    return rows
+
+
+def baseline_analysis(runs):
+    """ Get the mean, noise and drift of the current at the start of each run """
+    rows = []
+    for run in runs:
+        number = max(int(BASELINE_FRACTION * len(run['y'])), 2)
+        x, y = run['x'][:number], run['y'][:number]
+        rows.append({'baseline_mean': float(np.mean(y)), 'baseline_std': float(np.std(y)),
+                     'baseline_drift': float(np.polyfit(x, y, 1)[0])})
+    return rows
+
+
+# name: function that takes the list of runs of a file and returns a dict of values for each
+# run, in the same order
+ANALYSES = {'peaks': peak_analysis, 'fit': fit_analysis, 'baseline': baseline_analysis}
+
+
+def analyze_file(filename, analyses):
+    """ Run the analyses on one file, this is run in the worker processes
+    :param filename: name of the file
+    :param analyses: list of the names of the analyses in ANALYSES to run
+    :return: list of the rows of the file, or a list with one row with an 'error' if the file
+    could not be analyzed
+    """
+    try:
+        runs = load_runs(filename)
+        rows = [{'file': filename, 'technique': run['technique'], 'run': i,
+                 'label': run['label']} for i, run in enumerate(runs)]
+        for name in analyses:
+            for row, values in zip(rows, ANALYSES[name](runs)):
+                row.update(values)
+        return rows
+    except Exception as error:
+        return [{'file': filename, 'error': "{0}: {1}".format(type(error).__name__, error)}]
+
+
+def find_files(paths):
+    """ Get the data files in a list of files and folders, folders are searched all the way
+    down
+    :param paths: list of file and folder names
+    :return: sorted list of the absolute file names
+    """
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                files.update(os.path.join(folder, name) for name in names
+                             if name.endswith(DATA_EXTENSIONS))
+        else:
+            files.add(path)
+    return sorted(os.path.abspath(name) for name in files)
+
+
+class AnalysisCache(object):
+    """ Rows of the files analyzed before, kept with the size and modified time of each file
+    so changed files are analyzed again """
+    def __init__(self, filename=CACHE_FILE):
+        """
+        :param filename: json file to keep the cache in, None to not keep a cache
+        """
+        self.filename = filename
+        self.entries = {}
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename, 'r') as _file:
+                    self.entries = json.load(_file)
+            except (OSError, ValueError) as error:
+                logging.warning("could not read the cache %s, starting a new one: %s",
+                                filename, error)
+
+    @staticmethod
+    def stamp(filename):
+        stats = os.stat(filename)
+        return [stats.st_size, stats.st_mtime_ns]
+
+    def get(self, filename, analyses):
+        """ Get the cached rows of a file
+        :return: list of rows, or None if the file or the analyses have changed
+        """
+        entry = self.entries.get(filename)
+        if (entry and entry['analyses'] == sorted(analyses) and
+                entry['stamp'] == self.stamp(filename)):
+            return entry['rows']
+        return None
+
+    def put(self, filename, analyses, rows):
+        if any('error' in row for row in rows):
+            return  # try the file again next time
+        self.entries[filename] = {'stamp': self.stamp(filename), 'analyses': sorted(analyses),
+                                  'rows': rows}
+
+    def save(self):
+        """ Write the cache, through a temporary file so a failed write keeps the old cache """
+        if not self.filename:
+            return
+        temp_filename = self.filename + ".tmp"
+        try:
+            with open(temp_filename, 'w') as _file:
+                json.dump(self.entries, _file)
+            os.replace(temp_filename, self.filename)
+        except (OSError, TypeError, ValueError) as error:
+            logging.error("could not save the cache %s: %s", self.filename, error)
+
+
+def run_batch(paths, analyses=tuple(ANALYSES), workers=None, cache_file=CACHE_FILE,
+              progress=None):
+    """ Analyze many files and get one table of the results
+    :param paths: list of files and folders to analyze
+    :param analyses: names of the analyses in ANALYSES to run
+    :param workers: number of processes to use, None uses one for each cpu, 1 runs the files
+    in this process
+    :param cache_file: json file to keep the results in so unchanged files are skipped, None
+    to not use a cache
+    :param progress: function called with (files done, total files, file name) after each
+    file, None to log the progress
+    :return: list of the row dicts of every run, in the order of the files
+    """
+    analyses = list(analyses)
+    unknown = set(analyses) - set(ANALYSES)
+    if unknown:
+        raise ValueError("Unknown analyses: {0}".format(", ".join(sorted(unknown))))
+    progress = progress or _log_progress
+    files = find_files(paths)
+    cache = AnalysisCache(cache_file)
+    results = {}
+    for filename in files:
+        rows = cache.get(filename, analyses)
+        if rows is not None:
+            results[filename] = rows
+    todo = [filename for filename in files if filename not in results]
+    done = len(results)
+    logging.info("%s of %s files are unchanged, analyzing %s", done, len(files), len(todo))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(todo) < 2:
+        rows_iterator = (analyze_file(filename, analyses) for filename in todo)
+        executor = None
+    else:
+        chunk_size = max(1, len(todo) // (workers * CHUNKS_PER_WORKER))
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        rows_iterator = executor.map(analyze_file, todo, [analyses] * len(todo),
+                                     chunksize=chunk_size)
+    try:
+        for filename, rows in zip(todo, rows_iterator):
+            results[filename] = rows
+            cache.put(filename, analyses, rows)
+            done += 1
+            progress(done, len(files), filename)
+    finally:
+        if executor:
+            executor.shutdown()
+        cache.save()
+    return [row for filename in files for row in results[filename]]
+
+
+def _log_progress(done, total, filename):
+    logging.info("analyzed %s of %s files: %s", done, total, filename)
+
+
+def write_summary(rows, filename):
+    """ Save the rows to a csv file, with a column for every value any row has
+    :param rows: list of dicts from run_batch
+    :param filename: name of the csv file
+    """
+    columns = list(SUMMARY_COLUMNS)
+    for row in rows:
+        columns.extend(key for key in row if key not in columns)
+    with open(filename, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, columns, dialect='excel')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze many saved data files at once")
+    parser.add_argument('paths', nargs='+', help="files and folders to analyze")
+    parser.add_argument('--analyses', nargs='+', choices=sorted(ANALYSES),
+                        default=sorted(ANALYSES))
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of processes, default one for each cpu")
+    parser.add_argument('--output', default="batch_summary.csv")
+    parser.add_argument('--cache', default=CACHE_FILE, help="cache file, '' for no cache")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    def show_progress(done, total, filename):
+        print("\r{0}/{1} {2}".format(done, total, os.path.basename(filename)).ljust(79),
+              end="", file=sys.stderr)
+    rows = run_batch(args.paths, args.analyses, args.workers, args.cache or None,
+                     show_progress)
+    write_summary(rows, args.output)
+    print("\n{0} runs saved to {1} in {2:.1f} s".format(len(rows), args.output,
+                                                        time.perf_counter() - start),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,6 @@ import tkinter as tk
 import tkinter.font
 from tkinter import ttk
 import unittest
-from unittest import mock
 # local files
 import cv_frame
 import globals as _globals
@@ -594,6 +593,62 @@ class AmpSettingsChanges(tk.Toplevel):
             return False
 
 
+class ChronoSettingsChanges(tk.Toplevel):
+    """ Toplevel that displays the chronoamperometry settings and allows the user to change
+    them """
+    def __init__(self, display, master, device):
+        """
+        :param display: the ChronoSettingsDisplay (tk.Frame) where the settings are displayed
+        :param master: root application master
+        :param device: chrono_frame device handler
+        """
+        tk.Toplevel.__init__(self, master=master)
+        self.title("Change Chronoamperometry Settings")
+        self.display = display
+        self.master = master
+        settings = master.device_params.chrono_settings
+        self.entries = {}
+        row = 0
+        for name in ['initial', 'step', 'final']:
+            for key, units in [('_voltage', "mV"), ('_time', "seconds")]:
+                label = "{0} {1}: ".format(name.capitalize(), key[1:])
+                tk.Label(self, text=label, padx=10, pady=5).grid(row=row, column=0)
+                entry = tk.Entry(self)
+                entry.insert(0, str(getattr(settings, name + key)))
+                entry.grid(row=row, column=1)
+                tk.Label(self, text=units, padx=10, pady=5).grid(row=row, column=2)
+                self.entries[name + key] = entry
+                row += 1
+        tk.Label(self, text="Sampling rate: ", padx=10, pady=5).grid(row=row, column=0)
+        rate = tk.Entry(self)
+        rate.insert(0, str(settings.sampling_rate))
+        rate.grid(row=row, column=1)
+        tk.Label(self, text="Hz", padx=10, pady=5).grid(row=row, column=2)
+        self.entries['sampling_rate'] = rate
+        self.error_var = tk.StringVar()
+        tk.Label(self, textvariable=self.error_var, fg='red').grid(row=row + 1, column=0,
+                                                                  columnspan=3)
+        tk.Button(self,
+                  text='Save Changes',
+                  command=self.save_chrono_changes).grid(row=row + 2, column=0)
+        tk.Button(self,
+                  text='Exit',
+                  command=self.destroy).grid(row=row + 2, column=1)
+
+    def save_chrono_changes(self):
+        """ Check and save the user's settings, the window stays open to show what is wrong if
+        they can not be used """
+        values = {name: entry.get() for name, entry in self.entries.items()}
+        try:
+            self.master.device_params.chrono_settings.update_settings(**values)
+        except ValueError as error:
+            logging.info("Error in chronoamperometry settings: %s", error)
+            self.error_var.set(str(error))
+            return
+        self.display.label_update(self.master.device_params)
+        self.destroy()
+
+
 class ChangeCompareValue(tk.Toplevel):
     """ Allow the user to change the compare value of the PWM, for testing, sets when the
     ADC goes after the DAC is changes
@@ -773,6 +828,46 @@ class UserSelectDataDelete(tk.Toplevel):
         self.destroy()
 
 
+class SessionRunSelect(tk.Toplevel):
+    """ Let the user pick runs of the opened session file to show that are not shown yet,
+    the runs are only read from the file when they are picked
+    """
+    def __init__(self, master, session):
+        """
+        :param master: root application, with the open_session_runs method
+        :param session: session_file.SessionFile that was opened
+        """
+        tk.Toplevel.__init__(self, master)
+        self.title("Open session runs")
+        self.indexes = session.unloaded_indexes()
+        tk.Label(self, text="Select the runs to show",
+                 font=tkinter.font.Font(family="Helvetica", size=14)).pack(side='top')
+        list_frame = tk.Frame(self)
+        scrollbar = tk.Scrollbar(list_frame)
+        self.run_list = tk.Listbox(list_frame, selectmode=tk.EXTENDED, width=40, height=15,
+                                   yscrollcommand=scrollbar.set)
+        scrollbar.config(command=self.run_list.yview)
+        for i in self.indexes:
+            run = session.runs[i]
+            self.run_list.insert(tk.END, "{0}: {1}".format(run['technique'], run['label']))
+        scrollbar.pack(side='right', fill=tk.Y)
+        self.run_list.pack(side='left', fill=tk.BOTH, expand=1)
+        list_frame.pack(side='top', fill=tk.BOTH, expand=1, padx=5)
+
+        button_frame = tk.Frame(self)
+        tk.Button(button_frame, text="Open", width=10,
+                  command=lambda: self.open_selection(master)
+                  ).pack(side='left', padx=10, fill=tk.X, expand=1)
+        tk.Button(button_frame, text="Cancel", width=10,
+                  command=self.destroy).pack(side='left', padx=10, fill=tk.X, expand=1)
+        button_frame.pack(side='top', fill=tk.X, expand=1)
+
+    def open_selection(self, master):
+        """ Send the runs the user selected to master to show """
+        master.open_session_runs([self.indexes[i] for i in self.run_list.curselection()])
+        self.destroy()
+
+
 class ChangeDataLegend(tk.Toplevel):
     """ Make a toplevel that will allow the user to change the color of the data in the legend
     """
@@ -782,6 +877,7 @@ class ChangeDataLegend(tk.Toplevel):
         tk.Toplevel.__init__(self, master=_master)
         self.legend_entries = []
         self.color_picks = []
+        self.show_runs = []
         tk.Label(self, text="Configure Data Legend").pack(side="top")
         # make a section to modify each line plotted so far
         for i in range(_master.data.index):
@@ -800,6 +896,9 @@ class ChangeDataLegend(tk.Toplevel):
             self.legend_entries[i].set(_master.data.label[i])
             tk.Entry(horizontal_frame,
                      textvariable=self.legend_entries[i]).pack(side="left")
+            self.show_runs.append(tk.BooleanVar(self, value=graph.traces.visible[i]))
+            tk.Checkbutton(horizontal_frame, text="Show",
+                           variable=self.show_runs[i]).pack(side='left')
         bottom_frame = tk.Frame(self)
         bottom_frame.pack(side='bottom')
         tk.Button(bottom_frame,
@@ -822,6 +921,7 @@ class ChangeDataLegend(tk.Toplevel):
             _master.data.colors[i] = pick.get()
             graph.change_line_color(pick.get(), i)
             _master.data.label[i] = self.legend_entries[i].get()
+            graph.traces.set_visible(i, self.show_runs[i].get())
             i += 1
         graph.update_legend()
 
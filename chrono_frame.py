@@ -0,0 +1,301 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+tkinter frame to run chronoamperometry (potential step) experiments.
+
+The electrode is held at the initial voltage, stepped to the step voltage and then to the
+final voltage, each for the time set in properties.ChronoSettings.  The current is streamed
+the same way as an amperometry run, and the voltage steps are sent on time by an
+asv_sequencer.ASVSequencer thread.
+
+The samples are stored in a SampleBuffer, a numpy array made big enough for the whole run at
+the start, so a long run at a high sampling rate does not build python lists of millions of
+floats.  The time of each sample is not stored, sample i was read at i / sampling rate.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import csv
+import functools
+import logging
+import time
+import tkinter as tk
+# installed libraries
+import numpy as np
+# local files
+import amp_frame
+import asv_sequencer
+import change_toplevel
+import tkinter_pyplot
+
+MAX_DISPLAY_POINTS = 5000  # most points drawn on the graph, the data is saved in full
+FINISH_TIMEOUT = 2.0  # seconds to wait after the last step for the rest of the samples
+START_DELAY = 300  # ms to let the device start before reading, the same as amperometry
+
+
+class SampleBuffer(object):
+    """ Growable numpy array of samples """
+    def __init__(self, capacity=1024):
+        """
+        :param capacity: number of samples to make room for
+        """
+        self._data = np.empty(max(int(capacity), 1), dtype=np.float64)
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def extend(self, values):
+        """ Add samples to the end, the array is doubled if there is not room
+        :param values: array or list of samples
+        """
+        values = np.asarray(values, dtype=np.float64)
+        end = self._length + values.size
+        if end > self._data.size:
+            new_data = np.empty(max(end, 2 * self._data.size), dtype=np.float64)
+            new_data[:self._length] = self._data[:self._length]
+            self._data = new_data
+        self._data[self._length:end] = values
+        self._length = end
+
+    def trim(self, length):
+        """ Drop the samples after length """
+        self._length = min(self._length, length)
+
+    def values(self):
+        """ Get the samples, this is a view, copy it to keep it after more samples are added """
+        return self._data[:self._length]
+
+
+def display_stride(number_points, max_points=MAX_DISPLAY_POINTS):
+    """ Get the step to take through the data so no more than max_points are drawn """
+    return max(1, -(-number_points // max_points))
+
+
+class ChronoFrame(amp_frame.AmpFrame):
+    """ Frame to hold the widgets and the data calls to perform chronoamperometry experiments """
+    run_text = "Chronoamperometry"
+
+    def make_graph_area(self, master, graph_props):
+        if tkinter_pyplot.check_display_type() == 'matplotlib':
+            current_lim = master.device_params.adc_tia.current_lims
+            graph = tkinter_pyplot.PyplotEmbed(master.frames[1],
+                                               graph_props.chrono_plot, self,
+                                               current_lim, 0,
+                                               master.device_params.chrono_settings.total_time)
+        else:
+            graph = None
+        return graph
+
+    def make_settings_display(self, master, options_frame, device):
+        return self.ChronoSettingsDisplay(master, options_frame, self.graph, device,
+                                          master.device_params)
+
+    def run_finished(self):
+        """ The last step is over, set the run button back """
+        self.running = False
+        self.run_button.config(text="Start " + self.run_text)
+
+    def save_data(self, device):
+        if len(device.data) == 0:
+            logging.info("No chronoamperometry data to save")
+            return
+        _file = amp_frame.open_file('saveas')
+        if _file:
+            with open(_file, 'w', newline='') as csv_file:
+                writer = csv.writer(csv_file, dialect='excel')
+                writer.writerow(["time", "current"])
+                writer.writerows(zip(device.times().tolist(), device.data.values().tolist()))
+            device.master.catalog_runs(_file, 'csv', [{'technique': 'chrono',
+                                                       'label': "chronoamperometry",
+                                                       'run_info': device.run_info}])
+
+    def session_runs(self):
+        """ Make the run of the chronoamperometry data to save in a session file
+        :return: list with one run dict for session_file.save_session, or an empty list if
+        there is no data
+        """
+        if len(self.device.data) == 0:
+            return []
+        return [{'technique': 'chrono', 'label': "chronoamperometry", 'notes': " ",
+                 'color': None, 'run_info': self.device.run_info,
+                 'x': self.device.times(), 'y': self.device.data.values().copy()}]
+
+    def open_data(self, saved_data):
+        """ Display chronoamperometry data read from a session file
+        :param saved_data: dict from session_file.SessionFile.saved_data with the time in 'x'
+        and the current in 'y'
+        """
+        if self.running or not saved_data['y'] or len(saved_data['y'][0]) == 0:
+            return
+        times = saved_data['x'][0]
+        self.device.data = SampleBuffer(len(saved_data['y'][0]))
+        self.device.data.extend(saved_data['y'][0])
+        if len(times) > 1:
+            self.device.time_step = float(times[1] - times[0])
+        self.device.run_info = saved_data.get('run_info', [{}])[0]
+        self.device.show_data(float(times[-1]))
+
+    class USBHandler(amp_frame.AmpFrame.USBHandler):
+        """ Stream the current while the sequencer steps the voltage """
+        def __init__(self, graph, device, master):
+            amp_frame.AmpFrame.USBHandler.__init__(self, graph, device, master)
+            self.settings = master.device_params.chrono_settings
+            self.sizer = amp_frame.PacketSizer(self.settings.sampling_rate)
+            self.set_packet_size(self.sizer.packet_size)
+            self.time_step = 1.0 / self.settings.sampling_rate
+            self.data = SampleBuffer()
+            self.sequencer = None  # asv_sequencer.ASVSequencer that steps the voltage
+            self.frame = None  # ChronoFrame to tell when the run is over
+            self._sequencer_end = None
+
+        def times(self):
+            """ Get the time of each sample, in seconds from the start of the run """
+            return np.arange(len(self.data), dtype=np.float64) * self.time_step
+
+        def amp_run(self, graph, frame):
+            steps = self.settings.steps()
+            self.frame = frame
+            self.time_step = 1.0 / self.settings.sampling_rate
+            self.data = SampleBuffer(self.settings.number_samples)
+            self.run_info = self.master.device_params.run_info('chrono')
+            self.running = True
+            self._sequencer_end = None
+            if self.device.deframer:
+                self.device.deframer.reset()
+            self.device.take_lost_samples()
+            # the time of each sample is counted from the first so the first packet is kept
+            self.first_read_dumbed = True
+            if (self.device.device_params.pwm_period_value !=
+                    self.settings.pwm_period_value):
+                self.set_sample_rate(self.settings.sampling_rate)
+            self.set_packet_size(self.sizer.start_run(self.settings.sampling_rate))
+            # the first step starts with the stream, the others are sent on time by the sequencer
+            self.device.send_command('amperometry', self.format_voltage(steps[0][0]),
+                                     self.data_packet_size)
+            phases = [asv_sequencer.Phase('step 1', steps[0][1], None)]
+            for i, (voltage, duration) in enumerate(steps[1:], start=2):
+                phases.append(asv_sequencer.Phase('step {0}'.format(i), duration,
+                                                  functools.partial(self.send_step, voltage)))
+            self.sequencer = asv_sequencer.ASVSequencer(phases)
+            self.sequencer.start()
+            self.master.after(START_DELAY, self.start_reading)
+
+        def send_step(self, voltage):
+            """ Step the electrode to a new voltage, runs in the sequencer thread
+            :param voltage: int - mV
+            """
+            self.device.send_command('anode_voltage', self.format_voltage(voltage))
+
+        def running_read(self):
+            """ Add the converted samples to the buffer, graph them and finish the run when all
+            the samples are in """
+            self._reader = self.master.after(amp_frame.DISPLAY_INTERVAL, self.running_read)
+            if not (self.running and self.pipeline):
+                return
+            self.show_packets(self.pipeline.drain())
+            if len(self.data) >= self.settings.number_samples:
+                self.finish_run()
+            elif self.sequencer.finished:
+                if self._sequencer_end is None:
+                    self._sequencer_end = time.monotonic()
+                elif time.monotonic() - self._sequencer_end > FINISH_TIMEOUT:
+                    logging.warning("chronoamperometry ended with %s of %s samples",
+                                    len(self.data), self.settings.number_samples)
+                    self.finish_run()
+
+        def show_packets(self, packets):
+            """ Add converted packets to the sample buffer and graph them
+            :param packets: list of the arrays of currents from convert_packet
+            """
+            for samples in packets:
+                self.data.extend(samples)
+            if packets:
+                self.show_data()
+
+        def convert_packet(self, packet):
+            """ Convert a packet to currents, runs in the pipeline's convert thread
+            :param packet: tuple returned by read_packet
+            :return: numpy array of the currents, with a NaN for each sample that was lost so
+            the samples after it keep their time
+            """
+            usb_input, lost_samples = packet
+            data = np.asarray(self.device.process_data(usb_input), dtype=np.float64)
+            if lost_samples:
+                data = np.concatenate((np.full(lost_samples, np.nan), data))
+            return data
+
+        def finish_run(self):
+            """ Stop the device and record when the steps were really made """
+            self.run_info['steps'] = [[transition.name, transition.planned, transition.actual]
+                                      for transition in self.sequencer.transitions]
+            self.sequencer.report()
+            self.cancel_run()
+            # trim after the cancel, it adds the packets still waiting in the pipeline
+            self.data.trim(self.settings.number_samples)
+            self.show_data()
+            self.frame.run_finished()
+
+        def cancel_run(self):
+            if self.sequencer:
+                self.sequencer.stop()
+            amp_frame.AmpFrame.USBHandler.cancel_run(self)
+
+        def show_data(self, x_max=None):
+            """ Graph the samples, only every few are drawn for long runs
+            :param x_max: time to end the x axis at, None for the end of the run
+            """
+            stride = display_stride(len(self.data))
+            self.graph.update_time_course(self.times()[::stride], self.data.values()[::stride],
+                                          x_max or self.settings.total_time)
+
+    class ChronoSettingsDisplay(tk.Frame):
+        """ Show the step voltages and times of the run """
+        def __init__(self, master, frame, graph, device, device_params):
+            """
+            :param master: root application
+            :param frame: options frame this frame is placed in
+            :param graph: graph area
+            :param device: usb_handler for the chrono_frame
+            :param device_params: device parameters
+            """
+            tk.Frame.__init__(self, master=frame)
+            self.master = master
+            self.graph = graph
+            self.device = device
+            self.step_var_strs = [tk.StringVar() for _ in range(3)]
+            self.sampling_rate_var_str = tk.StringVar()
+            self.current_var_str = tk.StringVar()
+            for var_str in self.step_var_strs:
+                tk.Label(textvariable=var_str, master=self).pack(side='top')
+            tk.Label(textvariable=self.sampling_rate_var_str, master=self).pack(side='top')
+            tk.Label(textvariable=self.current_var_str, master=self).pack(side='top')
+
+            tk.Button(self,
+                      text="Change Settings",
+                      command=self.change_chrono_settings).pack(side='bottom',
+                                                                fill=tk.BOTH)
+            self.label_update(device_params)
+
+        def set_current_var_str(self, tia_value):
+            self.current_var_str.set(u'Current range: {0}'.format(tia_value))
+
+        def label_update(self, params):
+            """ Update the user's display of the chronoamperometry settings
+            :param params: device parameters
+            """
+            settings = params.chrono_settings
+            for var_str, name in zip(self.step_var_strs, ['initial', 'step', 'final']):
+                var_str.set('{0}: {1} mV for {2} s'.format(
+                    name.capitalize(), getattr(settings, name + '_voltage'),
+                    getattr(settings, name + '_time')))
+            self.sampling_rate_var_str.set('Sampling rate: {0} Hz'.format(
+                int(settings.sampling_rate)))
+            self.current_var_str.set(u'Current range: \u00B1 {0:.1f} \u00B5A'
+                                     .format(params.adc_tia.current_lims))
+            if self.graph:
+                self.graph.resize_x(0, settings.total_time)
+
+        def change_chrono_settings(self):
+            change_toplevel.ChronoSettingsChanges(self, self.master, self.device)
@@ -0,0 +1,242 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Encode the commands sent to the device.
+
+Every command the program sends is listed in COMMANDS with its fields, so the commands are
+built and checked in one place instead of with format strings in each frame.  A command can
+be encoded two ways:
+
+ASCII: the original protocol, a letter prefix and the fields zero padded to a fixed number of
+digits and separated by '|', e.g. "S|1148|2068|00479|CS" or "C|01919".
+
+binary: a frame of a sync byte, the opcode of the command, the number of bytes in the fields,
+the fields packed little endian and a checksum byte that makes the sum of the opcode, length,
+fields and checksum 0 modulo 256.  The sync byte is not an ASCII character, so the device can
+tell a binary frame from an ASCII command by its first byte.
+
+The device tells if it can read binary frames in its reply to the identify command 'I', the
+reply has BINARY_CAPABILITY in it if it can, see negotiate.  Values that do not fit in their
+field raise a CommandError instead of sending a command the device would misread.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import struct
+
+ASCII = "ascii"
+BINARY = "binary"
+PROTOCOLS = [ASCII, BINARY]
+BINARY_CAPABILITY = b"BIN1"  # sent in the identify reply by devices that read binary frames
+SYNC = 0xA5
+_HEADER = struct.Struct("<BBB")  # sync, opcode, length of the fields
+
+
+class CommandError(ValueError):
+    """ A command or its values can not be encoded, or a binary frame is not valid """
+
+
+class Field(object):
+    """ One value of a command """
+    def __init__(self, name, digits, binary_format):
+        """
+        :param name: name of the value, used in error messages
+        :param digits: number of characters the value takes in the ASCII command
+        :param binary_format: struct format of the value in a binary frame, 'B', 'H' or 'I' for
+        numbers, 's' for text that has to be exactly digits long
+        """
+        self.name = name
+        self.digits = digits
+        self.binary_format = binary_format if binary_format != 's' else "{0}s".format(digits)
+        self.is_text = binary_format == 's'
+        self.max_value = (min(10 ** digits, 2 ** (8 * struct.calcsize(binary_format))) - 1
+                          if not self.is_text else None)
+
+    def check(self, command, value):
+        """ Check the value can be sent in this field
+        :param command: name of the command the field is in, for the error message
+        :param value: value to check
+        :return: the value, as an int for number fields or str for text fields
+        """
+        if self.is_text:
+            if (not isinstance(value, str) or len(value) != self.digits or
+                    not value.isascii() or '|' in value):
+                raise CommandError("{0} {1} has to be {2} characters, got {3!r}".format(
+                    command, self.name, self.digits, value))
+            return value
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise CommandError("{0} {1} has to be a whole number, got {2!r}".format(
+                command, self.name, value))
+        if not 0 <= value <= self.max_value:
+            raise CommandError("{0} {1} has to be from 0 to {2}, got {3}".format(
+                command, self.name, self.max_value, value))
+        return value
+
+
+class Command(object):
+    """ A command the device understands """
+    def __init__(self, name, prefix, opcode, fields=(), separator='|'):
+        """
+        :param name: name the program uses for the command
+        :param prefix: letters that start the ASCII command
+        :param opcode: int - byte that starts the fields of the binary frame
+        :param fields: list of Field of the values sent with the command
+        :param separator: put between the prefix and each field in the ASCII command
+        """
+        self.name = name
+        self.prefix = prefix
+        self.opcode = opcode
+        self.fields = list(fields)
+        self.separator = separator
+        self.struct = struct.Struct("<" + "".join(field.binary_format for field in fields))
+
+    def check(self, values):
+        if len(values) != len(self.fields):
+            raise CommandError("{0} takes {1} values, got {2}".format(
+                self.name, len(self.fields), len(values)))
+        return [field.check(self.name, value) for field, value in zip(self.fields, values)]
+
+    def encode_ascii(self, values):
+        values = self.check(values)
+        parts = [self.prefix]
+        for field, value in zip(self.fields, values):
+            parts.append(value if field.is_text else "{0:0{1}d}".format(value, field.digits))
+        return self.separator.join(parts)
+
+    def encode_binary(self, values):
+        values = self.check(values)
+        payload = self.struct.pack(*[value.encode('ascii') if field.is_text else value
+                                     for field, value in zip(self.fields, values)])
+        frame = _HEADER.pack(SYNC, self.opcode, len(payload)) + payload
+        return frame + bytes([checksum(frame[1:])])
+
+
+COMMANDS = {command.name: command for command in [
+    Command('identify', 'I', 0x01),
+    Command('read_voltage_source', 'VR', 0x02),
+    Command('voltage_source', 'VS', 0x03, [Field('source', 1, 'B')], separator=''),
+    Command('start_hardware', 'H', 0x04),
+    Command('run', 'R', 0x05),
+    Command('reset', 'X', 0x06),
+    Command('calibrate', 'B', 0x07),
+    Command('short_tia', 's', 0x08),
+    Command('open_tia', 'd', 0x09),
+    Command('export', 'E', 0x0A, [Field('channel', 1, 'B')], separator=''),
+    Command('export_amp', 'F', 0x0B, [Field('channel', 1, 'B')], separator=''),
+    Command('look_up_table', 'l', 0x0C, [Field('length', 4, 'H')]),
+    Command('electrode_config', 'L', 0x0D, [Field('electrodes', 1, 'B')]),
+    Command('adc_tia', 'A', 0x0E, [Field('adc_config', 1, 'B'), Field('tia_resistor', 1, 'B'),
+                                   Field('adc_gain', 1, 'B'), Field('resistor_type', 1, 's'),
+                                   Field('channel', 1, 'B')]),
+    Command('pwm_compare', 'C', 0x0F, [Field('compare', 5, 'I')]),
+    Command('pwm_period', 'T', 0x10, [Field('period', 5, 'I')]),
+    Command('anode_voltage', 'D', 0x11, [Field('dac_value', 4, 'H')]),
+    Command('cv_sweep', 'S', 0x12, [Field('start', 4, 'H'), Field('end', 4, 'H'),
+                                    Field('period', 5, 'I'), Field('sweep_type', 2, 's')]),
+    Command('swv_sweep', 'G', 0x13, [Field('start', 4, 'H'), Field('end', 4, 'H'),
+                                     Field('increment', 4, 'H'), Field('pulse_height', 4, 'H'),
+                                     Field('period', 5, 'I'), Field('sweep_type', 2, 's')]),
+    Command('dpv_sweep', 'G', 0x14, [Field('start', 4, 'H'), Field('end', 4, 'H'),
+                                     Field('pulse_height', 3, 'H'),
+                                     Field('increment', 3, 'H'), Field('period', 5, 'I')]),
+    Command('chrono_sweep', 'Q', 0x15, [Field('start', 4, 'H'), Field('end', 4, 'H'),
+                                        Field('period', 5, 'I')]),
+    Command('amperometry', 'M', 0x16, [Field('dac_value', 4, 'H'),
+                                       Field('packet_size', 4, 'H')]),
+    # clean and plate voltages as dac counts and times in ms, then the loaded sweep is run
+    Command('asv_program', 'P', 0x17, [Field('clean_dac', 4, 'H'), Field('clean_time', 7, 'I'),
+                                       Field('plate_dac', 4, 'H'), Field('plate_time', 7, 'I')])
+]}
+OPCODES = {command.opcode: command for command in COMMANDS.values()}
+
+
+def checksum(data):
+    """ Get the byte that makes the sum of data and the byte 0 modulo 256
+    :param data: bytes to make the checksum for
+    :return: int - checksum byte
+    """
+    return -sum(data) & 0xFF
+
+
+def get_command(name):
+    try:
+        return COMMANDS[name]
+    except KeyError:
+        raise CommandError("Unknown command {0}".format(name)) from None
+
+
+def encode_ascii(name, *values):
+    """ Make the ASCII command, e.g. encode_ascii('pwm_compare', 1919) gives "C|01919"
+    :param name: name of the command in COMMANDS
+    :param values: values of the command's fields
+    :return: str - command to send
+    """
+    return get_command(name).encode_ascii(values)
+
+
+def encode_binary(name, *values):
+    """ Make the binary frame of a command
+    :param name: name of the command in COMMANDS
+    :param values: values of the command's fields
+    :return: bytes - frame to send
+    """
+    return get_command(name).encode_binary(values)
+
+
+def decode_binary(frame):
+    """ Read a binary frame back into the command and its values
+    :param frame: bytes of one whole frame
+    :return: tuple of the command name and the list of its values
+    """
+    if len(frame) < _HEADER.size + 1:
+        raise CommandError("Frame is too short: {0!r}".format(frame))
+    sync, opcode, length = _HEADER.unpack_from(frame)
+    if sync != SYNC:
+        raise CommandError("Frame does not start with the sync byte: {0!r}".format(frame))
+    if len(frame) != _HEADER.size + length + 1:
+        raise CommandError("Frame length {0} does not match its header".format(len(frame)))
+    if checksum(frame[1:]) != 0:
+        raise CommandError("Frame checksum is wrong: {0!r}".format(frame))
+    if opcode not in OPCODES:
+        raise CommandError("Unknown opcode {0}".format(opcode))
+    command = OPCODES[opcode]
+    if length != command.struct.size:
+        raise CommandError("{0} frame has {1} bytes of values, needs {2}".format(
+            command.name, length, command.struct.size))
+    values = command.struct.unpack_from(frame, _HEADER.size)
+    return command.name, [value.decode('ascii') if field.is_text else value
+                          for field, value in zip(command.fields, values)]
+
+
+def negotiate(identify_reply):
+    """ Pick the protocol to use from the device's reply to the identify command
+    :param identify_reply: bytes or str the device sent back, None if there was no reply
+    :return: BINARY if the device can read binary frames, else ASCII
+    """
+    if isinstance(identify_reply, str):
+        identify_reply = identify_reply.encode('utf-8')
+    if identify_reply and BINARY_CAPABILITY in identify_reply:
+        return BINARY
+    return ASCII
+
+
+class CommandEncoder(object):
+    """ Encode commands with the protocol the device uses """
+    def __init__(self, protocol=ASCII):
+        if protocol not in PROTOCOLS:
+            raise ValueError("protocol has to be one of {0}, got {1}".format(PROTOCOLS,
+                                                                            protocol))
+        self.protocol = protocol
+
+    def encode(self, name, *values):
+        """ Make a command to send
+        :param name: name of the command in COMMANDS
+        :param values: values of the command's fields
+        :return: str for the ASCII protocol, bytes for the binary protocol
+        """
+        if self.protocol == BINARY:
+            return encode_binary(name, *values)
+        return encode_ascii(name, *values)
@@ -0,0 +1,172 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Find the peaks of cyclic voltammetry runs.
+
+For each run the anodic (oxidation) peak is found in the parts of the sweep where the voltage
+goes up and the cathodic (reduction) peak where it goes down.  A straight baseline is fit to
+the start of each part of the sweep, before the peak, and subtracted so the peak currents and
+the charge are of the faradaic current only.  From the two peaks the peak separation (delta
+Ep), the half wave potential (E 1/2) and the ratio of the peak currents are worked out.
+
+Runs that share a voltage axis (the same protocol) are worked on as one 2-D array, so the
+runs of a whole session are analyzed with a few numpy calls for each protocol instead of a
+python loop for each run.
+
+Units are the ones the program uses: potentials in mV, currents in uA, the sweep rate in
+V/s and the charge in uC.  Values that can not be found, e.g. the cathodic peak of a linear
+sweep, are NaN.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# installed libraries
+import numpy as np
+
+BASELINE_FRACTION = 0.1  # part of each sweep direction used to fit the baseline
+MIN_BASELINE_POINTS = 2
+RESULT_FIELDS = ['anodic_potential', 'anodic_current', 'cathodic_potential',
+                 'cathodic_current', 'delta_ep', 'half_wave_potential', 'peak_ratio',
+                 'anodic_charge', 'cathodic_charge']
+
+
+def analyze_data(data, baseline_fraction=BASELINE_FRACTION):
+    """ Find the peaks of every run in a PyplotData
+    :param data: pyplot_data_class.PyplotData with the runs
+    :param baseline_fraction: part of each sweep direction, from its start, to fit the
+    baseline to
+    :return: dict of each name in RESULT_FIELDS: array with the value of each run, and
+    'label': list of the run labels
+    """
+    results = {field: np.full(data.index, np.nan) for field in RESULT_FIELDS}
+    for axis, runs, currents, lengths in data.axis_groups():
+        sweep_rates = [_sweep_rate(data.run_info[i]) for i in runs]
+        group = analyze_runs(axis, currents, lengths, sweep_rates, baseline_fraction)
+        for field in RESULT_FIELDS:
+            results[field][runs] = group[field]
+    results['label'] = list(data.label[:data.index])
+    return results
+
+
+def analyze_runs(voltage, currents, lengths=None, sweep_rates=None,
+                 baseline_fraction=BASELINE_FRACTION):
+    """ Find the peaks of runs that used the same voltages
+    :param voltage: 1-D array of the voltages of the protocol
+    :param currents: 2-D array with the current of each run in a row, or 1-D for one run
+    :param lengths: number of points in each run, the points after are ignored, None if all
+    the points are used
+    :param sweep_rates: sweep rate of each run in V/s, used for the charge, None if not known
+    :param baseline_fraction: part of each sweep direction, from its start, to fit the
+    baseline to
+    :return: dict of each name in RESULT_FIELDS: array with the value of each run
+    """
+    voltage = np.asarray(voltage, dtype=np.float64)
+    currents = np.atleast_2d(np.asarray(currents, dtype=np.float64))
+    points = min(len(voltage), currents.shape[1])
+    voltage = voltage[:points]
+    runs = np.arange(currents.shape[0])
+    if lengths is None:
+        lengths = np.full(len(runs), points)
+    valid = np.arange(points) < np.asarray(lengths)[:, np.newaxis]
+    currents = np.where(valid, currents[:, :points], np.nan)
+
+    direction = sweep_direction(voltage)
+    corrected = currents - fit_baselines(voltage, currents, direction, baseline_fraction)
+
+    results = {}
+    for name, sign in [('anodic', 1), ('cathodic', -1)]:
+        mask = direction == sign
+        potential, current = _find_peaks(voltage, corrected, mask, sign)
+        results[name + '_potential'] = potential
+        results[name + '_current'] = current
+        results[name + '_charge'] = _charge(voltage, corrected, mask, sweep_rates, len(runs))
+    results['delta_ep'] = results['anodic_potential'] - results['cathodic_potential']
+    results['half_wave_potential'] = (results['anodic_potential'] +
+                                      results['cathodic_potential']) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results['peak_ratio'] = np.abs(results['cathodic_current'] /
+                                       results['anodic_current'])
+    return results
+
+
+def sweep_direction(voltage):
+    """ Get if the voltage is going up (1) or down (-1) at each point, a point where the
+    voltage does not change is given the direction of the points before it
+    :param voltage: 1-D array of the voltages
+    :return: 1-D int array
+    """
+    if len(voltage) < 2:
+        return np.ones(len(voltage), dtype=np.int8)
+    steps = np.sign(np.diff(voltage))
+    steps = np.append(steps, steps[-1])  # the last point keeps the direction it came from
+    changed = np.flatnonzero(steps)
+    if len(changed) == 0:
+        return np.ones(len(voltage), dtype=np.int8)
+    # fill the flat points with the last direction before them, or the first one after them
+    last = np.maximum.accumulate(np.where(steps != 0, np.arange(len(steps)), changed[0]))
+    return steps[last].astype(np.int8)
+
+
+def fit_baselines(voltage, currents, direction, baseline_fraction=BASELINE_FRACTION):
+    """ Fit a straight line to the start of each part of the sweep that goes one direction,
+    for all the runs at once
+    :param voltage: 1-D array of the voltages
+    :param currents: 2-D array with the current of each run in a row
+    :param direction: array from sweep_direction
+    :param baseline_fraction: part of each sweep direction, from its start, to fit to
+    :return: 2-D array of the baseline current of each run at each point
+    """
+    baseline = np.full(currents.shape, np.nan)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(direction)) + 1))
+    ends = np.append(starts[1:], len(voltage))
+    for start, end in zip(starts, ends):
+        number = min(max(int(baseline_fraction * (end - start)), MIN_BASELINE_POINTS),
+                     end - start)
+        x = voltage[start:start + number]
+        y = currents[:, start:start + number]
+        x_mean = x.mean()
+        y_mean = y.mean(axis=1)
+        spread = ((x - x_mean) ** 2).sum()
+        if spread > 0:
+            slope = ((y - y_mean[:, np.newaxis]) * (x - x_mean)).sum(axis=1) / spread
+        else:
+            slope = np.zeros(len(y_mean))
+        baseline[:, start:end] = (y_mean[:, np.newaxis] +
+                                  slope[:, np.newaxis] * (voltage[start:end] - x_mean))
+    return baseline
+
+
+def _find_peaks(voltage, corrected, mask, sign):
+    """ Find the biggest current in the sign direction of the points in mask of each run
+    :return: arrays of the peak potential and the baseline corrected peak current
+    """
+    rows = np.arange(corrected.shape[0])
+    search = np.where(mask & np.isfinite(corrected), sign * corrected, -np.inf)
+    peaks = np.argmax(search, axis=1)
+    found = np.isfinite(search[rows, peaks])
+    return (np.where(found, voltage[peaks], np.nan),
+            np.where(found, corrected[rows, peaks], np.nan))
+
+
+def _charge(voltage, corrected, mask, sweep_rates, number_runs):
+    """ Integrate the baseline corrected current over time for the points in mask, the
+    current is integrated over the voltage and divided by the sweep rate
+    :return: array of the charge of each run in uC
+    """
+    if sweep_rates is None:
+        return np.full(number_runs, np.nan)
+    finite = np.isfinite(corrected)
+    pairs = mask[1:] & mask[:-1] & finite[:, 1:] & finite[:, :-1]
+    widths = np.abs(np.diff(voltage))
+    areas = np.where(pairs, 0.5 * (corrected[:, 1:] + corrected[:, :-1]) * widths, 0.0)
+    rates = np.asarray(sweep_rates, dtype=np.float64) * 1000.0  # mV/s
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return areas.sum(axis=1) / rates
+
+
+def _sweep_rate(run_info):
+    """ Get the sweep rate (V/s) a run was taken at, NaN if it was not saved """
+    try:
+        return float(run_info['sweep_rate'])
+    except (KeyError, TypeError, ValueError):
+        return np.nan
@@ -11,14 +11,17 @@ import tkinter.font
 from tkinter import filedialog
 import tkinter as tk
 from tkinter import ttk
-import unittest
-from unittest import mock
 # local files
+import acquisition_pipeline
 import change_toplevel as change_top
+import data_trace
 import make_voltage_lines
 import properties
 import pyplot_data_class as data_class
+import resistance_fit
+import session_file
 import tkinter_pyplot
+import toplevels
 import usb_comm  # typehinting
 
 __author__ = 'Kyle Vitautas Lopin'
@@ -36,6 +39,7 @@ class CVFrame(ttk.Frame):
     Frame to hold all the widgets and information to perform
     cyclic voltammetry experiments
     """
+    technique = "CV"  # what the runs are saved as
 
     def __init__(self, master, parent_notebook, graph_properties, bg=OPTIONS_BACKGROUND,
                  initialize=True):
@@ -50,7 +54,7 @@ class CVFrame(ttk.Frame):
         self.master = master
         # TODO: put device_params and graph params all in 1 place
         self.settings = master.device_params.cv_settings
-        print(f"settings: {self.settings}")
+        logging.debug("settings: %s", self.settings)
         self.data = data_class.PyplotData()
         self.graph = self.make_graph_area(master, graph_properties)  # make graph
         self.graph.pack(side='left', expand=True, fill=tk.BOTH)
@@ -65,13 +69,10 @@ class CVFrame(ttk.Frame):
                                                        self.graph, master.device_params,
                                                        self.device)
         self.cv_settings_frame.pack(side="top", fill=tk.X)
-        # initialize the device so the user can hit the run button
+        # initialize the device so the user can hit the run button, after giving time for the
+        # calibration data to be processed, without blocking the GUI from starting
         if initialize:
-            time.sleep(0.4)  # give time for the calibration data to be processed
-            self.device.send_cv_parameters()
-            time.sleep(0.1)
-            master.device.usb_write("L|3")
-            time.sleep(0.1)
+            master.after(400, self.initialize_device)
         # make the buttons the user can use in the CV experiments
         # make a button to run a cyclic voltammetry scan
         self.run_button = tk.Button(
@@ -83,6 +84,12 @@ class CVFrame(ttk.Frame):
         # that don't need to be bound to self
         self.make_cv_buttons(buttons_frame, self.graph)
 
+    def initialize_device(self):
+        """ Send the CV settings to the device so the user can hit the run button """
+        self.device.send_cv_parameters()
+        self.master.after(100, self.master.device.send_state, 'electrode_config',
+                          self.master.device.command('electrode_config', 3))
+
     def make_graph_area(self, master, graph_props):
         """ Make the graph area to display the cyclic voltammetry data.
         Use matplotlib if it is available or else plot in a tk Canvas
@@ -91,7 +98,7 @@ class CVFrame(ttk.Frame):
         :param graph_props: dictionary fo properties on how the graph looks
         :return: the graph object, currently a PyplotEmbed class from tkinter_pyplot
         """
-        if check_display_type() == 'matplotlib':
+        if tkinter_pyplot.check_display_type() == 'matplotlib':
             # current_lim = 1.2 * 1000. / master.device_params.adc_tia.tia_resistor
             current_lim = master.device_params.adc_tia.current_lims
             low_voltage = self.settings.low_voltage
@@ -140,28 +147,13 @@ class CVFrame(ttk.Frame):
         #           text="Read Message",
         #           command=lambda: self.print_usb_message(device)).pack(side='bottom',
         #                                                                fill=tk.BOTH)
-        # experimental button to try chronoamperometry experiments
-        # tk.Button(_frame,
-        #           text="Chronoamp",
-        #           command=lambda: self.chrono_hack(device)).pack(side='bottom',
-        #                                                          fill=tk.BOTH)
-
-    def chrono_hack(self, device):
-        """ Hack to get a chronoamperometry experiment to run, inactivate the
-        button when released
-        :param device: USBHandler to handle device communications
-        """
-        self.master.device.usb_write("Q|1024|1524|02399")
-        device.params.cv_settings.delay_time = 5000
-        device.run_chrono = True
-        self.graph.resize_x(0, 4000)
 
     @staticmethod
     def print_usb_message(device):
         """ For developing, check if a message is waiting in the usb
         :param device:  usb device to read
         """
-        print(device.usb_read_message())
+        logging.info("usb message: %s", device.usb_read_message())
 
     def change_data_labels(self):
         """ Call a toplevel to allow the user to change data labels in the legend
@@ -188,43 +180,61 @@ class CVFrame(ttk.Frame):
 
         # Confirm that the user supplied a file
         if _file:
-            self.data.save_all_data(_file, self.master.data_save_type)
+            with _file:
+                self.data.save_all_data(_file, self.master.data_save_type)
+            self.master.catalog_runs(_file.name, 'csv', self.session_runs())
+
+    def fit_resistance(self):
+        """ Fit a line to each run shown and show the resistance of each, to check the TIA
+        and route resistances of a board with a resistor in place of the electrodes
+        """
+        if self.data.index == 0:
+            logging.info("No data to fit")
+            return
+        results = resistance_fit.fit_data(self.data)
+        toplevels.ResultsTable(self.master, "Resistance fits", results['label'],
+                               [("resistance (ohms)", results['resistance']),
+                                (u"intercept (\u00B5A)", results['intercept']),
+                                (u"residual (\u00B5A)", results['residual']),
+                                ("points", results['points'])])
+
+    def session_runs(self):
+        """ Make the runs to save in a session file
+        :return: list of run dicts for session_file.save_session
+        """
+        return session_file.runs_from_pyplot_data(self.data, self.technique)
 
     def delete_all_data(self):
         """ Clear all the lines in the graph and reset the data
         :return:
         """
+        # clear the data in place as the graph has a reference to it, before the lines are
+        # deleted so the legend is remade without the old labels
+        self.data.clear()
         self.graph.delete_all_lines()
-        self.data = data_class.PyplotData()
 
     def user_select_delete_some_data(self):
         """ The user wants to delete some data, call a top level to handle this
         """
         change_top.UserSelectDataDelete(self)
 
-    def open_data(self, csv_reader_file, first_line):
-        """ Open a csv file that has the data saved in it, in the same
-        format as this program saves the data.
-        NOTE:
-        _data_hold - holds the data as its being pulled from the file with the structure
-        _data_hold = [ [x-data-array], [y1-data-array], [y2-data-array], .., [yn-data] ]
-        :param csv_reader_file: csv reader object with the data in it
-        :param first_line: first line read from the csv reader
+    def open_data(self, saved_data):
+        """ Add the data read from a saved file to self.data and display all of it, the graph is
+        redrawn once and the user is not asked for labels as the file has them
+        :param saved_data: dict from pyplot_data_class.read_csv_data with the keys 'x', 'y',
+        'labels' and 'notes', session files also have 'raw', 'run_info' and 'colors'
         """
         logging.debug("opening data in cv frame")
-        _data_hold = []  # buffer to hold the data we read from the file
-
-        for i in range(len(first_line)):
-            _data_hold.append([])  # add a list to store the column data
-
-        _ = csv_reader_file.next()  # dump the line with notes
-
-        for row in csv_reader_file:
-            for i, data in enumerate(row):
-                _data_hold[i].append(float(data))
-        # go through each data line and add it to self.data
-        for i in range(1, len(first_line)):
-            self.graph.update_data(_data_hold[0], _data_hold[i], label=first_line[i])
+        if not saved_data['y']:
+            return
+        first_index = self.data.index
+        self.data.add_runs(saved_data['x'], saved_data['y'],
+                           saved_data['labels'], saved_data['notes'],
+                           saved_data.get('raw'), saved_data.get('run_info'))
+        if saved_data.get('colors'):  # a run saved without a color gets the next in the cycle
+            del self.data.colors[first_index:]
+            self.data.colors.extend(saved_data['colors'])
+        self.graph.display_runs(first_index)
 
     def set_tia_current_lim(self, _value, current_limit):
         self.cv_settings_frame.set_current_var_str(_value)
@@ -247,7 +257,6 @@ class CVFrame(ttk.Frame):
             self.params = master.device_params
             self.settings = master.device_params.cv_settings
             self.usb_packet_count = 0  # how many usb reading to make
-            self.run_chrono = False  # Hack for testing chrono amperometry experiments
             self.run_button = None  # placeholder, the first run will assign it
 
         def send_cv_parameters(self):
@@ -259,8 +268,7 @@ class CVFrame(ttk.Frame):
             device.params.sweep_rate - the speed (in V/s) that the voltage should be
             changed
 
-            Note: the values sending to the device have to be padded with 0's,
-            so they are the proper size for the device to interpret
+            Note: the command is encoded by the device's codec, see commands.py
 
             :return: will update to the device.params the following values
             usb_packet_count; which is how many data packets to expect
@@ -271,12 +279,9 @@ class CVFrame(ttk.Frame):
             logging.debug("sending cv params here")
             # convert the values into the values the device needs
             # this part is done on the computer side to save MCU code length
-            formatted_start_volt, start_dac_value = \
-                self.format_voltage_with_gnd(self.settings.start_voltage)
-            formatted_end_volt, end_dac_value = \
-                self.format_voltage_with_gnd(self.settings.end_voltage)
-            formatted_freq_divider, pwm_period = \
-                    self.format_divider(self.settings.sweep_rate)
+            start_dac_value = self.format_voltage_with_gnd(self.settings.start_voltage)
+            end_dac_value = self.format_voltage_with_gnd(self.settings.end_voltage)
+            pwm_period = self.format_divider(self.settings.sweep_rate)
 
             self.params.PWM_period = pwm_period
 
@@ -285,24 +290,21 @@ class CVFrame(ttk.Frame):
                                  self.settings.sweep_start_type[0]
 
             if self.settings.use_swv:
-                formatted_inc, increment = self.format_voltage(self.settings.swv_inc)
-                formatted_swv_height, swv_height = \
-                    self.format_voltage(self.settings.swv_height)
-                formatted_freq_divider, pwm_period = \
-                    self.format_divider(int(self.settings.swv_period/2))
-                print(f"pwm period: {pwm_period}, freq divider: {formatted_freq_divider}, "
-                      f"swv period: {self.settings.swv_period}")
-                #TODO: put all the different letter commands in seperate file
-                to_amp_device = '|'.join(["G", formatted_start_volt, formatted_end_volt,
-                                          formatted_inc, formatted_swv_height,
-                                          formatted_freq_divider, sweep_type_to_send])
+                increment = self.format_voltage(self.settings.swv_inc)
+                swv_height = self.format_voltage(self.settings.swv_height)
+                pwm_period = self.format_divider(int(self.settings.swv_period/2))
+                logging.debug("pwm period: %s, swv period: %s", pwm_period,
+                              self.settings.swv_period)
+                to_amp_device = self.device.command('swv_sweep', start_dac_value, end_dac_value,
+                                                    increment, swv_height, pwm_period,
+                                                    sweep_type_to_send)
             else:
                 # send those values to the device in the proper format for the PSoC
-                to_amp_device = '|'.join(["S", formatted_start_volt,
-                                          formatted_end_volt, formatted_freq_divider,
-                                          sweep_type_to_send])
+                to_amp_device = self.device.command('cv_sweep', start_dac_value, end_dac_value,
+                                                    pwm_period, sweep_type_to_send)
                 increment = 1
-            print(end_dac_value, start_dac_value, increment)
+            logging.debug("dac values end: %s, start: %s, increment: %s", end_dac_value,
+                          start_dac_value, increment)
             # save how many data packets should be received back from the usb
             packet_count = ((2 * abs(end_dac_value - start_dac_value + 1) / increment)
                             / (float(USB_IN_BYTE_SIZE) / 2.0))  # data is 2 bytes long
@@ -316,12 +318,13 @@ class CVFrame(ttk.Frame):
             # TODO: figure out if this is working
             self.params.actual_low_volt = (- start_dac_value + start_dac_value
                                            % self.params.dac.voltage_step_size)
-            time.sleep(0.5)
-            self.device.usb_write(to_amp_device)
-            time.sleep(0.01)
+            # only upload the look up table if the device does not already have it
+            if not self.device.state.is_current('lut', to_amp_device):
+                time.sleep(0.5)
+                self.device.send_state('lut', to_amp_device)
+                time.sleep(0.01)
             # Write to the timing PWM compare register so the dac adc timing is correct
             compare_value = pwm_period / 2
-            print("test2")
             self.device.write_timer_compare(compare_value)
             return 1
 
@@ -345,14 +348,15 @@ class CVFrame(ttk.Frame):
             :param _delay: int
             :return: binds the data to the master instead of returning anything
             """
-            if self.device.last_experiment != "CV":  # the look-up table is not correct
-                self.send_cv_parameters()
-                self.device.set_last_run = "CV"
+            # make sure the device has the CV look up table, this only sends it if another
+            # experiment or a settings change replaced it
+            self.send_cv_parameters()
+            self.device.set_last_run("CV")
             # bind button to self, so it can be put active again
             self.run_button = run_button
             # inactive the button so the user can't hit it twice
             self.run_button.config(state='disabled')
-            self.device.usb_write('R')  # step 1
+            self.device.send_command('run')  # step 1
             if self.device.connected:
                 logging.debug("device reading")
                 # amount of time to wait for the data to be collected before getting it
@@ -361,7 +365,7 @@ class CVFrame(ttk.Frame):
                 if not _delay:
                     _delay = int(200 + self.params.cv_settings.delay_time)
                 # step 2
-                print(f"delay time: {_delay}")
+                logging.debug("delay time: %s", _delay)
                 self.master.after(int(_delay), lambda: self.run_scan_continue(canvas))
             else:
                 logging.debug("Couldn't find out endpoint to send message to run")
@@ -371,52 +375,88 @@ class CVFrame(ttk.Frame):
             """ The callback for run_scan.  This is called after the device
             should be done with the scan and is ready to export the data.
             The parts of the run cyclic voltammetry scan this functions run
-            is part 3-5 listed in run_scan.
+            is part 3-5 listed in run_scan, the reading is done in a background thread
+            so the program does not freeze while the data is read.
             param canvas: the widget that is called to display the data
             param fail_count: int, running count of how many attempts have been tried
             """
+            acquisition_pipeline.run_in_background(
+                self.master, self.read_scan,
+                lambda scan: self.show_scan(canvas, scan, fail_count))
+
+        def read_scan(self):
+            """ Check if the device is done with the scan and read the data if it is, runs in
+            a background thread so it can not use tkinter
+            :return: tuple of the raw adc counts and the currents, or None if the device is not
+            done with the scan
+            """
             check_message = self.device.usb_read_data(encoding='str')  # step 3
-            print(f"got check message: {check_message}")
-            if COMPLETE_MESSAGE in check_message:
-                self.get_and_display_data(canvas)
-            else:
-                # wait a little longer and retry
-                if fail_count < FAIL_COUNT_THRESHOLD:  # retry step 2
-                    self.master.after(FAILURE_DELAY,
-                                      lambda: self.run_scan_continue(canvas,
-                                                                     fail_count + 1))
-                logging.error("Failed to run the scan")
+            logging.debug("got check message: %s", check_message)
+            if not check_message or COMPLETE_MESSAGE not in check_message:
+                return None
+            return self.read_data()
+
+        def show_scan(self, canvas, scan, fail_count):
+            """ Display the data read_scan got, or try again if the device was not done
+            :param canvas: the widget that is called to display the data
+            :param scan: what read_scan returned
+            :param fail_count: int, running count of how many attempts have been tried
+            """
+            if scan is not None:
+                self.display_data(canvas, *scan)
+                return
+            # wait a little longer and retry
+            if fail_count < FAIL_COUNT_THRESHOLD:  # retry step 2
+                self.master.after(FAILURE_DELAY,
+                                  lambda: self.run_scan_continue(canvas, fail_count + 1))
+            logging.error("Failed to run the scan")
 
         def get_and_display_data(self, canvas, _channel=None):
             """ Get the data from the device and display it on the pyplot display
             :param canvas: where the data is to be displayed
             :param _channel: which adc channel to read
             """
+            self.display_data(canvas, *self.read_data(_channel))
+
+        def read_data(self, _channel=None):
+            """ Get the data of a scan from the device and convert it to currents
+            :param _channel: which adc channel to read
+            :return: tuple of the raw adc counts and the currents, the currents are None if no
+            data was read
+            """
             if not _channel:
                 # if no channel sent, use the one saved in parameters dict
                 _channel = self.params.adc_tia.adc_channel
 
             # the correct complete message was received so attempt to collect the data
-            self.device.usb_write('E' + str(_channel))  # step 4
+            self.device.send_command('export', int(_channel))  # step 4
 
             # Get the raw data from the ADC.
             # this has to be modified to get the actual current values
-            if self.run_chrono:
-                self.usb_packet_count = 125
             raw_data = self.device.get_data(self.usb_packet_count)
-            print(f'raw data got {self.usb_packet_count} packets')
-            print(f"raw data: {raw_data}")
-            print(f"len raw data: {len(raw_data)}")
-            raw_data.pop(0)
-            self.run_button.config(state='active')
+            data_trace.event(data_trace.DEBUG, "cv read", "%s points from %s packets",
+                             len(raw_data), self.usb_packet_count)
+            if raw_data:
+                raw_data.pop(0)
             if not raw_data:  # if something is wrong just return
-                return
+                return raw_data, None
             # call function to convert the raw ADC values into the current that passed
             # through the working electrode
-            print(f"raw data: {raw_data}")
-            self.data = self.device.process_data(raw_data, swv=self.params.cv_settings.use_swv)
+            return raw_data, self.device.process_data(raw_data,
+                                                      swv=self.params.cv_settings.use_swv)
 
-            print(f"processed data: {self.data}")
+        def display_data(self, canvas, raw_data, data):
+            """ Display the data of a scan
+            :param canvas: where the data is to be displayed
+            :param raw_data: list of the adc counts read
+            :param data: list of the currents
+            """
+            self.run_button.config(state='active')
+            if not raw_data:  # if something is wrong just return
+                return
+            self.data = data
+
+            data_trace.event(data_trace.PACKET, "cv currents", "%s", self.data)
             # if self.params.cv_settings.sweep_type == "DPV":
             #     # hack the data
             #     print(self.data)
@@ -428,7 +468,6 @@ class CVFrame(ttk.Frame):
             #     self.data = new_data
 
             # make the voltages for the x-axis that correspond to the currents read
-            print(dir(self.params.cv_settings))
             if self.params.cv_settings.use_swv:
                 increment = self.params.cv_settings.swv_inc
                 swv_pulse_height = self.params.cv_settings.swv_height
@@ -442,20 +481,17 @@ class CVFrame(ttk.Frame):
                 increment, self.params.cv_settings.sweep_type,
                 self.params.cv_settings.sweep_start_type, swv_pulse_height)
 
-            print(f"xline: {x_line}")
-            print(f"len xline: {len(x_line)}")
-            if self.run_chrono:  # HACK to test chronoamp experiments
-                x_line = range(4001)
+            data_trace.event(data_trace.DEBUG, "cv voltages", "%s points", len(x_line))
             # Send data to the canvas where it will be saved and displayed
-            canvas.update_data(x_line, self.data, raw_data)  # send raw data for testing purposes
+            canvas.update_data(x_line, self.data, raw_data,  # send raw data for testing purposes
+                               run_info=self.params.run_info("CV"))
 
         def format_divider(self, _sweep_rate):
             """ Take in the users desired sweet rate and convert it to the number needed to input
             into the PWM used to set the time between the interrupts that change the dac values
             (_sweep_rate * 1000) is used to convert the sweep rate from V/s to mV/s
             :param _sweep_rate: the users desired sweep rate
-            :return: integer that is to be put into the interrupt PWM timer that's padded with
-            zeros to be 5 integers long to properly send it to the device
+            :return: integer that is to be put into the interrupt PWM timer
             """
             clk_freq = self.params.clk_freq_isr_pwm
             cv_params = self.params.cv_settings
@@ -468,36 +504,33 @@ class CVFrame(ttk.Frame):
                 # voltage steps per second: this is how many clk ticks between each interrupt
                 raw_divider = int(round(clk_freq /
                                         (_sweep_rate * 1000 / self.params.dac.voltage_step_size)) - 1)
-            return '{0:05d}'.format(raw_divider), raw_divider
+            return raw_divider
 
         def format_voltage(self, _in_volts):
             """ Takes in the voltage (in milli volts) the user wants to apply to step the electrode
             for the pulse voltammetry techniques
 
             :param _in_volts: user desired electrode voltage **step** value in milli volts
-            :return: integer that is the dac is to be stepped with, padded with zeros to be 4
-            values long to be transmitted to the device
+            :return: integer that is the dac is to be stepped with
             """
             dac_value = self.params.dac.get_dac_count(_in_volts)
 
             if dac_value == 0:
                 dac_value = 1
-            print(f"formated dac to {dac_value}, from {_in_volts}")
-            return '{0:04d}'.format(dac_value), dac_value
+            logging.debug("formatted dac to %s, from %s", dac_value, _in_volts)
+            return dac_value
 
         def format_voltage_with_gnd(self, _in_volts):
             """ Takes in the voltage (in millivolts) the user wants to apply to the electrode and
             convert it to the integer that represent the value to be put into the dac
             :param _in_volts: user desired electrode voltage value in millivolts
-            :return: integer that is the value to be put into the dac, padded with zeros to be 4
-            values long to be transmitted to the device
+            :return: integer that is the value to be put into the dac
             """
             # shift the user's voltage by the amount of the virtual ground
             input_voltage = self.params.virtual_ground_shift - _in_volts  # mV
             # get the value needed (number of increments needed to get desired voltage, ex. desire
-            # 500mV with 1 mV increments then put in 500) to put into the dac and pad it with zeros
-            dac_value = self.params.dac.get_dac_count(input_voltage)
-            return '{0:04d}'.format(dac_value), dac_value
+            # 500mV with 1 mV increments then put in 500) to put into the dac
+            return self.params.dac.get_dac_count(input_voltage)
 
         def set_adc_tia(self, *args):
             self.device.set_adc_tia(*args)
@@ -606,24 +639,16 @@ def open_file(_type, tkFileDialog=None):
     # Make the options for the save file dialog box for the user
     file_opt = options = {}
     options['defaultextension'] = ".csv"
-    options['filetypes'] = [('All files', '*.*'), ("Comma separate values", "*.csv")]
+    options['filetypes'] = [('All files', '*.*'), ("Comma separate values", "*.csv"),
+                            ("Session", "*" + session_file.SESSION_EXTENSION)]
     if _type == 'saveas':
         # Ask the user what name to save the file as
         _file = filedialog.asksaveasfile(mode='w', **file_opt)
+    elif _type == 'save_session':
+        options['defaultextension'] = session_file.SESSION_EXTENSION
+        options['filetypes'] = [("Session", "*" + session_file.SESSION_EXTENSION)]
+        return filedialog.asksaveasfilename(**file_opt)
     elif _type == 'open':
         _filename = filedialog.askopenfilename(**file_opt)
         return _filename
     return _file
-
-
-def check_display_type():
-    """ Check if matplotlib graph can be used,
-    :return: type that can be used to make display graph, matplotlib or canvas as a string
-    """
-    try:
-        import matplotlib
-        import matplotlib.pyplot
-        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-        return "matplotlib"
-    except ImportError:
-        return "canvas"
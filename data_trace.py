@@ -0,0 +1,196 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Structured tracing of the data path, used in place of print calls.
+
+Each trace event has a level, an event name and a logging style message with its arguments:
+
+    data_trace.event(data_trace.PACKET, "serial read", "%s bytes, asked for %s", len(data),
+                     data_length)
+
+Tracing is off by default and event returns before any formatting is done, so in normal use
+the data path only pays for a level check.  Turn it on with set_level, or with the
+environment variable LEVEL_VARIABLE set to a level name (e.g. POTENTIOSTAT_TRACE=PACKET)
+before the program starts.  Events are sent to the LOGGER_NAME logger with the event name in
+the record's trace_event attribute, the logging configuration decides where they go.
+
+Per packet events can be sampled with set_sampling so only 1 in N of them is logged.
+
+For debugging the data itself start_capture saves the raw bytes and arrays passed to capture
+to a binary file instead of formatting them as text.  Each record is a RECORD_HEADER with the
+monotonic time, the lengths of the event name, dtype and payload, then the name, the numpy
+dtype string ('' for bytes) and the payload.  read_capture reads the records back.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import logging
+import os
+import struct
+import threading
+import time
+# installed libraries
+import numpy as np
+
+LEVEL_VARIABLE = "POTENTIOSTAT_TRACE"
+LOGGER_NAME = "potentiostat.trace"
+
+# levels, the same numbers as the logging module with PACKET for every packet or sample
+PACKET = 5
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+OFF = logging.CRITICAL + 10
+LEVEL_NAMES = {'PACKET': PACKET, 'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'OFF': OFF}
+
+RECORD_HEADER = struct.Struct("<dHHI")  # time, name length, dtype length, payload length
+
+logging.addLevelName(PACKET, 'PACKET')
+_logger = logging.getLogger(LOGGER_NAME)
+_level = LEVEL_NAMES.get(os.environ.get(LEVEL_VARIABLE, "OFF").upper(), OFF)
+_sampling = {}  # event name: log 1 in this many events
+_sample_counts = {}
+_capture = None
+_capture_lock = threading.Lock()
+
+
+def set_level(level):
+    """ Set the lowest level of the events that are logged
+    :param level: one of the level numbers or a name in LEVEL_NAMES, OFF to stop tracing
+    """
+    global _level
+    _level = LEVEL_NAMES[level.upper()] if isinstance(level, str) else level
+
+
+def get_level():
+    return _level
+
+
+def get_level_name():
+    """ Get the name in LEVEL_NAMES of the level, or its number as a string """
+    for name, level in LEVEL_NAMES.items():
+        if level == _level:
+            return name
+    return str(_level)
+
+
+def is_enabled(level=PACKET):
+    """ Check if events of a level are logged, to skip work done only for the trace """
+    return level >= _level
+
+
+def set_sampling(name, every):
+    """ Only log 1 in every events with the event name
+    :param name: event name
+    :param every: int, 1 to log every event
+    """
+    _sample_counts.pop(name, None)
+    if every > 1:
+        _sampling[name] = every
+    else:
+        _sampling.pop(name, None)
+
+
+def event(level, name, message, *args):
+    """ Log a trace event, the message is only formatted if the event is logged
+    :param level: level of the event
+    :param name: event name, e.g. "serial read"
+    :param message: logging style message
+    :param args: arguments of the message
+    """
+    if level < _level:
+        return
+    every = _sampling.get(name)
+    if every:
+        number = _sample_counts.get(name, 0)
+        _sample_counts[name] = number + 1
+        if number % every:
+            return
+    _logger.log(level, "%s: " + message, name, *args, extra={'trace_event': name})
+
+
+def start_capture(filename):
+    """ Save the payloads passed to capture to a binary file, stops any capture already
+    running """
+    global _capture
+    stop_capture()
+    with _capture_lock:
+        _capture = open(filename, 'wb')
+
+
+def stop_capture():
+    global _capture
+    with _capture_lock:
+        if _capture:
+            _capture.close()
+        _capture = None
+
+
+def is_capturing():
+    return _capture is not None
+
+
+def capture(name, payload):
+    """ Add a record to the capture file, if one is open
+    :param name: event name
+    :param payload: bytes, a numpy array or a list of ints (saved as int16)
+    """
+    if _capture is None:
+        return
+    record = encode_record(name, payload)
+    with _capture_lock:  # check again, stop_capture can close the file from another thread
+        if _capture is not None:
+            _capture.write(record)
+
+
+def write_record(_file, name, payload, timestamp=None):
+    """ Write one capture record to an open binary file
+    :param _file: file opened in binary write mode
+    :param name: event name
+    :param payload: bytes, a numpy array or a list of ints (saved as int16)
+    :param timestamp: time.monotonic() of the record, None for now
+    """
+    _file.write(encode_record(name, payload, timestamp))
+
+
+def encode_record(name, payload, timestamp=None):
+    """ Make the bytes of one capture record
+    :param name: event name
+    :param payload: bytes, a numpy array or a list of ints (saved as int16)
+    :param timestamp: time.monotonic() of the record, None for now
+    :return: bytes of the header, name, dtype and payload
+    """
+    if isinstance(payload, (bytes, bytearray)):
+        dtype = b""
+        data = bytes(payload)
+    else:
+        array = np.asarray(payload)
+        if array.dtype == object or array.dtype.kind in 'iu' and isinstance(payload, list):
+            array = array.astype(np.int16)
+        dtype = array.dtype.str.encode()
+        data = array.tobytes()
+    name = name.encode()
+    header = RECORD_HEADER.pack(time.monotonic() if timestamp is None else timestamp,
+                                len(name), len(dtype), len(data))
+    return header + name + dtype + data
+
+
+def read_capture(filename):
+    """ Read the records of a capture file
+    :param filename: name of the file
+    :return: generator of tuples of the time, event name and payload (bytes or numpy array)
+    """
+    with open(filename, 'rb') as _file:
+        while True:
+            header = _file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, name_length, dtype_length, length = RECORD_HEADER.unpack(header)
+            name = _file.read(name_length).decode()
+            dtype = _file.read(dtype_length).decode()
+            data = _file.read(length)
+            if len(data) < length:
+                logging.warning("capture %s ends in the middle of a record", filename)
+                return
+            yield timestamp, name, np.frombuffer(data, dtype=dtype) if dtype else data
@@ -0,0 +1,175 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Local SQLite catalog of every run that is saved, so runs can be found by their settings
+without opening each saved file.
+
+Each row is one run: the file it was saved in and where in the file it is, the technique,
+label and notes, the calibration and current range and the protocol settings listed in
+properties.RUN_INFO_SETTINGS.  The columns that are searched on most are indexed.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import json
+import logging
+import os
+import sqlite3
+import time
+
+# local files
+import properties
+import pyplot_data_class as data_class
+import session_file
+
+CATALOG_FILE = "experiment_catalog.db"
+
+# calibration values from DeviceParameters.run_info
+CALIBRATION_COLUMNS = ['counts_to_current', 'shift', 'tia_resistor', 'adc_gain', 'adc_config',
+                       'current_range', 'dac_source']
+SETTINGS_COLUMNS = sorted(set(key for keys in properties.RUN_INFO_SETTINGS.values()
+                              for key in keys))
+INDEXED_COLUMNS = ['technique', 'run_time', 'sweep_rate', 'current_range', 'label']
+# columns searched with LIKE instead of =
+TEXT_SEARCH_COLUMNS = ['label', 'notes', 'file']
+FLOAT_TOLERANCE = 1e-9
+
+
+class ExperimentCatalog(object):
+    """ Catalog of saved runs in a SQLite database """
+    def __init__(self, filename=CATALOG_FILE):
+        """ Open the catalog, making the database if it is not there
+        :param filename: name of the database file, ':memory:' makes a temporary catalog
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.row_factory = sqlite3.Row
+        self.columns = (['file', 'file_type', 'run_index', 'technique', 'label', 'notes',
+                         'run_time', 'saved_time', 'run_info'] +
+                        CALIBRATION_COLUMNS + SETTINGS_COLUMNS)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS runs "
+                                    "(id INTEGER PRIMARY KEY, {0})".format(
+                                        ", ".join(self.columns)))
+            for column in INDEXED_COLUMNS:
+                self.connection.execute("CREATE INDEX IF NOT EXISTS idx_{0} ON runs "
+                                        "({0})".format(column))
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_file ON runs "
+                                    "(file, run_index)")
+
+    def add_runs(self, filename, file_type, runs):
+        """ Add the runs saved in a file, any runs the catalog had for the file are removed as
+        the file was overwritten
+        :param filename: name of the file the runs were saved in
+        :param file_type: str - 'csv' or 'session'
+        :param runs: list of dicts with the keys 'technique', 'label', 'notes' and 'run_info', in
+        the order they are in the file
+        """
+        filename = os.path.abspath(filename)
+        saved_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for run_index, run in enumerate(runs):
+            run_info = run.get('run_info') or {}
+            row = {'file': filename, 'file_type': file_type, 'run_index': run_index,
+                   'technique': run['technique'], 'label': run['label'],
+                   'notes': run.get('notes', " "), 'run_time': run_info.get('time'),
+                   'saved_time': saved_time, 'run_info': json.dumps(run_info)}
+            for column in CALIBRATION_COLUMNS + SETTINGS_COLUMNS:
+                row[column] = run_info.get(column)
+            rows.append([row[column] for column in self.columns])
+        with self.connection:  # one transaction for all the runs
+            self.connection.execute("DELETE FROM runs WHERE file = ?", (filename,))
+            self.connection.executemany("INSERT INTO runs ({0}) VALUES ({1})".format(
+                ", ".join(self.columns), ", ".join(len(self.columns) * ["?"])), rows)
+        logging.debug("cataloged %i runs from %s", len(rows), filename)
+
+    def add_pyplot_data(self, filename, data, technique):
+        """ Add the runs of a PyplotData that were saved to a csv file
+        :param filename: name of the csv file
+        :param data: pyplot_data_class.PyplotData that was saved
+        :param technique: str - 'CV' or 'ASV'
+        """
+        self.add_runs(filename, 'csv',
+                      [{'technique': technique, 'label': data.label[i], 'notes': data.notes[i],
+                        'run_info': data.run_info[i]} for i in range(data.index)])
+
+    def query(self, technique=None, since=None, until=None, order_by='run_time', **filters):
+        """ Find runs in the catalog
+        :param technique: str - 'CV', 'ASV' or 'amp', None finds all techniques
+        :param since: str - 'YYYY-MM-DD HH:MM:SS' or the start of it, earliest run time to find
+        :param until: str - same format as since, latest run time to find
+        :param order_by: column to sort the runs by
+        :param filters: column=value to match, numbers are matched to within a small
+        tolerance and label, notes and file match any part of the text
+        :return: list of sqlite3.Row of the runs found, the columns can be used as keys
+        """
+        conditions = []
+        values = []
+        if technique:
+            filters['technique'] = technique
+        for column, value in filters.items():
+            if column not in self.columns:
+                raise ValueError("Catalog has no column named {0}".format(column))
+            if column in TEXT_SEARCH_COLUMNS:
+                conditions.append("{0} LIKE ?".format(column))
+                values.append("%{0}%".format(value))
+            elif isinstance(value, float):
+                conditions.append("ABS({0} - ?) <= ?".format(column))
+                values.extend([value, FLOAT_TOLERANCE + FLOAT_TOLERANCE * abs(value)])
+            else:
+                conditions.append("{0} = ?".format(column))
+                values.append(value)
+        if since:
+            conditions.append("run_time >= ?")
+            values.append(since)
+        if until:
+            # compare only as much of the time as given so until='2023-05-31' includes that day
+            conditions.append("substr(run_time, 1, ?) <= ?")
+            values.extend([len(until), until])
+        if order_by not in self.columns:
+            raise ValueError("Catalog has no column named {0}".format(order_by))
+        command = "SELECT * FROM runs"
+        if conditions:
+            command += " WHERE " + " AND ".join(conditions)
+        command += " ORDER BY {0}, file, run_index".format(order_by)
+        return self.connection.execute(command, values).fetchall()
+
+    def load(self, rows, data=None):
+        """ Load the runs found with query into a PyplotData, each file is only read once
+        :param rows: list of rows from query
+        :param data: pyplot_data_class.PyplotData to add the runs to, None makes a new one
+        :return: the PyplotData with the runs added
+        """
+        if data is None:
+            data = data_class.PyplotData()
+        files = {}  # group the runs by the file they are in, keeping the order of the rows
+        for row in rows:
+            files.setdefault((row['file'], row['file_type']), []).append(row)
+        runs = {'x': [], 'y': [], 'labels': [], 'notes': [], 'raw': [], 'run_info': []}
+        sessions = []
+        for (filename, file_type), file_rows in files.items():
+            if file_type == 'session':
+                session = session_file.SessionFile(filename)
+                sessions.append(session)
+                saved_data = session.saved_data(None, [row['run_index'] for row in file_rows])
+                runs['raw'].extend(saved_data['raw'])
+            else:
+                saved_data = data_class.read_csv_data(filename)
+                saved_data = {key: [saved_data[key][row['run_index']] for row in file_rows]
+                              for key in ('x', 'y')}
+                runs['raw'].extend(len(file_rows) * [None])
+            runs['x'].extend(saved_data['x'])
+            runs['y'].extend(saved_data['y'])
+            runs['labels'].extend(row['label'] for row in file_rows)
+            runs['notes'].extend(row['notes'] for row in file_rows)
+            runs['run_info'].extend(json.loads(row['run_info']) for row in file_rows)
+        if runs['y']:
+            data.add_runs(runs['x'], runs['y'], runs['labels'], runs['notes'], runs['raw'],
+                          runs['run_info'])
+        for session in sessions:  # add_runs copied the data out of the memory maps
+            session.close()
+        return data
+
+    def close(self):
+        self.connection.close()
@@ -17,6 +17,12 @@ class GraphProps(object):
                          'ylim': "[-.1,1]",
                          'title': "'Amperometry time course'",
                          'subplots_adjust': "bottom=0.15, left=0.12"}
+        self.chrono_plot = {'xlabel': "'time (s)'",
+                            'ylabel': "u'current (\u00B5A)'",
+                            'xlim': "[0, 10]",
+                            'ylim': "[-.1,1]",
+                            'title': "'Chronoamperometry'",
+                            'subplots_adjust': "bottom=0.15, left=0.12"}
         self.cv_plot = {'xlabel': "'voltage (mV)'",
                         'ylabel': "u'current (\u00B5A)'",
                         'title': "'Cyclic Voltammetry'",
@@ -0,0 +1,208 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Time the stages of the data path (serial write and read, decode, convert, voltage profile,
+data store append and graph draw) and keep a latency histogram and counters for each stage.
+
+Use stage as a context manager or timed as a decorator:
+
+    with instrumentation.stage(instrumentation.SERIAL_READ):
+        data = self.device.read(data_length)
+
+    @instrumentation.timed(instrumentation.CONVERT)
+    def process_data(self, _raw_data, swv=False):
+
+It is off by default.  When it is off stage returns the same do nothing context manager each
+time and timed calls the function straight away, so the only cost is checking a flag.  Turn it
+on from the Developers menu, with enable(), or by setting the environment variable
+ENABLE_VARIABLE before the program starts.  report and format_report give the results, dump
+saves them to a json file.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+ENABLE_VARIABLE = "POTENTIOSTAT_INSTRUMENTATION"
+
+SERIAL_WRITE = "serial write"
+SERIAL_READ = "serial read"
+DECODE = "decode"
+CONVERT = "convert"
+PROFILE = "profile generation"
+STORE = "data store append"
+DRAW = "canvas draw"
+
+# upper edge of each histogram bucket in seconds, 1-2-5 steps from 1 us to 10 s, the last
+# bucket holds everything slower
+BUCKET_EDGES = [scale * 10.0 ** power for power in range(-6, 1) for scale in (1, 2, 5)] + [10.0]
+
+_enabled = os.environ.get(ENABLE_VARIABLE, "") not in ("", "0")
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+
+
+class StageHistogram(object):
+    """ Latency histogram of one stage """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKET_EDGES) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKET_EDGES, seconds)] += 1
+
+    def percentile(self, fraction):
+        """ Get the upper edge of the bucket the fraction of the timings fall under
+        :param fraction: float from 0 to 1
+        :return: seconds, the max for the last bucket, 0 if nothing was timed
+        """
+        if not self.count:
+            return 0.0
+        needed = fraction * self.count
+        seen = 0
+        for i, number in enumerate(self.buckets):
+            seen += number
+            if seen >= needed and number:
+                return BUCKET_EDGES[i] if i < len(BUCKET_EDGES) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count, 'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0, 'max': self.max,
+                'p50': self.percentile(0.5), 'p95': self.percentile(0.95),
+                'buckets': list(self.buckets)}
+
+
+class _Stage(object):
+    """ Context manager that times the code in it """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage(object):
+    """ Context manager used when the instrumentation is off, does nothing """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def stage(name):
+    """ Get a context manager that times the code in it as the stage name """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def timed(name):
+    """ Decorator that times each call of the function as the stage name """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def record(name, seconds):
+    """ Add a timing to a stage's histogram """
+    with _lock:
+        histogram = _stages.get(name)
+        if histogram is None:
+            histogram = _stages[name] = StageHistogram(name)
+        histogram.add(seconds)
+
+
+def count(name, number=1):
+    """ Add to a counter, e.g. the bytes read, if the instrumentation is on """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + number
+
+
+def reset():
+    """ Clear all the timings and counters """
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def report():
+    """ Get the results
+    :return: dict with 'stages': dict of stage name: dict of its histogram values, and
+    'counters': dict of counter name: value
+    """
+    with _lock:
+        return {'stages': {name: histogram.as_dict() for name, histogram in _stages.items()},
+                'counters': dict(_counters), 'bucket_edges': list(BUCKET_EDGES)}
+
+
+def format_report():
+    """ Get the results as lines of text, slowest total time first """
+    results = report()
+    lines = ["{0:<20}{1:>9}{2:>12}{3:>12}{4:>12}{5:>12}".format(
+        "stage", "count", "total ms", "mean ms", "p95 ms", "max ms")]
+    for name, values in sorted(results['stages'].items(), key=lambda item: -item[1]['total']):
+        lines.append("{0:<20}{1:>9}{2:>12.2f}{3:>12.3f}{4:>12.3f}{5:>12.3f}".format(
+            name, values['count'], 1000 * values['total'], 1000 * values['mean'],
+            1000 * values['p95'], 1000 * values['max']))
+    for name, value in sorted(results['counters'].items()):
+        lines.append("{0:<20}{1:>9}".format(name, value))
+    return lines
+
+
+def dump(filename):
+    """ Save the results to a json file """
+    with open(filename, 'w') as _file:
+        json.dump(report(), _file, indent=2)
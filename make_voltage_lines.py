@@ -15,7 +15,11 @@ __author__ = "Kyle Vitatus Lopin"
 import logging
 import unittest
 
+# local files
+import instrumentation
 
+
+@instrumentation.timed(instrumentation.PROFILE)
 def make_voltage_profile(start: int, end: int, increment: int,
                          sweep_type="CV", start_volt_type="Zero",
                          swv_height=None):
@@ -0,0 +1,152 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Account for the memory the program holds, to find growth over long sessions.
+
+data_summary gives the bytes each run of a PyplotData uses and what the data blocks hold,
+graph_summary counts the matplotlib artists of a graph and checks it shows the same data as
+its frame, and format_report puts both together for every technique frame that has been made.
+A graph that draws more runs than its data has, or a graph that does not share its frame's
+data, is a leak.
+
+For allocations outside of these, start_tracing starts tracemalloc and each take_snapshot
+gives the source lines that grew the most since the snapshot before it.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import tracemalloc
+
+TRACE_FRAMES = 10  # stack frames tracemalloc keeps for each allocation
+TOP_STATS = 15  # number of source lines take_snapshot reports
+
+_last_snapshot = None
+
+
+def data_summary(data):
+    """ Get the memory use of a PyplotData
+    :param data: pyplot_data_class.PyplotData
+    :return: dict of the number of runs, the block capacity, the bytes used by the runs, the
+    bytes the blocks and voltage axes hold, the number of voltage axes and 'run_bytes': list of
+    the bytes used by each run
+    """
+    run_bytes = data.run_nbytes()
+    return {'runs': data.index, 'capacity': data.capacity,
+            'used_bytes': int(run_bytes.sum()), 'held_bytes': int(data.nbytes),
+            'voltage_axes': data.axis_count,
+            'run_bytes': run_bytes.tolist()}
+
+
+def artist_counts(axis):
+    """ Count the matplotlib artists in an axis
+    :param axis: matplotlib Axes
+    :return: dict of the number of lines, collections, patches, texts, images and legend
+    entries
+    """
+    legend = axis.get_legend()
+    return {'lines': len(axis.lines), 'collections': len(axis.collections),
+            'patches': len(axis.patches), 'texts': len(axis.texts),
+            'images': len(axis.images),
+            'legend_entries': len(legend.get_texts()) if legend else 0}
+
+
+def graph_summary(graph, frame=None):
+    """ Get the artist counts of a tkinter_pyplot.PyplotEmbed and check it against its data
+    :param graph: PyplotEmbed
+    :param frame: technique frame the graph is in, to check they share their data
+    :return: dict of artist_counts, 'traces': number of runs the graph draws, and
+    'shares_data': False if the graph shows different data than the frame holds
+    """
+    summary = artist_counts(graph.graph_area.axis)
+    summary['traces'] = len(graph.traces)
+    summary['shares_data'] = frame is None or getattr(frame, 'data', None) is graph.data
+    return summary
+
+
+def frame_summaries(frames):
+    """ Get the summaries of the technique frames
+    :param frames: dict of the name: frame of the techniques frames made so far
+    :return: dict of the name: dict with the 'data' summary if the frame keeps a PyplotData,
+    'graph' summary if it has a graph and 'samples' if its usb handler keeps a list of samples
+    """
+    summaries = {}
+    for name, frame in frames.items():
+        summary = {}
+        data = getattr(frame, 'data', None)
+        if hasattr(data, 'run_nbytes'):
+            summary['data'] = data_summary(data)
+        graph = getattr(frame, 'graph', None)
+        if graph is not None and hasattr(graph, 'graph_area'):
+            summary['graph'] = graph_summary(graph, frame)
+        # the amperometry and chronoamperometry handlers keep their samples themselves
+        samples = getattr(getattr(frame, 'device', None), 'data', None)
+        if 'data' not in summary and hasattr(samples, '__len__'):
+            summary['samples'] = len(samples)
+        summaries[name] = summary
+    return summaries
+
+
+def format_report(frames):
+    """ Get the summaries of the technique frames as lines of text """
+    lines = []
+    for name, summary in frame_summaries(frames).items():
+        lines.append("{0}:".format(name))
+        if 'data' in summary:
+            data = summary['data']
+            lines.append("  data: {runs} runs (room for {capacity}), {used_bytes:,} bytes used, "
+                         "{held_bytes:,} bytes held, {voltage_axes} voltage axes".format(**data))
+            if data['runs']:
+                lines.append("  bytes per run: " +
+                             ", ".join("{0:,}".format(size) for size in data['run_bytes']))
+        if 'graph' in summary:
+            graph = summary['graph']
+            lines.append("  graph: {traces} runs drawn, {lines} lines, {collections} "
+                         "collections, {texts} texts, {legend_entries} legend entries".format(
+                             **graph))
+            if not graph['shares_data']:
+                lines.append("  WARNING: the graph does not show the frame's data")
+            if 'data' in summary and graph['traces'] > summary['data']['runs']:
+                lines.append("  WARNING: the graph draws more runs than the data has")
+        if 'samples' in summary:
+            lines.append("  samples: {0:,}".format(summary['samples']))
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append("tracemalloc: {0:,} bytes now, {1:,} bytes peak".format(current, peak))
+    return lines
+
+
+def start_tracing(frames=TRACE_FRAMES):
+    """ Start tracemalloc and take the first snapshot to compare the next ones to """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _last_snapshot = _snapshot()
+
+
+def stop_tracing():
+    global _last_snapshot
+    _last_snapshot = None
+    tracemalloc.stop()
+
+
+def take_snapshot(top=TOP_STATS):
+    """ Take a tracemalloc snapshot and compare it to the one before, starts tracing if it
+    was not on
+    :param top: number of source lines to give
+    :return: list of lines of text with the source lines that grew the most
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing() or _last_snapshot is None:
+        start_tracing()
+        return ["tracemalloc started, take another snapshot to see what grew"]
+    snapshot = _snapshot()
+    stats = snapshot.compare_to(_last_snapshot, 'lineno')
+    _last_snapshot = snapshot
+    return [str(stat) for stat in stats[:top]]
+
+
+def _snapshot():
+    """ Take a snapshot without the memory tracemalloc uses itself """
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)])
@@ -0,0 +1,152 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Draw many overlaid runs, e.g. a session of CV scans, with a few LineCollections instead of a
+Line2D for each run.
+
+The runs are put in batches of BATCH_SIZE, each batch is one LineCollection.  Adding a run
+only changes the segments of the last batch, and hiding, showing, recoloring or deleting a run
+changes the segments of the batches it is in or after, no artists are made or removed except
+when a batch is started or emptied.  Matplotlib draws a collection with one call, so the time
+to redraw grows much slower with the number of runs than with a line for each.
+
+The legend is shown a page of LEGEND_PAGE_SIZE runs at a time, so remaking it after a run is
+added or changed takes the same time no matter how many runs there are.  legend_handles makes
+the handles of a page, hidden runs get faded handles.
+
+This imports matplotlib, so tkinter_pyplot only imports it when the first graph is made.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# installed libraries
+import matplotlib
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+import numpy as np
+
+BATCH_SIZE = 32  # runs in each LineCollection
+LEGEND_PAGE_SIZE = 20  # runs shown in the legend at a time
+HIDDEN_ALPHA = 0.3  # alpha of the legend handle of a hidden run
+
+
+class MultiTrace(object):
+    """ The runs drawn in one axis """
+    def __init__(self, axis, batch_size=BATCH_SIZE, page_size=LEGEND_PAGE_SIZE):
+        """
+        :param axis: matplotlib Axes to draw the runs in
+        :param batch_size: number of runs in each LineCollection
+        :param page_size: number of runs in each page of the legend
+        """
+        self.axis = axis
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.segments = []  # (points, 2) array of each run
+        self.colors = []
+        self.visible = []
+        self.batches = []  # the LineCollections
+        self.legend_page = 0
+        self._color_cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        self._colors_used = 0
+
+    def __len__(self):
+        return len(self.segments)
+
+    def add(self, x_data, y_data, color=None):
+        """ Add a run
+        :param x_data: x values of the run
+        :param y_data: y values of the run, the same length as x_data
+        :param color: matplotlib color, None for the next color of the color cycle
+        :return: the color of the run
+        """
+        if color is None:
+            color = self._color_cycle[self._colors_used % len(self._color_cycle)]
+            self._colors_used += 1
+        segment = np.column_stack((np.asarray(x_data, dtype=np.float64),
+                                   np.asarray(y_data, dtype=np.float64)))
+        self.segments.append(segment)
+        self.colors.append(color)
+        self.visible.append(True)
+        if len(segment):
+            self.axis.update_datalim(segment)
+        self._update_batches(len(self.segments) - 1)
+        self.show_last_page()
+        return color
+
+    def remove(self, index):
+        """ Delete a run, the runs after it move up """
+        del self.segments[index], self.colors[index], self.visible[index]
+        self._update_batches(index)
+        self.legend_page = min(self.legend_page, self.last_page)
+
+    def clear(self):
+        """ Delete all the runs and their collections """
+        for batch in self.batches:
+            batch.remove()
+        self.batches = []
+        self.segments, self.colors, self.visible = [], [], []
+        self._colors_used = 0
+        self.legend_page = 0
+
+    def set_color(self, index, color):
+        self.colors[index] = color
+        self._update_batch(index // self.batch_size)
+
+    def set_visible(self, index, visible):
+        """ Show or hide a run, its collection is kept """
+        self.visible[index] = bool(visible)
+        self._update_batch(index // self.batch_size)
+
+    def _update_batches(self, first_run):
+        """ Update the collections from the batch of first_run on, adding and removing
+        collections so there is one for each batch """
+        batches_needed = -(-len(self.segments) // self.batch_size)
+        while len(self.batches) > batches_needed:
+            self.batches.pop().remove()
+        while len(self.batches) < batches_needed:
+            batch = LineCollection([])
+            self.axis.add_collection(batch, autolim=False)
+            self.batches.append(batch)
+        for batch_index in range(first_run // self.batch_size, batches_needed):
+            self._update_batch(batch_index)
+
+    def _update_batch(self, batch_index):
+        """ Give a collection the segments and colors of the visible runs of its batch """
+        runs = range(batch_index * self.batch_size,
+                     min((batch_index + 1) * self.batch_size, len(self.segments)))
+        shown = [i for i in runs if self.visible[i]]
+        batch = self.batches[batch_index]
+        batch.set_segments([self.segments[i] for i in shown])
+        batch.set_color([self.colors[i] for i in shown])
+
+    @property
+    def last_page(self):
+        return max(0, (len(self.segments) - 1) // self.page_size)
+
+    def show_last_page(self):
+        self.legend_page = self.last_page
+
+    def change_page(self, step):
+        """ Move the legend forward or back pages
+        :return: True if the page changed
+        """
+        page = min(max(self.legend_page + step, 0), self.last_page)
+        changed = page != self.legend_page
+        self.legend_page = page
+        return changed
+
+    def page_range(self):
+        """ Get the runs on the legend page
+        :return: range of the run index
+        """
+        start = self.legend_page * self.page_size
+        return range(start, min(start + self.page_size, len(self.segments)))
+
+    def legend_handles(self):
+        """ Make the legend handles of the runs on the legend page, they are not added to the
+        axis
+        :return: list of Line2D
+        """
+        return [Line2D([], [], color=self.colors[i],
+                       alpha=1.0 if self.visible[i] else HIDDEN_ALPHA)
+                for i in self.page_range()]
@@ -6,8 +6,13 @@
 # standard libraries
 import logging
 import tkinter as tk
+from tkinter import filedialog
 # local files
 import change_toplevel
+import data_trace
+import instrumentation
+import memory_report
+import toplevels
 
 __author__ = 'Kyle Vitatuas Lopin'
 
@@ -52,6 +57,12 @@ def make_data_menu(data_menu, master):
     """
     data_menu.add_command(label="Save All Data",
                           command=master.cv.save_all_data)
+    data_menu.add_command(label="Save Session",
+                          command=master.save_session)
+    data_menu.add_command(label="Open more session runs",
+                          command=master.select_session_runs)
+    data_menu.add_command(label="Fit resistance of CV runs",
+                          command=master.cv.fit_resistance)
     data_menu.add_command(label="Delete all data traces",
                           command=master.delete_all_data_user_prompt)
 
@@ -162,6 +173,69 @@ def make_developer_menu(developer_menu, master):
     developer_menu.add_cascade(label="Change timing PWM compare value",
                                command=lambda: change_toplevel.ChangeCompareValue(master))
 
+    timing_menu = tk.Menu(developer_menu, tearoff=0)
+    developer_menu.add_cascade(label="Timing instrumentation", menu=timing_menu)
+    timing_menu.add_command(label="Turn on", command=instrumentation.enable)
+    timing_menu.add_command(label="Turn off", command=instrumentation.disable)
+    timing_menu.add_command(label="Show timings",
+                            command=lambda: toplevels.TextReport(
+                                master, "Stage timings", instrumentation.format_report()))
+    timing_menu.add_command(label="Save timings", command=save_timings)
+    timing_menu.add_command(label="Clear timings", command=instrumentation.reset)
+
+    memory_menu = tk.Menu(developer_menu, tearoff=0)
+    developer_menu.add_cascade(label="Memory", menu=memory_menu)
+    memory_menu.add_command(label="Show memory use",
+                            command=lambda: toplevels.TextReport(
+                                master, "Memory use",
+                                memory_report.format_report(master.technique_frames)))
+    memory_menu.add_command(label="Take tracemalloc snapshot",
+                            command=lambda: toplevels.TextReport(
+                                master, "Growth since the last snapshot",
+                                memory_report.take_snapshot()))
+    memory_menu.add_command(label="Stop tracemalloc", command=memory_report.stop_tracing)
+
+    trace_menu = tk.Menu(developer_menu, tearoff=0)
+    developer_menu.add_cascade(label="Data trace", menu=trace_menu)
+    master.trace_level = tk.StringVar(master, value=data_trace.get_level_name())
+    for name in ['OFF', 'INFO', 'DEBUG', 'PACKET']:
+        trace_menu.add_radiobutton(label=name.capitalize(), variable=master.trace_level,
+                                   value=name, command=lambda: data_trace.set_level(
+                                       master.trace_level.get()))
+    trace_menu.add_separator()
+    trace_menu.add_command(label="Start binary capture", command=start_trace_capture)
+    trace_menu.add_command(label="Stop binary capture", command=data_trace.stop_capture)
+    trace_menu.add_separator()
+    trace_menu.add_command(label="Start serial traffic capture",
+                           command=lambda: start_serial_capture(master))
+    trace_menu.add_command(label="Stop serial traffic capture",
+                           command=lambda: master.device.device.stop_capture())
+
+
+def save_timings():
+    """ Ask the user for a file and save the timing report to it """
+    filename = filedialog.asksaveasfilename(defaultextension='.json',
+                                            filetypes=[('json file', '*.json')])
+    if filename:
+        instrumentation.dump(filename)
+
+
+def start_trace_capture():
+    """ Ask the user for a file to save the binary data trace to and start the capture """
+    filename = filedialog.asksaveasfilename(defaultextension='.trace',
+                                            filetypes=[('trace capture', '*.trace')])
+    if filename:
+        data_trace.start_capture(filename)
+
+
+def start_serial_capture(master):
+    """ Ask the user for a file and save the serial traffic of the device to it, the file can
+    be played back with serial_capture.ReplaySerial """
+    filename = filedialog.asksaveasfilename(defaultextension='.capture',
+                                            filetypes=[('serial capture', '*.capture')])
+    if filename:
+        master.device.device.start_capture(filename)
+
 
 def make_about_menu(about_menu, master):
     about_menu.add_cascade(label="About", command=lambda: change_toplevel.About(master))
@@ -0,0 +1,146 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Framing of the data the device sends back, so a lost or extra byte only loses the packet it
+was in instead of misaligning all the data after it.
+
+Without framing the data is a bare stream of int16 adc counts that ends with
+usb_comm.TERMINATION_CODE.  A device that has FRAMING_CAPABILITY in its reply to the identify
+command instead sends each packet as:
+
+    sync (2 bytes) | sequence number (uint16) | sample count (uint16) | samples (int16) | CRC
+
+all little endian, the CRC is the CRC-16/CCITT of the sequence number, sample count and
+samples.  Deframer takes the bytes as they are read, in any size of pieces, and gives back
+the packets that are whole and pass their CRC.  If a packet is corrupted it looks for the next
+sync bytes and carries on, and missing sequence numbers are counted as lost packets.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import binascii
+import collections
+import struct
+
+# installed libraries
+import numpy as np
+# local files
+import instrumentation
+
+SYNC = b"\xAA\x55"
+FRAMING_CAPABILITY = b"FRM1"  # sent in the identify reply by devices that frame their data
+MAX_SAMPLES = 2048  # packets that say they have more samples than this are corrupted
+_HEADER = struct.Struct("<2sHH")  # sync, sequence number, sample count
+_CRC = struct.Struct("<H")
+_SEQUENCE_MODULUS = 1 << 16
+
+# sequence: int sequence number of the packet, samples: numpy int16 array of the adc counts,
+# lost: number of packets that were missing just before this one
+Packet = collections.namedtuple('Packet', ['sequence', 'samples', 'lost'])
+
+
+def supported(identify_reply):
+    """ Check if the device frames its data from its reply to the identify command
+    :param identify_reply: bytes or str the device sent back, None if there was no reply
+    :return: True if the device sends framed packets
+    """
+    if isinstance(identify_reply, str):
+        identify_reply = identify_reply.encode('utf-8')
+    return bool(identify_reply) and FRAMING_CAPABILITY in identify_reply
+
+
+def crc16(data):
+    """ CRC-16/CCITT (polynomial 0x1021, starting at 0xFFFF) of data """
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def frame_packet(sequence, samples):
+    """ Make the bytes of a framed packet, the way the device sends them
+    :param sequence: int - sequence number, wraps at 65536
+    :param samples: list or array of int16 adc counts
+    :return: bytes of the packet
+    """
+    samples = np.asarray(samples, dtype='<i2')
+    if len(samples) > MAX_SAMPLES:
+        raise ValueError("A packet can have at most {0} samples".format(MAX_SAMPLES))
+    body = _HEADER.pack(SYNC, sequence % _SEQUENCE_MODULUS, len(samples)) + samples.tobytes()
+    return body + _CRC.pack(crc16(body[len(SYNC):]))
+
+
+class Deframer(object):
+    """ Take in the bytes read from the device and give back the framed packets in them """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.expected_sequence = None  # sequence number of the next packet, None for any
+        self.counters = dict.fromkeys(['packets', 'samples', 'lost_packets', 'crc_errors',
+                                       'duplicates', 'resyncs', 'discarded_bytes'], 0)
+
+    def reset(self):
+        """ Drop any partial packet and accept any sequence number next, call this when the
+        device starts a new run or the input buffer is cleared.  The counters are kept.
+        """
+        self.buffer.clear()
+        self.expected_sequence = None
+
+    @instrumentation.timed(instrumentation.DECODE)
+    def feed(self, data):
+        """ Add bytes read from the device
+        :param data: bytes read
+        :return: list of the Packets that were completed by the data
+        """
+        self.buffer.extend(data)
+        packets = []
+        position = 0
+        while True:
+            start = self.buffer.find(SYNC, position)
+            if start < 0:
+                # keep a last byte that could be the start of the sync bytes
+                keep = 1 if self.buffer.endswith(SYNC[:1]) else 0
+                self._discard(len(self.buffer) - keep - position)
+                position = len(self.buffer) - keep
+                break
+            if start > position:
+                self._discard(start - position)
+                self.counters['resyncs'] += 1
+            position = start
+            if len(self.buffer) - position < _HEADER.size:
+                break  # wait for the rest of the header
+            _, sequence, count = _HEADER.unpack_from(self.buffer, position)
+            if count > MAX_SAMPLES:
+                self.counters['crc_errors'] += 1
+                position += 1  # not a real header, look for the next sync bytes
+                continue
+            end = position + _HEADER.size + 2 * count + _CRC.size
+            if len(self.buffer) < end:
+                break  # wait for the rest of the packet
+            (crc,) = _CRC.unpack_from(self.buffer, end - _CRC.size)
+            if crc != crc16(self.buffer[position + len(SYNC):end - _CRC.size]):
+                self.counters['crc_errors'] += 1
+                position += 1
+                continue
+            samples = np.frombuffer(self.buffer, dtype='<i2', count=count,
+                                    offset=position + _HEADER.size).astype(np.int16)
+            position = end
+            packet = self._check_sequence(sequence, samples)
+            if packet:
+                packets.append(packet)
+        del self.buffer[:position]
+        return packets
+
+    def _check_sequence(self, sequence, samples):
+        """ Count the packets missed before this one, returns None for a repeated packet """
+        lost = 0
+        if self.expected_sequence is not None:
+            lost = (sequence - self.expected_sequence) % _SEQUENCE_MODULUS
+            if lost >= _SEQUENCE_MODULUS // 2:  # an older packet sent again
+                self.counters['duplicates'] += 1
+                return None
+        self.expected_sequence = (sequence + 1) % _SEQUENCE_MODULUS
+        self.counters['packets'] += 1
+        self.counters['samples'] += len(samples)
+        self.counters['lost_packets'] += lost
+        return Packet(sequence, samples, lost)
+
+    def _discard(self, number_bytes):
+        self.counters['discarded_bytes'] += max(number_bytes, 0)
@@ -7,8 +7,11 @@
 from __future__ import division
 
 import logging
+import math
+import time
 
 import globals as _globals
+import settings_store
 
 __author__ = 'Kyle Vitautas Lopin'
 
@@ -46,8 +49,43 @@ PULSE_HEIGHT = 100  # mV
 PULSE_INCREMENT = 10  # mV
 PULSE_WIDTH = 20  # msec
 
+# Chronoamperometry properties, the electrode is held at the initial voltage, stepped to the
+# step voltage and then to the final voltage, a time of 0 skips that part
+DEFAULT_CHRONO_SETTINGS = {'initial_voltage': 0, 'initial_time': 1.0,  # mV, seconds
+                           'step_voltage': 500, 'step_time': 10.0,
+                           'final_voltage': 0, 'final_time': 0.0,
+                           'sampling_rate': DEVICE_SAMPLING_RATE}  # Hz
+MAX_CHRONO_SAMPLING_RATE = 50000  # Hz
+
 SAVED_SETTINGS_FILE = "settings.txt"
 
+# settings saved with each run so the run can be found and checked later
+RUN_INFO_SETTINGS = {'CV': ['start_voltage', 'end_voltage', 'sweep_rate', 'sweep_type',
+                            'sweep_start_type', 'use_swv', 'swv_height', 'swv_inc',
+                            'swv_period'],
+                     'ASV': ['clean_volt', 'clean_time', 'plate_volt', 'plate_time',
+                             'end_voltage', 'sweep_rate', 'sweep_type', 'pulse_height',
+                             'pulse_inc', 'pulse_width'],
+                     'amp': ['voltage', 'sampling_rate'],
+                     'chrono': list(DEFAULT_CHRONO_SETTINGS)}
+
+# sections of the settings file, the CV settings have no prefix so old settings files load
+CV_SECTION = ''
+ASV_SECTION = 'asv'
+AMP_SECTION = 'amp'
+CHRONO_SECTION = 'chrono'
+CV_SAVED_SETTINGS = {key: DEFAULT_CV_SETTINGS[key] for key in RUN_INFO_SETTINGS['CV']}
+DEFAULT_ASV_SETTINGS = {'clean_volt': CLEAN_VOLTAGE_ASV, 'clean_time': CLEAN_TIME,
+                        'plate_volt': PLATING_VOLTAGE, 'plate_time': PLATING_TIME,
+                        'end_voltage': END_ASV_VOLTAGE, 'sweep_rate': SWEEP_RATE,
+                        'sweep_type': "LS", 'pulse_height': PULSE_HEIGHT,
+                        'pulse_inc': PULSE_INCREMENT, 'pulse_width': PULSE_WIDTH}
+DEFAULT_AMP_SETTINGS = {'voltage': 500, 'sampling_rate': DEVICE_SAMPLING_RATE}
+SETTINGS_SECTIONS = {CV_SECTION: CV_SAVED_SETTINGS, ASV_SECTION: DEFAULT_ASV_SETTINGS,
+                     AMP_SECTION: DEFAULT_AMP_SETTINGS, CHRONO_SECTION: DEFAULT_CHRONO_SETTINGS}
+SETTINGS_CHOICES = {'sweep_type': SWEEP_TYPE_OPTIONS + ['DPV'],
+                    'sweep_start_type': SWEEP_START_TYPE_OPTIONS}
+
 
 class DeviceParameters(object):
     """ Class to hold all the properties and parameters of the PSoC amperometry device
@@ -66,9 +104,13 @@ class DeviceParameters(object):
         # self.dac = DAC("8-bit DAC", voltage_range=4080)
         self.dac = DAC("DVDAC", voltage_range=4080)
         self.adc_tia = ADC_TIA()
-        self.cv_settings = CVSettings(self.dac)
-        self.amp_settings = AmpSettings(self.clk_freq_isr_pwm, self.dac)
-        self.asv_settings = ASVSettings(self.clk_freq_isr_pwm, self.dac)
+        # settings of all the techniques are loaded once and saved when they are changed
+        self.settings_store = settings_store.SettingsStore(SAVED_SETTINGS_FILE,
+                                                           SETTINGS_SECTIONS, SETTINGS_CHOICES)
+        self.cv_settings = CVSettings(self.dac, self.settings_store)
+        self.amp_settings = AmpSettings(self.clk_freq_isr_pwm, self.dac, self.settings_store)
+        self.asv_settings = ASVSettings(self.clk_freq_isr_pwm, self.dac, self.settings_store)
+        self.chrono_settings = ChronoSettings(self.clk_freq_isr_pwm, self.settings_store)
 
         # variable parameters
         self.pwm_period_value = self.calculate_pwm_period()
@@ -86,6 +128,25 @@ class DeviceParameters(object):
                                      (self.cv_settings.sweep_rate * 1000 / voltage_step_size)))
         return pwm_period_value
 
+    def run_info(self, technique):
+        """ Make a record of the settings, calibration and current range used for a run
+        :param technique: str - 'CV', 'ASV', 'amp' or 'chrono', which settings to record
+        :return: dict of the values, only uses types that can be saved as json
+        """
+        settings = {'CV': self.cv_settings, 'ASV': self.asv_settings,
+                    'amp': self.amp_settings, 'chrono': self.chrono_settings}[technique]
+        info = {'technique': technique, 'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'counts_to_current': float(self.adc_tia.counts_to_current),
+                'shift': float(self.adc_tia.shift),
+                'tia_resistor': self.adc_tia.tia_resistor,
+                'adc_gain': self.adc_tia.adc_gain,
+                'adc_config': self.adc_tia.adc_config,
+                'current_range': float(self.adc_tia.current_lims),
+                'dac_source': self.dac.source}
+        for key in RUN_INFO_SETTINGS[technique]:
+            info[key] = getattr(settings, key)
+        return info
+
     def set_dac(self, _type):
         """ Set the type of dac to use
         :param _type: "VDAC" or "DVDAC", string of the type of dac used
@@ -99,28 +160,18 @@ class CVSettings(object):
     """ Class to hold the important parameters for running a cyclic voltammetry scan
     """
 
-    def __init__(self, dac):
+    def __init__(self, dac, store=None):
         """
         :param dac: DAC instance
+        :param store: settings_store.SettingsStore the settings are loaded from and saved to,
+        None uses the default settings and does not save them
         """
-        # try to open settings file
-        try:
-            with open("settings.txt", 'r') as _file:
-                for line in _file.readlines():
-                    attribute, value = line.split('=')
-                    attribute = attribute.strip(' ')
-                    value = value.strip()
-                    # convert the string read from the file to the proper data type
-                    valid_value = self.check_valid_value(attribute, value)
-                    if valid_value:
-                        setattr(self, attribute, valid_value)
-        except Exception as e:
-            logging.debug("Load error: ", e)
-            # with open("settings.txt", "w") as _file:
-            #     pass  # make the file if it is not there
+        self.store = store
         for key in DEFAULT_CV_SETTINGS:
-            if not hasattr(self, key):
-                setattr(self, key, DEFAULT_CV_SETTINGS[key])
+            setattr(self, key, DEFAULT_CV_SETTINGS[key])
+        if store:
+            for key, value in store.section(CV_SECTION).items():
+                setattr(self, key, value)
         self.delay_time = 2 * abs(self.start_voltage - self.end_voltage) / self.sweep_rate
         if self.use_swv:  # recalculate the delay time
             self.delay_time = 2 * self.swv_period * abs(self.start_voltage - self.end_voltage) / self.swv_inc
@@ -131,44 +182,6 @@ class CVSettings(object):
         self.end_dac_value = None  # init holder
         self.calc_dac_values(dac)
 
-    @staticmethod
-    def check_valid_value(attribute, value):
-        """ Check if value entered is valid for the attribute it wants to be assigned to.
-        Cross-reference the DEFAULT_CV_SETTINGS dict to make sure types are consistent
-        :param attribute: str - class attribute to assign a value to
-        :param value: str - value to convert to the proper type and assign to the attribute
-        :return: properly typed value or False if the data type couldn't be converted
-        """
-        if attribute in DEFAULT_CV_SETTINGS:
-            # YOU HAVE TO CHECK BOOL FIRST, THEY ARE ALSO INTS
-            if isinstance(DEFAULT_CV_SETTINGS[attribute], bool):
-                return value == "True"
-
-            elif isinstance(DEFAULT_CV_SETTINGS[attribute], int):
-                # try to convert the string to int
-                try:
-                    return int(value)
-                except:
-                    return False
-            elif isinstance(DEFAULT_CV_SETTINGS[attribute], float):
-                try:
-                    return float(value)
-                except:
-                    return False
-
-            elif attribute == 'sweep_start_type':
-                if value in SWEEP_START_TYPE_OPTIONS:
-                    return value
-                else:
-                    return False
-            elif attribute == 'sweep_type':
-                if value in SWEEP_TYPE_OPTIONS:
-                    return value
-                else:
-                    return False
-        else:
-            return False
-
     def calc_dac_values(self, dac):
         """ TODO: Depreated??
         :param dac:
@@ -207,35 +220,28 @@ class CVSettings(object):
         self.swv_inc = swv_inc
         self.swv_period = swv_period
         self.use_swv = use_swv
+        self.save_settings()
 
-        try:
-            with open(SAVED_SETTINGS_FILE, 'r') as _file:
-                old_file = _file.read()
-
-        except Exception as e:
-            logging.debug("exception in loading settings file: {0}".format(e))
-            pass  # there is no file so skip
-
-        try:
-            print(vars(self))
-            with open(SAVED_SETTINGS_FILE, 'w') as _file:
-                for item in vars(self):
-                    _file.write("{0} = {1}\n".format(item, eval("self.{0}".format(item))))
-
-        except Exception as e:
-            logging.debug("exception in loading settings file: {0}".format(e))
-            pass  # there is no file so skip
+    def save_settings(self):
+        """ Put the settings in the settings store, it writes the settings file if they changed """
+        if self.store:
+            self.store.update(CV_SECTION,
+                              **{key: getattr(self, key) for key in CV_SAVED_SETTINGS})
 
 
 class AmpSettings(object):
     """ Class to hold the important parameters for running an amperometry experiment
     Note: this interacts with CVSettings to keep the sample rate / sweep rate connected
     """
-    def __init__(self, clock_freq, dac):
-        self.voltage = 500  # mV, start with basic parameters
+    def __init__(self, clock_freq, dac, store=None):
+        self.store = store
+        self.voltage = DEFAULT_AMP_SETTINGS['voltage']  # mV, start with basic parameters
         self.raw_sampling_rate = DEVICE_SAMPLING_RATE  # Hz
         self.down_sample = DOWN_SAMPLING
         self.sampling_rate = self.raw_sampling_rate
+        if store:
+            self.voltage = store.get(AMP_SECTION, 'voltage')
+            self.sampling_rate = store.get(AMP_SECTION, 'sampling_rate')
         self.pwm_period_value = self.calculate_pwm_period(clock_freq)
 
     def calculate_pwm_period(self, clk_freq):
@@ -253,25 +259,87 @@ class AmpSettings(object):
         """
         self.voltage = voltage
         self.sampling_rate = rate
+        if self.store:
+            self.store.update(AMP_SECTION, voltage=voltage, sampling_rate=rate)
+
+
+class ChronoSettings(object):
+    """ Settings of a chronoamperometry (potential step) run """
+    def __init__(self, clock_freq, store=None):
+        """
+        :param clock_freq: clock frequency feeding the timing PWM
+        :param store: settings_store.SettingsStore to load and save the settings with
+        """
+        self.store = store
+        self.clock_freq = clock_freq
+        for key, value in DEFAULT_CHRONO_SETTINGS.items():
+            setattr(self, key, value)
+        if store:
+            for key, value in store.section(CHRONO_SECTION).items():
+                setattr(self, key, value)
+
+    @property
+    def pwm_period_value(self):
+        return int(round(self.clock_freq / self.sampling_rate))
+
+    def steps(self):
+        """ Get the voltages of the run
+        :return: list of (voltage in mV, time in seconds) of the parts of the run that are not
+        skipped
+        """
+        steps = [(self.initial_voltage, self.initial_time), (self.step_voltage, self.step_time),
+                 (self.final_voltage, self.final_time)]
+        return [step for step in steps if step[1] > 0]
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.steps())
+
+    @property
+    def number_samples(self):
+        """ Number of samples the whole run takes """
+        # round first so float error in the times can not add a sample
+        return int(math.ceil(round(self.total_time * self.sampling_rate, 6)))
+
+    def update_settings(self, **settings):
+        """ Check and save new settings
+        :param settings: setting name=value of the settings in DEFAULT_CHRONO_SETTINGS to change
+        :raise ValueError: if a setting is not known or its value can not be used
+        """
+        new_settings = {}
+        for key, value in settings.items():
+            if key not in DEFAULT_CHRONO_SETTINGS:
+                raise ValueError("Unknown chronoamperometry setting {0}".format(key))
+            value = type(DEFAULT_CHRONO_SETTINGS[key])(float(value))
+            if key.endswith('_time') and value < 0:
+                raise ValueError("{0} can not be negative".format(key))
+            new_settings[key] = value
+        rate = new_settings.get('sampling_rate', self.sampling_rate)
+        if not 0 < rate <= MAX_CHRONO_SAMPLING_RATE:
+            raise ValueError("Sampling rate has to be from 1 to {0} Hz".format(
+                MAX_CHRONO_SAMPLING_RATE))
+        if new_settings.get('step_time', self.step_time) <= 0:
+            raise ValueError("The step time has to be more than 0")
+        for key, value in new_settings.items():
+            setattr(self, key, value)
+        self.save_settings()
+
+    def save_settings(self):
+        """ Put the settings in the settings store, it writes the settings file if they changed """
+        if self.store:
+            self.store.update(CHRONO_SECTION,
+                              **{key: getattr(self, key) for key in DEFAULT_CHRONO_SETTINGS})
 
 
 class ASVSettings(CVSettings):
-    def __init__(self, clock_freq, dac):
-        CVSettings.__init__(self, dac)
-        self.sweep_type = "LS"
-        self.clean_volt = CLEAN_VOLTAGE_ASV
-        self.clean_time = CLEAN_TIME
-        self.plate_volt = PLATING_VOLTAGE
-        self.plate_time = PLATING_TIME
-        self.end_voltage = END_ASV_VOLTAGE
-        self.low_voltage = self.plate_volt
-        self.high_voltage = self.end_voltage
-        self.sweep_rate = SWEEP_RATE
-        self.delay_time = 500 + abs(self.end_voltage -
-                                    self.plate_volt) / self.sweep_rate
-        self.pulse_height = PULSE_HEIGHT
-        self.pulse_inc = PULSE_INCREMENT
-        self.pulse_width = PULSE_WIDTH
+    def __init__(self, clock_freq, dac, store=None):
+        CVSettings.__init__(self, dac, store)
+        for key in DEFAULT_ASV_SETTINGS:
+            setattr(self, key, DEFAULT_ASV_SETTINGS[key])
+        if store:
+            for key, value in store.section(ASV_SECTION).items():
+                setattr(self, key, value)
+        self.calc_delay_time()
 
     def update_settings(self, clean_voltage, clean_time, electroplate_voltage,
                         plating_time, end_voltage, sweep_rate, sweep_type=0,
@@ -290,21 +358,29 @@ class ASVSettings(CVSettings):
         self.plate_volt = electroplate_voltage
         self.plate_time = plating_time
         self.end_voltage = end_voltage
-        self.low_voltage = self.plate_volt
-        self.high_voltage = self.end_voltage
         self.sweep_rate = sweep_rate
-        self.delay_time = 500 + abs(self.high_voltage - self.low_voltage) / self.sweep_rate
-
         self.pulse_height = pulse_height
         self.pulse_inc = pulse_inc
         self.pulse_width = pulse_width
+        self.sweep_type = "DPV" if sweep_type == 1 else "LS"
+        self.calc_delay_time()
+        self.save_settings()
 
-        if sweep_type == 1:
-            self.sweep_type = "DPV"
+    def calc_delay_time(self):
+        """ Set the voltage range and how long a run takes from the settings """
+        self.low_voltage = self.plate_volt
+        self.high_voltage = self.end_voltage
+        if self.sweep_type == "DPV":
             self.delay_time = (500 + self.pulse_width * abs(self.high_voltage - self.low_voltage)
                                / self.pulse_inc)
         else:
-            self.sweep_type = "LS"
+            self.delay_time = 500 + abs(self.high_voltage - self.low_voltage) / self.sweep_rate
+
+    def save_settings(self):
+        """ Put the settings in the settings store, it writes the settings file if they changed """
+        if self.store:
+            self.store.update(ASV_SECTION,
+                              **{key: getattr(self, key) for key in DEFAULT_ASV_SETTINGS})
 
 
 class DAC(object):
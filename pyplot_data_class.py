@@ -2,55 +2,224 @@
 # Licensed under the Creative Commons Attribution-ShareAlike  3.0 (CC BY-SA 3.0 US) License
 
 """ Data class to hold cyclic voltammetry data
+
+The data is stored column wise: the currents of all the runs are rows of one preallocated
+float32 block, the raw adc counts are rows of an int16 block and the voltage axes are kept
+once and shared between all the runs that used the same voltage protocol.  The labels, colors,
+notes and run info make up the metadata table, one entry per run.
 """
 # standard libraries
 import csv
+import itertools
 import logging
 import traceback
+# installed libraries
+import numpy as np
+# local files
+import instrumentation
 
 __author__ = 'Kyle Vitautas Lopin'
 
+INITIAL_RUN_CAPACITY = 8  # number of runs to make room for before the blocks have to grow
+CURRENT_DTYPE = np.float32
+RAW_DTYPE = np.int16
+VOLTAGE_DTYPE = np.float32
+EXPORT_CHUNK_ROWS = 4096  # number of rows to format at a time when saving
+IMPORT_CHUNK_ROWS = 16384  # number of rows to parse at a time when opening a file
+
 
 class PyplotData(object):
     """ Class to contain the data to display in the tkinter_pyplot PyplotEmbed class
     TO DO: FIND BETTER NAMES FOR THIS
     """
-    def __init__(self):
-        """ Initialize lists to hold the x-y values, the legend labels and the colors of the lines
-        to display
+    def __init__(self, capacity=INITIAL_RUN_CAPACITY):
+        """ Initialize the arrays to hold the x-y values and the metadata table to hold the
+        legend labels, the colors of the lines to display, the notes and the run info
+        :param capacity: int - number of runs to preallocate room for
+        """
+        self.clear(capacity)
+
+    def clear(self, capacity=INITIAL_RUN_CAPACITY):
+        """ Remove all the runs and give back the memory of the data blocks.  The object is
+        kept so the graph and the frame that share it still see the same data
+        :param capacity: int - number of runs to preallocate room for
         """
-        # self.x_data = []
-        self.voltage_data = []
         self.time_data = []
-        self.current_data = []
-        self.y_raw_data = []
+        # metadata table, one entry for each run
         self.label = []
         self.colors = []
         self.notes = []
+        self.run_info = []  # dict of the settings and calibration used for each run
         self.index = 0  # index to keep track of how many data series are saved so far
         self.name_index = 0
+        # columnar storage
+        self._voltage_axes = []  # unique voltage axes, shared by runs with the same protocol
+        self._axis_index = np.zeros(capacity, dtype=np.int32)  # which voltage axis each run uses
+        self._lengths = np.zeros(capacity, dtype=np.int32)  # number of current points in each run
+        self._raw_lengths = np.zeros(capacity, dtype=np.int32)
+        self._current = np.zeros((capacity, 0), dtype=CURRENT_DTYPE)
+        self._raw = np.zeros((capacity, 0), dtype=RAW_DTYPE)
+
+    @property
+    def voltage_data(self):
+        """ List of the voltage axis of each run, runs with the same protocol share one array """
+        return [self._voltage_axes[i] for i in self._axis_index[:self.index]]
+
+    @property
+    def current_data(self):
+        """ List of views of the current of each run, trimmed to the length of the run """
+        return [self._current[i, :self._lengths[i]] for i in range(self.index)]
+
+    @property
+    def y_raw_data(self):
+        """ List of views of the raw adc counts of each run """
+        return [self._raw[i, :self._raw_lengths[i]] for i in range(self.index)]
+
+    def run_arrays(self, index):
+        """ Get the arrays of one run without building the lists of every run
+        :param index: int - index of the run
+        :return: tuple of the voltage axis, view of the current and view of the raw adc counts
+        """
+        if not 0 <= index < self.index:
+            raise IndexError("run index {0} out of range".format(index))
+        return (self._voltage_axes[self._axis_index[index]],
+                self._current[index, :self._lengths[index]],
+                self._raw[index, :self._raw_lengths[index]])
+
+    @property
+    def shared_voltage(self):
+        """ The voltage axis if every run used the same one, else None """
+        if self.index and len(self._voltage_axes) == 1:
+            return self._voltage_axes[0]
+        return None
+
+    @property
+    def axis_count(self):
+        """ Number of different voltage axes the runs use """
+        return len(self._voltage_axes)
+
+    @property
+    def nbytes(self):
+        """ Number of bytes held in the data blocks and voltage axes """
+        return (self._current.nbytes + self._raw.nbytes + self._axis_index.nbytes +
+                self._lengths.nbytes + self._raw_lengths.nbytes +
+                sum(axis.nbytes for axis in self._voltage_axes))
+
+    @property
+    def capacity(self):
+        """ Number of runs the data blocks have room for before they have to grow """
+        return self._current.shape[0]
+
+    def run_nbytes(self):
+        """ Number of bytes of the data blocks each run uses, the current and raw adc points.
+        The rows of the blocks are as long as the longest run so a run can hold more bytes
+        than it uses
+        :return: numpy array of the bytes used by each run
+        """
+        return (self._lengths[:self.index].astype(np.int64) * self._current.itemsize +
+                self._raw_lengths[:self.index].astype(np.int64) * self._raw.itemsize)
 
-    def add_data(self, new_voltage, new_current, _new_raw_y=None, _label=None):
+    def axis_groups(self):
+        """ Group the runs by the voltage axis they use, so the runs of one protocol can be
+        worked on as a single 2-D array
+        :return: list of tuples of the voltage axis, array of the index of the runs, 2-D array
+        of their currents (padded with zeros past the end of each run) and array of the
+        number of current points in each run
+        """
+        groups = []
+        axis_index = self._axis_index[:self.index]
+        for i, axis in enumerate(self._voltage_axes):
+            runs = np.flatnonzero(axis_index == i)
+            groups.append((axis, runs, self._current[runs], self._lengths[runs]))
+        return groups
+
+    @instrumentation.timed(instrumentation.STORE)
+    def add_data(self, new_voltage, new_current, _new_raw_y=None, _label=None, run_info=None):
         """ Add the data self so it can all be saved later
         :param new_voltage: voltages of the data measured
         :param new_current: data of the current measured
         :param _new_raw_y: raw ADC counts
         :param _label: data label
+        :param run_info: dict of the settings and calibration used to take the data
         """
         if not _label:
             _label = "data {}".format(self.name_index + 1)
-        self.voltage_data.append(new_voltage)
-        self.current_data.append(new_current)
+        new_current = np.asarray(new_current, dtype=CURRENT_DTYPE)
+        if _new_raw_y is None or len(_new_raw_y) == 0:
+            _new_raw_y = [0]
+        _new_raw_y = np.asarray(_new_raw_y, dtype=RAW_DTYPE)
+
+        self._make_room(self.index + 1, len(new_current), len(_new_raw_y))
+        self._axis_index[self.index] = self._get_axis_index(new_voltage)
+        self._lengths[self.index] = len(new_current)
+        self._raw_lengths[self.index] = len(_new_raw_y)
+        self._current[self.index, :len(new_current)] = new_current
+        self._raw[self.index, :len(_new_raw_y)] = _new_raw_y
+
         self.label.append(_label)
         self.notes.append(" ")
-        if _new_raw_y:
-            self.y_raw_data.append(_new_raw_y)
-        else:
-            self.y_raw_data.append([0])
+        self.run_info.append(run_info if run_info else {})
         self.index += 1  # increment data index so the next data series will be advanced
         self.name_index += 1
         logging.debug("adding data, index: %i", self.index)
 
+    def add_runs(self, voltages, currents, labels=None, notes=None, raw_data=None,
+                 run_info=None):
+        """ Add many runs at once, used when opening saved data.  The data blocks are grown
+        once for all the runs instead of for each run
+        :param voltages: list of the voltages of each run
+        :param currents: list of the currents of each run
+        :param labels: list of the data labels of each run
+        :param notes: list of the notes of each run
+        :param raw_data: list of the raw adc counts of each run, session files save these
+        :param run_info: list of the run info dicts of each run, session files save these
+        """
+        runs = len(currents)
+        labels = labels or runs * [None]
+        notes = notes or runs * [" "]
+        raw_data = raw_data or runs * [None]
+        run_info = run_info or runs * [None]
+        self._make_room(self.index + runs, max(len(current) for current in currents),
+                        max(len(raw) if raw is not None else 1 for raw in raw_data))
+        for voltage, current, label, note, raw, info in zip(voltages, currents, labels, notes,
+                                                            raw_data, run_info):
+            self.add_data(voltage, current, raw, _label=label, run_info=info)
+            self.notes[-1] = note
+
+    def _get_axis_index(self, new_voltage):
+        """ Find the voltage axis that matches new_voltage or add it as a new axis
+        :param new_voltage: voltages of the data measured
+        :return: int - index of the voltage axis in self._voltage_axes
+        """
+        new_voltage = np.asarray(new_voltage, dtype=VOLTAGE_DTYPE)
+        for i, axis in enumerate(self._voltage_axes):
+            if axis.shape == new_voltage.shape and np.array_equal(axis, new_voltage):
+                return i
+        # copy so the axis does not hold the caller's array or a memory mapped file open
+        new_voltage = new_voltage.copy()
+        new_voltage.flags.writeable = False  # the axis is shared so protect it
+        self._voltage_axes.append(new_voltage)
+        return len(self._voltage_axes) - 1
+
+    def _make_room(self, runs, length, raw_length):
+        """ Grow the data blocks so they can hold the number of runs and points asked for.
+        The number of rows is doubled so adding runs does not copy the blocks every time
+        :param runs: int - number of runs the blocks have to hold
+        :param length: int - number of current points the blocks have to hold
+        :param raw_length: int - number of raw adc points the blocks have to hold
+        """
+        capacity = self._current.shape[0]
+        if runs > capacity:
+            capacity = max(2 * capacity, runs)
+            self._axis_index = _resize_1d(self._axis_index, capacity)
+            self._lengths = _resize_1d(self._lengths, capacity)
+            self._raw_lengths = _resize_1d(self._raw_lengths, capacity)
+        if capacity != self._current.shape[0] or length > self._current.shape[1]:
+            self._current = _resize_2d(self._current, capacity,
+                                       max(length, self._current.shape[1]))
+        if capacity != self._raw.shape[0] or raw_length > self._raw.shape[1]:
+            self._raw = _resize_2d(self._raw, capacity, max(raw_length, self._raw.shape[1]))
+
     def change_label(self, new_label, index):
         """ Let the user change the label of a data run
         :param new_label:
@@ -60,56 +229,211 @@ class PyplotData(object):
         self.label[index] = new_label
 
     def remove_data(self, _index):
-        self.voltage_data.pop(_index)
-        self.current_data.pop(_index)
-        self.y_raw_data.pop(_index)
-        self.notes.pop(_index)
-        self.label.pop(_index)
-        self.colors.pop(_index)
-        self.index -= 1
-
-    def save_all_data(self, filename, save_type="Converted"):
-        """ Save all the data save
-        NOTE: if the voltage range was changed in the run the saved data will be messed up
-        :param filename:  filename to save the
-        :param save_type:
-        :return:
+        """ Remove one or more runs and shift the runs after them up in the data blocks
+        :param _index: int or list of ints - index of the runs to remove
         """
-        try:
-            # make a csv writer, go through each data point and save the voltage and current at
-            # each point, then close the file
+        keep = np.ones(self.index, dtype=bool)
+        keep[_index] = False
+        number_kept = int(keep.sum())
+        # compact the blocks in one pass, fancy indexing on the right makes a copy first
+        for block in (self._current, self._raw, self._axis_index,
+                      self._lengths, self._raw_lengths):
+            block[:number_kept] = block[:self.index][keep]
+        self.label[:] = [item for item, kept in zip(self.label, keep) if kept]
+        self.notes[:] = [item for item, kept in zip(self.notes, keep) if kept]
+        self.run_info[:] = [item for item, kept in zip(self.run_info, keep) if kept]
+        self.colors[:] = [item for item, kept in zip(self.colors, keep) if kept]
+        self.index = number_kept
+        self._remove_unused_axes()
 
+    def _remove_unused_axes(self):
+        """ Delete the voltage axes no run uses anymore and renumber the axis index """
+        used = np.unique(self._axis_index[:self.index])
+        if len(used) == len(self._voltage_axes):
+            return
+        renumber = np.zeros(len(self._voltage_axes), dtype=np.int32)
+        renumber[used] = np.arange(len(used), dtype=np.int32)
+        self._axis_index[:self.index] = renumber[self._axis_index[:self.index]]
+        self._voltage_axes = [self._voltage_axes[i] for i in used]
+
+    def save_all_data(self, filename, save_type="Converted", chunk_rows=EXPORT_CHUNK_ROWS):
+        """ Save all the data to a csv file.  The first row has the data labels and the second row
+        the notes.  If every run used the same voltages the first column is the voltage and each
+        run has one column after it, else each run is saved as a voltage and data column pair.
+        Runs shorter than the longest run are padded with empty cells.  The rows are formatted
+        and written chunk_rows at a time so large sessions are streamed to the file
+        :param filename:  open file to save the data in
+        :param save_type: "Converted" to save the currents or "Raw Counts" to save the adc counts
+        :param chunk_rows: int - number of rows to format and write at a time
+        """
+        try:
+            header, notes, columns = self._export_columns(save_type)
             writer = csv.writer(filename, dialect='excel', lineterminator='\n')
-            # make the first line of the file with the data labels
-            line = ["voltage"]  # first line will be the voltages
-            for i in range(self.index):
-                line.append(self.label[i])
-            writer.writerow(line)
-            length = len(self.current_data[0])
-            width = self.index
-            # the second row are the notes
-            line = [" "]  # first line is voltages so it has no notes
-            for i in range(self.index):
-                line.append(self.notes[i])
-            writer.writerow(line)
-
-            # check to see what type of data the user wants to save
-            if save_type == "Converted":
-                _data_array = self.current_data
-            elif save_type == "Raw Counts":
-                _data_array = self.y_raw_data
-
-            for i in range(length):
-                # this is only take the voltage of the first run
-                # print(self.voltage_data)
-                line[0] = self.voltage_data[0][i]
-                for j in range(width):
-                    line[j + 1] = _data_array[j][i]
-                # print('l', line)
-                writer.writerow(line)
+            writer.writerow(header)
+            writer.writerow(notes)
+
+            length = max(len(column) for column in columns)
+            for start in range(0, length, chunk_rows):
+                stop = min(start + chunk_rows, length)
+                text = _format_columns(columns, start, stop)
+                filename.write("\n".join(map(",".join, text.tolist())))
+                filename.write("\n")
 
         except Exception as error:
             logging.error("failed saving")
             logging.error(error)
             traceback.print_exc()
             filename.close()
+
+    def _export_columns(self, save_type):
+        """ Make the label row, the notes row and the list of columns to save
+        :param save_type: "Converted" to save the currents or "Raw Counts" to save the adc counts
+        :return: list of the labels, list of the notes and list of 1-D arrays, one for each column
+        """
+        if save_type == "Raw Counts":
+            _data_array = self.y_raw_data
+        else:
+            _data_array = self.current_data
+        if self.shared_voltage is not None:
+            header = ["voltage"] + self.label[:self.index]
+            notes = [" "] + self.notes[:self.index]  # the voltage column has no notes
+            columns = [self.shared_voltage] + _data_array
+        else:  # give each run its own voltage column
+            header, notes, columns = [], [], []
+            for voltage, data, label, note in zip(self.voltage_data, _data_array,
+                                                  self.label, self.notes):
+                header.extend(["voltage", label])
+                notes.extend([" ", note])
+                columns.extend([voltage, data])
+        return header, notes, columns
+
+
+def read_csv_data(filename, chunk_rows=IMPORT_CHUNK_ROWS):
+    """ Read a csv file saved by PyplotData.save_all_data or by the amperometry frame.
+    The numbers are parsed chunk_rows rows at a time by numpy instead of cell by cell.
+    The formats that can be read are:
+    cyclic voltammetry: labels row ("voltage", label 1, label 2, ...), notes row, data rows
+    with one voltage column or a voltage column before each data column
+    amperometry: "time", "current" row, data rows
+    :param filename: name of the file to open
+    :param chunk_rows: int - number of rows to parse at a time
+    :return: dict with the keys 'type' ("cv" or "amp"), 'labels', 'notes', 'x' and 'y', the last
+    2 are lists with the x and y arrays of each data series with the empty cells removed
+    """
+    with open(filename, 'r', newline='') as _file:
+        _reader = csv.reader(_file)
+        first_array = next(_reader)  # get the first line that has the data labels
+        if first_array[0].strip() == "time":
+            data_type = "amp"
+            notes = len(first_array) * [" "]
+        elif first_array[0].strip() == "voltage":
+            data_type = "cv"
+            notes = next(_reader)  # the second line has the notes
+        else:
+            raise ValueError("Unknown data file type, first cell: {0}".format(first_array[0]))
+
+        width = len(first_array)
+        chunks = []
+        while True:
+            lines = list(itertools.islice(_file, chunk_rows))
+            if not lines:
+                break
+            chunks.append(_parse_chunk(lines, width))
+    if chunks:
+        table = np.concatenate(chunks)
+    else:
+        table = np.zeros((0, width))
+
+    # a voltage column before every data column means each run has its own voltages
+    paired = width > 2 and all(label.strip() == "voltage" for label in first_array[::2])
+    saved_data = {'type': data_type, 'labels': [], 'notes': [], 'x': [], 'y': []}
+    for i in range(1, width, 2 if paired else 1):
+        x_column = table[:, i - 1] if paired else table[:, 0]
+        y_column = table[:, i]
+        length = _valid_length(y_column)
+        saved_data['x'].append(x_column[:length])
+        saved_data['y'].append(y_column[:length])
+        saved_data['labels'].append(first_array[i])
+        saved_data['notes'].append(notes[i] if i < len(notes) else " ")
+    return saved_data
+
+
+def _parse_chunk(lines, width):
+    """ Convert lines of comma separated numbers to a 2-D float array, empty cells become nan
+    :param lines: list of strings, each string is a line of the file
+    :param width: int - number of columns in the file
+    :return: 2-D array with the shape (len(lines), width)
+    """
+    lines = [line.rstrip("\r\n") for line in lines]
+    # put nan in the empty cells, twice as the replacements can not overlap
+    text = ("," + ",".join(lines) + ",").replace(",,", ",nan,").replace(",,", ",nan,")
+    cells = text[1:-1].split(",")
+    if len(cells) != len(lines) * width:
+        # some lines are missing their trailing empty cells, pad the lines one by one
+        cells = []
+        for line in lines:
+            row = line.split(",")[:width]
+            cells.extend(row + (width - len(row)) * ["nan"])
+    try:
+        values = np.fromiter(map(float, cells), dtype=np.float64, count=len(cells))
+    except ValueError:  # a cell that is not a number, e.g. only spaces, read it as empty
+        values = np.array([_to_float(cell) for cell in cells], dtype=np.float64)
+    return values.reshape(len(lines), width)
+
+
+def _to_float(cell):
+    """ Convert a cell to a float, cells that are not numbers are nan """
+    try:
+        return float(cell)
+    except ValueError:
+        return np.nan
+
+
+def _valid_length(column):
+    """ Find the length of a column without the empty (nan) cells padding the end of it
+    :param column: 1-D array
+    :return: int - index after the last number in the column
+    """
+    valid = np.flatnonzero(~np.isnan(column))
+    if len(valid) == 0:
+        return 0
+    return valid[-1] + 1
+
+
+def _format_columns(columns, start, stop):
+    """ Format the rows start to stop of the columns to strings.  The adc only has 4096 levels
+    so the data only has a few thousand different values, each one is formatted only once and
+    the strings are put in place with the indexes np.unique returns
+    :param columns: list of 1-D arrays to format, can be different lengths and dtypes
+    :param start: int - first row to format
+    :param stop: int - row after the last row to format
+    :return: 2-D array of strings, cells past the end of a column are empty strings
+    """
+    text = np.full((stop - start, len(columns)), "", dtype=object)
+    for dtype in set(column.dtype for column in columns):
+        # columns of the same type are formatted together
+        indexes = [i for i, column in enumerate(columns) if column.dtype == dtype]
+        block = np.zeros((stop - start, len(indexes)), dtype=dtype)
+        filled = np.zeros(block.shape, dtype=bool)
+        for j, i in enumerate(indexes):
+            part = columns[i][start:stop]
+            block[:len(part), j] = part
+            filled[:len(part), j] = True
+        values, inverse = np.unique(block, return_inverse=True)
+        strings = np.array(values.astype(str), dtype=object)[inverse.reshape(block.shape)]
+        text[:, indexes] = np.where(filled, strings, "")
+    return text
+
+
+def _resize_1d(array, size):
+    """ Make a copy of array with size elements, the new elements are zero """
+    new_array = np.zeros(size, dtype=array.dtype)
+    new_array[:len(array)] = array
+    return new_array
+
+
+def _resize_2d(array, rows, columns):
+    """ Make a copy of array with the shape (rows, columns), the new elements are zero """
+    new_array = np.zeros((rows, columns), dtype=array.dtype)
+    new_array[:array.shape[0], :array.shape[1]] = array
+    return new_array
@@ -0,0 +1,130 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Fit current-voltage lines to a resistance, to check the TIA and the route resistances of the
+boards.
+
+Every column of every file is put in one 2-D array and the straight lines are fit to all the
+columns with one set of numpy sums, instead of a np.polyfit call for each column.  Points that
+are NaN (padding of shorter columns) or past the cutoff current, where the amplifier
+saturates, are masked out of each column's fit.
+
+The voltages are in mV and the currents in uA, so 1000 / slope is the resistance in ohms.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+# installed libraries
+import numpy as np
+
+CUTOFF = 50  # uA, points with a bigger current are not used in the fits
+MIN_POINTS = 3  # fewer points than this and the fit is NaN
+RESULT_FIELDS = ['resistance', 'slope', 'intercept', 'residual', 'points']
+
+
+def fit_lines(x, y, cutoff=CUTOFF):
+    """ Fit a straight line to each row of y
+    :param x: 1-D array of the voltages shared by every row, or a 2-D array the shape of y
+    :param y: 2-D array with the current of each column in a row, NaN for no point
+    :param cutoff: points with an absolute current of cutoff or more are not used, None to
+    use all the points
+    :return: dict of each name in RESULT_FIELDS: array with the value of each row, residual is
+    the standard error of the regression, the square root of the sum of the squared distances
+    of the points used from the line divided by points - 2
+    """
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    x = np.broadcast_to(np.asarray(x, dtype=np.float64), y.shape)
+    mask = np.isfinite(x) & np.isfinite(y)
+    if cutoff is not None:
+        with np.errstate(invalid='ignore'):
+            mask &= np.abs(y) < cutoff
+    x = np.where(mask, x, 0.0)
+    y = np.where(mask, y, 0.0)
+    points = mask.sum(axis=1)
+    sum_x, sum_y = x.sum(axis=1), y.sum(axis=1)
+    sum_xx, sum_xy = (x * x).sum(axis=1), (x * y).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (points * sum_xy - sum_x * sum_y) / (points * sum_xx - sum_x ** 2)
+        intercept = (sum_y - slope * sum_x) / points
+        errors = np.where(mask, y - (slope[:, np.newaxis] * x + intercept[:, np.newaxis]), 0.0)
+        residual = np.sqrt((errors ** 2).sum(axis=1) / (points - 2))
+        resistance = 1000.0 / slope
+    too_few = points < MIN_POINTS
+    results = {'resistance': resistance, 'slope': slope, 'intercept': intercept,
+               'residual': residual}
+    for field in results:
+        results[field][too_few] = np.nan
+    results['points'] = points
+    return results
+
+
+def pad_columns(x_columns, y_columns):
+    """ Put columns of different lengths in 2-D arrays, padded with NaN, for fit_lines
+    :param x_columns: list of the voltage arrays
+    :param y_columns: list of the current arrays
+    :return: 2-D array of the voltages and 2-D array of the currents, a row for each column
+    """
+    length = max(min(len(x), len(y)) for x, y in zip(x_columns, y_columns))
+    x_block = np.full((len(y_columns), length), np.nan)
+    y_block = np.full((len(y_columns), length), np.nan)
+    for i, (x, y) in enumerate(zip(x_columns, y_columns)):
+        points = min(len(x), len(y))
+        x_block[i, :points] = x[:points]
+        y_block[i, :points] = y[:points]
+    return x_block, y_block
+
+
+def fit_data(data, cutoff=CUTOFF):
+    """ Fit the runs in a PyplotData, e.g. the runs shown in the CV graph
+    :param data: pyplot_data_class.PyplotData with the runs
+    :param cutoff: uA, current past which points are not used
+    :return: dict of each name in RESULT_FIELDS: array with the value of each run, and
+    'label': list of the run labels
+    """
+    results = {field: np.full(data.index, np.nan) for field in RESULT_FIELDS}
+    for axis, runs, currents, lengths in data.axis_groups():
+        currents = np.where(np.arange(currents.shape[1]) < lengths[:, np.newaxis],
+                            currents, np.nan)
+        points = min(len(axis), currents.shape[1])
+        group = fit_lines(axis[:points], currents[:, :points], cutoff)
+        for field in RESULT_FIELDS:
+            results[field][runs] = group[field]
+    results['label'] = list(data.label[:data.index])
+    return results
+
+
+def load_columns(filename):
+    """ Read the voltage and current columns of a file
+    :param filename: csv or session file saved by the program, or an excel file with a
+    "voltage" index column like tools/Rs.xlsx
+    :return: list of tuples of the column label, voltage array and current array
+    """
+    if filename.endswith((".xlsx", ".xls")):
+        import pandas as pd  # only needed for excel files
+        frame = pd.read_excel(filename, index_col="voltage")
+        voltage = frame.index.to_numpy(dtype=np.float64)
+        return [(str(column), voltage, frame[column].to_numpy(dtype=np.float64))
+                for column in frame.columns]
+    import batch_analysis  # imported here as batch_analysis uses this module
+    return [(run['label'], run['x'], run['y']) for run in batch_analysis.load_runs(filename)]
+
+
+def fit_files(filenames, cutoff=CUTOFF):
+    """ Fit every column of many files at once
+    :param filenames: list of file names, see load_columns for the types
+    :param cutoff: uA, current past which points are not used
+    :return: list of row dicts with the 'file', 'label' and values in RESULT_FIELDS of each
+    column
+    """
+    columns = [(os.path.basename(filename), label, x, y)
+               for filename in filenames for label, x, y in load_columns(filename)]
+    if not columns:
+        return []
+    x_block, y_block = pad_columns([x for _, _, x, _ in columns],
+                                   [y for _, _, _, y in columns])
+    results = fit_lines(x_block, y_block, cutoff)
+    return [dict({'file': filename, 'label': label},
+                 **{field: results[field][i].item() for field in RESULT_FIELDS})
+            for i, (filename, label, _, _) in enumerate(columns)]
@@ -0,0 +1,192 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Record the serial traffic of a device and play it back without the device.
+
+SerialComm.start_capture (or the environment variable CAPTURE_VARIABLE set to a file name
+before the program starts) saves every write, read and input buffer clear to a capture
+file, in the binary record format of data_trace with the time.monotonic() of each one.
+
+ReplaySerial reads a capture file and stands in for SerialComm, so AmpUsb and the frames can
+be run on the recorded traffic.  Set the environment variable REPLAY_VARIABLE to a capture
+file and AmpUsb uses a ReplaySerial instead of looking for a device, or pass one to AmpUsb as
+its transport.  The replay runs at the recorded speed, scaled by speed, or as fast as it is
+read with speed=None.  The writes are checked against the recorded ones and the ones that
+differ are counted in ReplaySerial.mismatches so a replay can be used as a regression test.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import logging
+import os
+import threading
+import time
+# installed libraries
+import numpy as np
+# local files
+import data_trace
+
+CAPTURE_VARIABLE = "POTENTIOSTAT_CAPTURE"
+REPLAY_VARIABLE = "POTENTIOSTAT_REPLAY"
+
+# record names
+IDENTITY = "identity"  # the reply to the identify command, from when the capture started
+WRITE = "write"
+READ = "read"
+CLEAR = "clear"  # payload is the number of bytes that were thrown away
+
+
+class SerialRecorder(object):
+    """ Writes the records of a capture file, the reads and writes can come from different
+    threads """
+    def __init__(self, filename, identity=None):
+        """
+        :param filename: name of the capture file to make
+        :param identity: reply the device gave to the identify command, if it is connected
+        """
+        self.filename = filename
+        self._file = open(filename, 'wb')
+        self._lock = threading.Lock()
+        if identity is not None:
+            self.record(IDENTITY, identity)
+
+    def record(self, name, payload):
+        record = data_trace.encode_record(name, payload)
+        with self._lock:  # close can be called from another thread while a read is recorded
+            if self._file:
+                self._file.write(record)
+
+    def record_clear(self, dropped):
+        self.record(CLEAR, np.array([dropped], dtype=np.int64))
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self._file = None
+
+
+class ReplaySerial(object):
+    """ Transport with the methods of SerialComm that plays back a capture file """
+    def __init__(self, filename, speed=1.0):
+        """
+        :param filename: name of the capture file
+        :param speed: how many times faster than recorded to play the capture back, None to
+        not wait at all
+        """
+        self.filename = filename
+        self.speed = speed
+        self.identity = None
+        self._records = []
+        for timestamp, name, payload in data_trace.read_capture(filename):
+            if name == IDENTITY:
+                self.identity = bytes(payload)
+            else:
+                self._records.append((timestamp, name, payload))
+        self.found = True
+        self.connected = True
+        self.device = None  # there is no pyserial port
+        self.recorder = None
+        self.mismatches = 0
+        self._position = 0
+        self._pending = bytearray()
+        self._anchor = None  # (capture time, replay time) the replay is timed from
+
+    @property
+    def finished(self):
+        return self._position >= len(self._records)
+
+    def _due_time(self, timestamp):
+        if self._anchor is None:
+            self._anchor = (timestamp, time.monotonic())
+        return self._anchor[1] + (timestamp - self._anchor[0]) / self.speed
+
+    def _fill(self, number_bytes, wait):
+        """ Move the recorded reads that have come in to the input buffer, up to the next write
+        or clear, as the device would not send more before it was told to
+        :param number_bytes: stop once the buffer has this many bytes
+        :param wait: wait for reads that have not come in yet, else stop at them
+        """
+        while len(self._pending) < number_bytes and not self.finished:
+            timestamp, name, payload = self._records[self._position]
+            if name != READ:
+                return
+            if self.speed:
+                delay = self._due_time(timestamp) - time.monotonic()
+                if delay > 0:
+                    if not wait:
+                        return
+                    time.sleep(delay)
+            self._pending.extend(payload)
+            self._position += 1
+
+    def _advance_to(self, record_name):
+        """ Move all the reads before the next record_name to the input buffer
+        :return: the record, or None if there are no more of them
+        """
+        while not self.finished:
+            timestamp, name, payload = self._records[self._position]
+            if name == record_name:
+                self._position += 1
+                return timestamp, name, payload
+            if name == READ:
+                self._pending.extend(payload)
+            self._position += 1
+        return None
+
+    def read_data(self, data_length, encoding=None):
+        self._fill(data_length, wait=True)
+        data = bytes(self._pending[:data_length])
+        del self._pending[:data_length]
+        if encoding == 'int16':
+            return np.frombuffer(data[:2 * (len(data) // 2)], dtype='<i2').tolist()
+        elif encoding == 'str':
+            return data.decode("utf-8")
+        elif encoding:  # exclude None
+            raise Exception(f"Encoding: '{encoding}' not supported")
+        return data
+
+    def write_data(self, message):
+        if type(message) is str:
+            message = message.encode('utf-8')
+        record = self._advance_to(WRITE)
+        if record is None:
+            logging.warning("replay of %s has no more writes, got %s", self.filename, message)
+            self.mismatches += 1
+            return
+        timestamp, _, recorded = record
+        if bytes(recorded) != message:
+            logging.warning("replay write %s does not match the recorded %s", message,
+                            bytes(recorded))
+            self.mismatches += 1
+        if self.speed:
+            # the reads after a write are timed from when it was written in the replay
+            self._anchor = (timestamp, time.monotonic())
+
+    def clear_in_buffer(self):
+        record = self._advance_to(CLEAR)
+        dropped = int(record[2][0]) if record is not None else len(self._pending)
+        del self._pending[:dropped]
+
+    def bytes_waiting(self):
+        self._fill(float('inf'), wait=False)
+        return len(self._pending)
+
+    def poll_for_data(self):
+        self._fill(float('inf'), wait=False)
+        data = bytes(self._pending)
+        self._pending.clear()
+        return data
+
+    def start_capture(self, filename):
+        logging.warning("can not capture the traffic of a replay")
+
+    def stop_capture(self):
+        pass
+
+
+def replay_filename():
+    """ Get the capture file to replay instead of connecting a device, from the environment
+    variable REPLAY_VARIABLE, or None """
+    return os.environ.get(REPLAY_VARIABLE) or None
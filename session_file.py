@@ -0,0 +1,224 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Save and open all the data of a session in one binary file.
+
+The file is an 8 byte magic string, the length of the json header as a 4 byte little endian
+unsigned int, the json header and then the raw arrays.  Each array starts on a 64 byte
+boundary after the header and the header has the offset, dtype and length of each one.
+When a session is opened only the header is read, the rest of the file is memory mapped so
+the operating system only reads the arrays of the runs that are used.
+
+Each run in the header has the technique ('CV', 'ASV', 'amp' or 'chrono'), label, notes,
+color, run_info (settings, calibration and current range from DeviceParameters.run_info) and
+the location of its x axis, current and raw adc counts arrays.  Runs that share an x axis point
+to the same array.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import json
+import logging
+import struct
+
+# installed libraries
+import numpy as np
+
+SESSION_EXTENSION = ".session"
+MAGIC = b"PSOCSES1"
+VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sI")  # magic string and length of the json header
+
+
+def runs_from_pyplot_data(data, technique):
+    """ Make the list of runs to save from a PyplotData instance
+    :param data: pyplot_data_class.PyplotData with the runs
+    :param technique: str - 'CV' or 'ASV', what type of experiment the runs are
+    :return: list of dicts, one for each run, to pass to save_session
+    """
+    runs = []
+    for i in range(data.index):
+        voltage, current, raw = data.run_arrays(i)
+        runs.append({'technique': technique,
+                     'label': data.label[i],
+                     'notes': data.notes[i],
+                     'color': data.colors[i] if i < len(data.colors) else None,
+                     'run_info': data.run_info[i],
+                     'x': voltage,
+                     'y': current,
+                     'raw': raw})
+    return runs
+
+
+def save_session(filename, runs):
+    """ Save the runs to a session file
+    :param filename: name of the file to save
+    :param runs: list of dicts with the keys 'technique', 'label', 'notes', 'color', 'run_info',
+    'x', 'y' and 'raw' (the last 3 are arrays), runs_from_pyplot_data makes these
+    :return: list of the header entries of the runs, with the offsets of the arrays
+    """
+    arrays = []  # arrays to write, in order
+    placed = {}  # id of an array already placed -> (array, header entry), to share x axes
+    position = [0]  # offset after the header of the next array
+
+    def place(array):
+        if id(array) in placed:
+            return placed[id(array)][1]
+        data = np.asarray(array)
+        data = np.ascontiguousarray(data, dtype=data.dtype.newbyteorder('<'))
+        entry = {'offset': position[0], 'dtype': data.dtype.str, 'length': len(data)}
+        # keep a reference to array so its id is not reused while saving
+        placed[id(array)] = (array, entry)
+        arrays.append(data)
+        position[0] = _align(position[0] + data.nbytes)
+        return entry
+
+    header_runs = []
+    for run in runs:
+        header_runs.append({'technique': run['technique'],
+                            'label': run['label'],
+                            'notes': run.get('notes', " "),
+                            'color': run.get('color'),
+                            'run_info': run.get('run_info', {}),
+                            'x': place(run['x']),
+                            'y': place(run['y']),
+                            'raw': place(run.get('raw', np.zeros(0, dtype=np.int16)))})
+    header = json.dumps({'version': VERSION, 'runs': header_runs}).encode("utf-8")
+
+    with open(filename, 'wb') as _file:
+        _file.write(_PREFIX.pack(MAGIC, len(header)))
+        _file.write(header)
+        for array in arrays:  # the arrays are in offset order, pad each to the next boundary
+            _file.write(b"\0" * (_align(_file.tell()) - _file.tell()))
+            _file.write(array.tobytes())
+    logging.info("saved session with %i runs to %s", len(header_runs), filename)
+    return header_runs
+
+
+class SessionFile(object):
+    """ A session file opened for reading.  The arrays returned are views of a read only
+    memory map, they are only read from the disk when they are used.  The session is kept open
+    while the program shows its runs, load_runs gives runs to show and remembers which were
+    given so the others can be opened later
+    """
+    def __init__(self, filename):
+        """ Read the header of the session file and memory map the file
+        :param filename: name of the session file to open
+        """
+        self.filename = filename
+        with open(filename, 'rb') as _file:
+            magic, header_length = _PREFIX.unpack(_file.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise ValueError("{0} is not a session file".format(filename))
+            header = json.loads(_file.read(header_length).decode("utf-8"))
+        if header['version'] > VERSION:
+            raise ValueError("Session file version {0} is newer than this program can "
+                             "read".format(header['version']))
+        self.runs = header['runs']
+        self._data_start = _align(_PREFIX.size + header_length)
+        self._map = np.memmap(filename, dtype=np.uint8, mode='r')
+        self.loaded = set()  # index of the runs given out by load_runs
+
+    def __len__(self):
+        return len(self.runs)
+
+    def _array(self, entry):
+        """ Get a view of an array in the memory map
+        :param entry: dict with the offset, dtype and length of the array
+        :return: read only numpy array
+        """
+        if self._map is None:
+            raise ValueError("{0} is closed".format(self.filename))
+        dtype = np.dtype(entry['dtype'])
+        start = self._data_start + entry['offset']
+        return self._map[start:start + dtype.itemsize * entry['length']].view(dtype)
+
+    def x(self, index):
+        """ Get the x axis (voltage or time) of a run """
+        return self._array(self.runs[index]['x'])
+
+    def y(self, index):
+        """ Get the current of a run """
+        return self._array(self.runs[index]['y'])
+
+    def raw(self, index):
+        """ Get the raw adc counts of a run """
+        return self._array(self.runs[index]['raw'])
+
+    def indexes(self, technique):
+        """ Get the index of all the runs of one technique
+        :param technique: str - 'CV', 'ASV', 'amp' or 'chrono'
+        :return: list of ints
+        """
+        return [i for i, run in enumerate(self.runs) if run['technique'] == technique]
+
+    def saved_data(self, technique, indexes=None):
+        """ Get runs in the same format pyplot_data_class.read_csv_data returns, with the raw
+        adc counts and run info added
+        :param technique: str - 'CV', 'ASV', 'amp' or 'chrono', which runs to get
+        :param indexes: list of the index of the runs to get, None gets all the runs of technique
+        :return: dict with the keys 'type', 'labels', 'notes', 'colors', 'run_info', 'x', 'y'
+        and 'raw'
+        """
+        if indexes is None:
+            indexes = self.indexes(technique)
+        saved_data = {'type': technique if technique in ('amp', 'chrono') else 'cv', 'labels': [],
+                      'notes': [], 'colors': [], 'run_info': [], 'x': [], 'y': [], 'raw': []}
+        for i in indexes:
+            run = self.runs[i]
+            saved_data['labels'].append(run['label'])
+            saved_data['notes'].append(run['notes'])
+            saved_data['colors'].append(run['color'])
+            saved_data['run_info'].append(run['run_info'])
+            saved_data['x'].append(self.x(i))
+            saved_data['y'].append(self.y(i))
+            saved_data['raw'].append(self.raw(i))
+        return saved_data
+
+    def load_runs(self, technique, indexes):
+        """ Get runs to show with saved_data and remember they were loaded
+        :param technique: str - 'CV', 'ASV', 'amp' or 'chrono', the technique of the runs
+        :param indexes: list of the index of the runs
+        :return: dict from saved_data
+        """
+        self.loaded.update(indexes)
+        return self.saved_data(technique, indexes)
+
+    def unloaded_indexes(self, technique=None):
+        """ Get the index of the runs load_runs has not given out
+        :param technique: str - only get runs of this technique, None for all of them
+        :return: list of ints
+        """
+        return [i for i, run in enumerate(self.runs) if i not in self.loaded and
+                (technique is None or run['technique'] == technique)]
+
+    def copy_runs(self, indexes):
+        """ Copy runs out of the memory map in the format save_session takes, so they can be
+        saved again, even over this file.  Runs that share an x axis still share the copy
+        :param indexes: list of the index of the runs
+        :return: list of run dicts
+        """
+        x_copies = {}  # offset of an x axis in the file -> its copy
+        runs = []
+        for i in indexes:
+            run = self.runs[i]
+            if run['x']['offset'] not in x_copies:
+                x_copies[run['x']['offset']] = np.array(self.x(i))
+            runs.append({'technique': run['technique'], 'label': run['label'],
+                         'notes': run['notes'], 'color': run['color'],
+                         'run_info': run['run_info'], 'x': x_copies[run['x']['offset']],
+                         'y': np.array(self.y(i)), 'raw': np.array(self.raw(i))})
+        return runs
+
+    def close(self):
+        """ Release the memory map.  Arrays already returned keep a reference to the map, so
+        it is only unmapped when the last of them is freed and they can still be read
+        """
+        self._map = None
+
+
+def _align(position):
+    """ Round position up to the next ALIGNMENT boundary """
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
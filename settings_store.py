@@ -0,0 +1,147 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Store the settings of each technique in one file so they are remembered between runs of the
+program.
+
+The file is read once when the store is made and the settings are kept in memory after that.
+Changing a setting only marks the store as dirty and starts a short timer, so many changes in
+a row are saved with one write.  The file is written to a temporary file that then replaces
+the settings file, so the settings file is never left half written.
+
+The file keeps the "name = value" lines of the old settings.txt.  The CV settings have no
+prefix, so old settings files still load, and the other sections are prefixed with their
+name, e.g. "asv.clean_volt = 800".
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import logging
+import os
+import threading
+
+WRITE_DELAY = 1.0  # seconds to wait for more changes before writing the file
+
+
+class SettingsStore(object):
+    """ Typed settings for each section, loaded once and saved when they change """
+    def __init__(self, filename, sections, choices=None, write_delay=WRITE_DELAY):
+        """ Load the settings file
+        :param filename: name of the settings file
+        :param sections: dict of section name: dict of the default value of each setting, the
+        type of the default is the type the setting is converted to.  The section named '' is
+        saved without a prefix
+        :param choices: dict of setting name: list of the values the setting can have, for
+        settings that can only be certain strings
+        :param write_delay: seconds to wait after a change before writing the file
+        """
+        self.filename = filename
+        self.defaults = sections
+        self.choices = choices or {}
+        self.write_delay = write_delay
+        self.values = {section: dict(defaults) for section, defaults in sections.items()}
+        self.dirty = False
+        self.writes = 0  # number of times the file was written
+        self._lock = threading.Lock()
+        self._timer = None
+        self.load()
+
+    def load(self):
+        """ Read the settings file, settings that are missing or can not be converted keep
+        their default value
+        """
+        try:
+            with open(self.filename, 'r') as _file:
+                lines = _file.readlines()
+        except OSError as error:
+            logging.debug("no settings loaded from %s: %s", self.filename, error)
+            return
+        for line in lines:
+            if '=' not in line:
+                continue
+            name, text = line.split('=', 1)
+            section, _, key = name.strip().rpartition('.')
+            if section in self.values and key in self.values[section]:
+                value = convert(text.strip(), self.defaults[section][key])
+                if value is not None and value in self.choices.get(key, [value]):
+                    self.values[section][key] = value
+
+    def get(self, section, key):
+        return self.values[section][key]
+
+    def section(self, section):
+        """ Get a copy of the settings of a section
+        :param section: name of the section
+        :return: dict of setting name: value
+        """
+        with self._lock:
+            return dict(self.values[section])
+
+    def update(self, section, **settings):
+        """ Change settings of a section and schedule a write if any of them are different
+        :param section: name of the section
+        :param settings: setting name=new value, names that are not in the section are ignored
+        """
+        with self._lock:
+            for key, value in settings.items():
+                if key in self.values[section] and self.values[section][key] != value:
+                    self.values[section][key] = value
+                    self.dirty = True
+            if self.dirty and self._timer is None:
+                self._timer = threading.Timer(self.write_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """ Write the settings file now if any settings were changed """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.dirty:
+                return
+            lines = []
+            for section, values in self.values.items():
+                prefix = section + '.' if section else ''
+                for key, value in values.items():
+                    lines.append("{0}{1} = {2}\n".format(prefix, key, value))
+            temp_filename = self.filename + ".tmp"
+            try:
+                with open(temp_filename, 'w') as _file:
+                    _file.writelines(lines)
+                    _file.flush()
+                    os.fsync(_file.fileno())
+                os.replace(temp_filename, self.filename)
+            except OSError as error:
+                logging.error("could not save the settings to %s: %s", self.filename, error)
+                return
+            self.dirty = False
+            self.writes += 1
+
+    def close(self):
+        """ Write any changes that are waiting, call this when the program closes """
+        self.flush()
+
+
+def convert(text, default):
+    """ Convert the text of a setting to the type of its default value
+    :param text: str - value read from the settings file
+    :param default: default value of the setting
+    :return: the converted value or None if it could not be converted
+    """
+    # check bool first, bools are also ints
+    if isinstance(default, bool):
+        if text in ("True", "False"):
+            return text == "True"
+        return None
+    try:
+        if isinstance(default, int):
+            # settings entered by the user can be floats, keep them if they are not whole
+            number = float(text)
+            return int(number) if number.is_integer() else number
+        if isinstance(default, float):
+            return float(text)
+    except ValueError:
+        return None
+    return text
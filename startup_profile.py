@@ -0,0 +1,102 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Time how long each module takes to import, to track how long the program takes to start.
+
+Works like python -X importtime but can be turned on for a normal start of the program by
+running it with --import-time or with the environment variable PSOC_IMPORT_TIME set.
+install_if_requested has to be called before the imports to time, and report writes the
+imports timed since the last report, in the -X importtime format, to the log and stderr.
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import builtins
+import logging
+import os
+import sys
+import time
+
+ENVIRONMENT_VARIABLE = "PSOC_IMPORT_TIME"
+COMMAND_LINE_FLAG = "--import-time"
+
+_original_import = None  # builtins.__import__ before it was wrapped, None if not installed
+_records = []  # (depth, module name, self seconds, cumulative seconds) as each import finishes
+_child_times = []  # stack of the time spent in the imports made by each import being timed
+_start_time = None
+
+
+def requested():
+    """ Check if the user asked for the import times """
+    return bool(os.environ.get(ENVIRONMENT_VARIABLE)) or COMMAND_LINE_FLAG in sys.argv
+
+
+def install_if_requested():
+    """ Start timing imports if the user asked for it """
+    if requested():
+        install()
+
+
+def install():
+    """ Start timing imports by wrapping builtins.__import__ """
+    global _original_import, _start_time
+    if _original_import is not None:
+        return
+    _original_import = builtins.__import__
+    _start_time = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def uninstall():
+    """ Stop timing imports and put back the original builtins.__import__ """
+    global _original_import
+    if _original_import is not None:
+        builtins.__import__ = _original_import
+        _original_import = None
+
+
+def is_installed():
+    return _original_import is not None
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """ Replacement for builtins.__import__ that times the first import of each module """
+    if level or name in sys.modules:  # only time modules that have to be loaded
+        return _original_import(name, globals, locals, fromlist, level)
+    _child_times.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        child_time = _child_times.pop()
+        if _child_times:  # add this import to the time of the import that made it
+            _child_times[-1] += elapsed
+        _records.append((len(_child_times), name, elapsed - child_time, elapsed))
+
+
+def report(title="startup", stream=None):
+    """ Write the imports timed since the last report to the log and stderr, does nothing if
+    import timing is not installed
+    :param title: str - what was being done when the imports were made
+    :param stream: file to write to, default is sys.stderr
+    :return: list of the lines written
+    """
+    if not is_installed():
+        return []
+    stream = stream or sys.stderr
+    lines = ["import time: self [us] | cumulative | imported package"]
+    total = 0.0
+    for depth, name, self_time, cumulative in _records:
+        lines.append("import time: {0:>9} | {1:>10} | {2}{3}".format(
+            int(self_time * 1e6), int(cumulative * 1e6), "  " * depth, name))
+        if depth == 0:
+            total += cumulative
+    lines.append("{0}: {1} imports took {2:.3f} s, {3:.3f} s since timing started".format(
+        title, len(_records), total, time.perf_counter() - _start_time))
+    del _records[:]
+    for line in lines:
+        logging.info(line)
+        print(line, file=stream)
+    return lines
@@ -0,0 +1,94 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the Pipeline class and run_in_background function in acquisition_pipeline.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import time
+import unittest
+
+# local files
+import acquisition_pipeline
+
+
+class FakeMaster(object):
+    """ Stand in for a tkinter widget that runs the after calls when run_pending is called """
+    def __init__(self):
+        self.pending = []
+
+    def after(self, _delay, function):
+        self.pending.append(function)
+
+    def run_pending(self, timeout=2.0):
+        end = time.time() + timeout
+        while self.pending and time.time() < end:
+            self.pending.pop(0)()
+            time.sleep(0.005)
+
+
+def counter_reader(number_items):
+    items = iter(range(number_items))
+    return lambda: next(items, None)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_data_passes_in_order(self):
+        """ Test the data read is converted and drained in the order it was read """
+        pipeline = acquisition_pipeline.Pipeline(counter_reader(50), lambda x: 2 * x)
+        pipeline.start()
+        drained = []
+        end = time.time() + 2.0
+        while len(drained) < 50 and time.time() < end:
+            drained.extend(pipeline.drain())
+            time.sleep(0.005)
+        pipeline.stop()
+        self.assertEqual(drained, [2 * x for x in range(50)])
+        self.assertFalse(pipeline.running)
+
+    def test_backpressure_is_reported(self):
+        """ Test a display that does not drain makes the earlier stages wait, and the
+        waiting is counted instead of the data being lost """
+        pipeline = acquisition_pipeline.Pipeline(counter_reader(20), queue_size=2)
+        pipeline.start()
+        time.sleep(0.5)
+        report = pipeline.report()
+        self.assertGreater(report['convert']['full_count'], 0)
+        self.assertGreater(report['read']['blocked_time'], 0)
+        self.assertEqual(len(pipeline.drain()), 2)
+        pipeline.stop()
+
+    def test_read_errors_are_counted(self):
+        """ Test a read that raises does not stop the read thread """
+        calls = []
+
+        def read():
+            calls.append(1)
+            if len(calls) == 1:
+                raise IOError("unplugged")
+            return len(calls) if len(calls) < 4 else None
+        pipeline = acquisition_pipeline.Pipeline(read)
+        pipeline.start()
+        time.sleep(0.3)
+        pipeline.stop()
+        self.assertEqual(pipeline.drain(), [2, 3])
+        self.assertEqual(pipeline.report()['read']['errors'], 1)
+
+
+class TestRunInBackground(unittest.TestCase):
+    def test_result_is_returned_on_master(self):
+        """ Test the result of the work is passed to on_done by an after call """
+        master = FakeMaster()
+        results = []
+        acquisition_pipeline.run_in_background(master, lambda: 42, results.append)
+        master.run_pending()
+        self.assertEqual(results, [42])
+
+    def test_error_is_passed_to_on_error(self):
+        master = FakeMaster()
+        errors = []
+        acquisition_pipeline.run_in_background(master, lambda: 1 / 0, None, errors.append)
+        master.run_pending()
+        self.assertIsInstance(errors[0], ZeroDivisionError)
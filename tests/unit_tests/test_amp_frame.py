@@ -11,10 +11,13 @@ __author__ = "Kyle Vitautas Lopin"
 # standard libraries
 import filecmp
 import os
+import threading
+import time
 import unittest
 from unittest import mock
 
 # local files
+import acquisition_pipeline
 import amp_frame
 import graph_properties
 import properties
@@ -48,3 +51,97 @@ class TestAmpFrame(unittest.TestCase):
             mock_open.return_value = SAVED_FILE
             self.amp_frame.save_data(device)
             self.assertTrue(filecmp.cmp(SAVED_FILE, SOLN_FILE))
+
+
+def make_handler():
+    """ Make a USBHandler in the middle of a run, with a mocked device """
+    handler = amp_frame.AmpFrame.USBHandler.__new__(amp_frame.AmpFrame.USBHandler)
+    handler.graph, handler.device, handler.master = mock.Mock(), mock.Mock(), mock.Mock()
+    handler.device.io_lock = threading.RLock()
+    handler.running, handler._reader = True, None
+    handler.time, handler.data = [0.1], [1.0]
+    handler.device_samples_smooth = 1
+    return handler
+
+
+class TestCancelRun(unittest.TestCase):
+    def test_cancel_keeps_converted_packets(self):
+        """ Test cancelling a run graphs the packets already converted and does not wait
+        long for a read that is stuck """
+        release = threading.Event()
+
+        def stuck_read():
+            release.wait(5)
+        handler = make_handler()
+        handler.pipeline = acquisition_pipeline.Pipeline(stuck_read, name="test")
+        handler.pipeline.out_queue.put(([0.2, 0.3], [2.0, 3.0]))
+        handler.pipeline.start()
+        start = time.perf_counter()
+        handler.cancel_run()
+        elapsed = time.perf_counter() - start
+        release.set()
+        handler.pipeline.stop()
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(handler.time, [0.1, 0.2, 0.3])
+        self.assertEqual(handler.data, [1.0, 2.0, 3.0])
+        handler.graph.update_amp_data.assert_called_once_with(handler.time, handler.data, 10)
+        handler.device.send_command.assert_called_with('reset')
+
+    def test_reset_waits_for_a_started_read(self):
+        """ Test the reset of a cancel is not sent between the export command of a read that
+        has started and the read of its data, and no read starts after the cancel """
+        handler = make_handler()
+        handler.first_read_dumbed = True
+        handler.number_packets, handler.data_packet_size = 1, 10
+        handler.sizer = mock.Mock()
+        messages = []
+        reading = threading.Event()
+
+        def get_data(_number_packets):
+            reading.set()
+            time.sleep(0.5)  # longer than the cancel waits for the pipeline
+            messages.append('read')
+            return [1, 2, 3]
+        handler.device.usb_read_message.return_value = "Done1"
+        handler.device.send_command.side_effect = lambda name, *values: messages.append(name)
+        handler.device.get_data.side_effect = get_data
+        handler.device.bytes_waiting.return_value = 0
+        handler.pipeline = acquisition_pipeline.Pipeline(handler.read_packet, name="test")
+        handler.pipeline.start()
+        self.assertTrue(reading.wait(2))
+        handler.cancel_run()
+        handler.pipeline.stop()
+        self.assertEqual(messages[-3:], ['export_amp', 'read', 'reset'])
+        self.assertIsNone(handler.read_packet())
+
+
+class TestPacketSizer(unittest.TestCase):
+    def test_low_rate_latency(self):
+        """ Test slow sampling rates get small packets so the data is shown quickly """
+        sizer = amp_frame.PacketSizer(100)
+        self.assertEqual(sizer.start_run(100), 10)
+        self.assertEqual(sizer.poll_interval, 50)  # twice for each packet
+        self.assertEqual(amp_frame.PacketSizer(5).start_run(5), 1)
+
+    def test_measured_rate_and_backlog(self):
+        """ Test the poll interval follows the measured rate, polls fast when packets wait
+        and that the next run uses bigger packets if they backed up """
+        sizer = amp_frame.PacketSizer(10000)
+        self.assertEqual(sizer.start_run(10000), 1000)
+        start = sizer._start_time
+        sizer.packet_received(1000, 0, now=start + 0.2)  # data is coming at 5000 / s
+        self.assertEqual(sizer.poll_interval, 100)
+        sizer.packet_received(1000, 3, now=start + 0.25)
+        self.assertEqual(sizer.poll_interval, amp_frame.MIN_POLL_INTERVAL)
+        self.assertEqual(sizer.start_run(10000), 2000)
+        # a new sampling rate starts the measurements over
+        self.assertEqual(sizer.start_run(1000), 100)
+
+    def test_interval_is_rounded(self):
+        """ Test float noise in a measured rate does not knock the poll interval down 1 ms """
+        sizer = amp_frame.PacketSizer(100)
+        self.assertEqual(sizer.start_run(100), 10)
+        self.assertEqual(sizer._interval_for(100 * (1 + 1e-12)), 50)
+        self.assertEqual(sizer._interval_for(100 * (1 - 1e-12)), 50)
+        self.assertEqual(sizer._interval_for(101), 50)  # 49.5 ms
+        self.assertEqual(sizer._interval_for(99), 51)  # 50.5 ms
@@ -0,0 +1,79 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test stopping an ASV run and a phase failing in the USBHandler of asv_frame.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import threading
+import time
+import tkinter as tk
+import unittest
+from unittest import mock
+
+# local files
+import asv_frame
+import asv_sequencer
+import properties
+
+
+class TestASVStop(unittest.TestCase):
+    def setUp(self):
+        master = mock.Mock()
+        master.device_params = properties.DeviceParameters()
+        self.handler = asv_frame.ASVFrame.USBHandler(mock.Mock(), mock.Mock(), master,
+                                                     mock.Mock())
+        self.handler.run_button = mock.Mock()
+
+    def start_sequencer(self, phases):
+        self.handler.sequencer = asv_sequencer.ASVSequencer(phases)
+        self.handler.sequencer.start()
+        while not self.handler.sequencer.transitions:  # wait for the first action to start
+            time.sleep(0.001)
+
+    def test_stop_during_a_phase(self):
+        """ Test stop does not wait for the phase, the run ends when check_sequencer sees it
+        finished """
+        release = threading.Event()
+        self.start_sequencer([asv_sequencer.Phase('clean', 0.0, release.wait),
+                              asv_sequencer.Phase('plate', 5.0, None)])
+        self.handler.after_function = "after#1"
+        self.handler.stop()
+        self.assertTrue(self.handler.sequencer.cancelled)
+        self.handler.run_button.config.assert_called_once_with(state=tk.DISABLED)
+        self.handler.device.reset.assert_not_called()
+        self.handler.master.after_cancel.assert_not_called()
+
+        self.handler.check_sequencer()  # still in the clean action, so it polls again
+        self.handler.device.reset.assert_not_called()
+        release.set()
+        self.assertTrue(self.handler.sequencer.wait(1.0))
+        self.handler.check_sequencer()
+        self.handler.device.reset.assert_called_once_with()
+        self.assertEqual(self.handler.run_button.config.call_args[1]['state'], tk.NORMAL)
+        self.handler.device.set_last_run.assert_not_called()
+
+    def test_failed_phase_restores_the_run_button(self):
+        self.start_sequencer([asv_sequencer.Phase('plate', 0.0, lambda: 1 / 0)])
+        self.assertTrue(self.handler.sequencer.wait(1.0))
+        with self.assertLogs(level='ERROR') as logs:
+            self.handler.check_sequencer()
+        self.assertIn("the plate phase failed", logs.output[-1])
+        self.assertEqual(self.handler.run_button.config.call_args[1]['text'], "Run ASV")
+        self.handler.device.reset.assert_called_once_with()
+        self.handler.device.set_last_run.assert_not_called()
+
+    def test_stop_after_the_phases(self):
+        """ Test stop when the sequencer is done ends the run right away """
+        self.start_sequencer([asv_sequencer.Phase('clean', 0.0, None)])
+        self.assertTrue(self.handler.sequencer.wait(1.0))
+        self.handler.after_function = "after#1"
+        self.handler.stop()
+        self.handler.master.after_cancel.assert_called_once_with("after#1")
+        self.handler.device.reset.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the ASVSequencer class and make_phases function in asv_sequencer.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import threading
+import time
+import unittest
+from unittest import mock
+
+# local files
+import asv_sequencer
+import properties
+
+
+class TestASVSequencer(unittest.TestCase):
+    def test_phases_keep_their_schedule(self):
+        """ Test a slow action does not make the run longer, the phase after it starts on
+        time """
+        calls = []
+        phases = [asv_sequencer.Phase('clean', 0.1, lambda: (calls.append('clean'),
+                                                             time.sleep(0.05))),
+                  asv_sequencer.Phase('plate', 0.1, lambda: calls.append('plate')),
+                  asv_sequencer.Phase('strip', 0.05, None)]
+        sequencer = asv_sequencer.ASVSequencer(phases)
+        sequencer.start()
+        self.assertTrue(sequencer.wait(2.0))
+        self.assertEqual(calls, ['clean', 'plate'])
+        self.assertEqual([transition.planned for transition in sequencer.transitions],
+                         [0.0, 0.1, 0.2])
+        for transition in sequencer.transitions:
+            self.assertAlmostEqual(transition.actual, transition.planned, delta=0.03)
+        durations = sequencer.durations()
+        self.assertAlmostEqual(durations['plate'], 0.1, delta=0.03)
+        self.assertAlmostEqual(sequencer.end_time - sequencer.start_time, 0.25, delta=0.03)
+        self.assertFalse(sequencer.cancelled)
+
+    def test_stop_and_status(self):
+        """ Test the time left comes from the clock and stopping skips the later phases """
+        calls = []
+        phases = [asv_sequencer.Phase('clean', 5.0, None),
+                  asv_sequencer.Phase('plate', 5.0, lambda: calls.append('plate'))]
+        sequencer = asv_sequencer.ASVSequencer(phases)
+        self.assertEqual(sequencer.status(), (None, 0.0, 0.0))
+        sequencer.start()
+        time.sleep(0.05)
+        phase, phase_left, total_left = sequencer.status()
+        self.assertEqual(phase, 'clean')
+        self.assertAlmostEqual(total_left - phase_left, 5.0, delta=0.01)
+        sequencer.stop()
+        self.assertTrue(sequencer.wait(1.0))
+        self.assertTrue(sequencer.cancelled)
+        self.assertEqual(calls, [])
+
+    def test_stop_does_not_wait_for_an_action(self):
+        """ Test stop returns while a phase's action is still running """
+        release = threading.Event()
+        sequencer = asv_sequencer.ASVSequencer([asv_sequencer.Phase('clean', 0.0, release.wait),
+                                                asv_sequencer.Phase('plate', 5.0, None)])
+        sequencer.start()
+        while not sequencer.transitions:  # wait for the clean action to start
+            time.sleep(0.001)
+        start = time.monotonic()
+        sequencer.stop()
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertFalse(sequencer.finished)
+        release.set()
+        self.assertTrue(sequencer.wait(1.0))
+        self.assertEqual([transition.name for transition in sequencer.transitions], ['clean'])
+
+    def test_failed_action_cancels(self):
+        sequencer = asv_sequencer.ASVSequencer([asv_sequencer.Phase('clean', 0.0, lambda: 1 / 0),
+                                                asv_sequencer.Phase('plate', 0.0, None)])
+        sequencer.start()
+        sequencer.wait(1.0)
+        self.assertTrue(sequencer.cancelled)
+        self.assertIsInstance(sequencer.error, ZeroDivisionError)
+        self.assertEqual(len(sequencer.transitions), 1)
+        self.assertEqual(sequencer.failed_phase, 'clean')
+
+
+class TestMakePhases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.settings = properties.DeviceParameters().asv_settings
+        self.device = mock.Mock()
+        self.device.device_params.dac.get_dac_count.return_value = 1000
+        self.send_strip = mock.Mock()
+
+    def test_host_timed_phases(self):
+        """ Test a device without the program capability is sent each phase's commands """
+        self.device.has_capability.return_value = False
+        phases = asv_sequencer.make_phases(self.device, self.settings, self.send_strip)
+        self.assertEqual([phase.name for phase in phases], ['clean', 'plate', 'strip'])
+        for phase in phases:
+            phase.action()
+        self.device.short_tia_resistor.assert_called_once()
+        self.device.set_anode_voltage.assert_called_with(self.settings.plate_volt)
+        self.send_strip.assert_called_once()
+        self.device.send_command.assert_called_once_with('run')
+
+    def test_device_program(self):
+        """ Test a device with the program capability is sent the whole program at once """
+        self.device.has_capability.return_value = True
+        phases = asv_sequencer.make_phases(self.device, self.settings, self.send_strip)
+        self.assertIsNone(phases[1].action)
+        phases[0].action()
+        self.send_strip.assert_called_once()
+        self.device.send_command.assert_called_once_with(
+            'asv_program', 1000, int(round(self.settings.clean_time * 1000)), 1000,
+            int(round(self.settings.plate_time * 1000)))
@@ -0,0 +1,83 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the run_batch function and analysis cache in batch_analysis.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+import tempfile
+import unittest
+
+# installed libraries
+import numpy as np
+
+# local files
+import batch_analysis
+import pyplot_data_class
+import session_file
+
+VOLTAGE = np.arange(-500, 501, 10, dtype=np.float64)
+
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, "cache.json")
+        data = pyplot_data_class.PyplotData()
+        for resistance in [10000, 20000]:  # ohms, the current is in uA
+            data.add_data(VOLTAGE, 1000.0 * VOLTAGE / resistance)
+        for i in range(3):
+            with open(os.path.join(self.tmp_dir.name, "run_{0}.csv".format(i)), 'w',
+                      newline='') as _file:
+                data.save_all_data(_file)
+        session_file.save_session(os.path.join(self.tmp_dir.name, "runs.session"),
+                                  session_file.runs_from_pyplot_data(data, 'CV'))
+        with open(os.path.join(self.tmp_dir.name, "bad.csv"), 'w') as _file:
+            _file.write("not data\n")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_files_are_analyzed_in_a_pool(self):
+        """ Test every run of every file gets a row and a bad file gets an error row """
+        progress = []
+        rows = batch_analysis.run_batch([self.tmp_dir.name], ['fit', 'peaks'], workers=2,
+                                        cache_file=self.cache_file,
+                                        progress=lambda *args: progress.append(args))
+        self.assertEqual(len(progress), 5)
+        self.assertEqual(progress[-1][:2], (5, 5))
+        errors = [row for row in rows if 'error' in row]
+        self.assertEqual([os.path.basename(row['file']) for row in errors], ["bad.csv"])
+        runs = [row for row in rows if 'error' not in row]
+        self.assertEqual(len(runs), 8)
+        for row in runs:
+            self.assertIn('anodic_potential', row)
+            self.assertAlmostEqual(row['resistance'], 10000 * (row['run'] + 1), delta=1)
+
+    def test_unchanged_files_are_skipped(self):
+        """ Test only the files changed since the last batch and the file that failed are
+        analyzed again """
+        batch_analysis.run_batch([self.tmp_dir.name], ['baseline'], workers=1,
+                                 cache_file=self.cache_file)
+        changed = os.path.join(self.tmp_dir.name, "run_1.csv")
+        stats = os.stat(changed)
+        os.utime(changed, ns=(stats.st_atime_ns, stats.st_mtime_ns + 10 ** 9))
+        progress = []
+        rows = batch_analysis.run_batch([self.tmp_dir.name], ['baseline'], workers=1,
+                                        cache_file=self.cache_file,
+                                        progress=lambda *args: progress.append(args))
+        self.assertEqual(sorted(os.path.basename(args[2]) for args in progress),
+                         ["bad.csv", "run_1.csv"])
+        self.assertEqual(len(rows), 9)
+        self.assertIn('baseline_mean', rows[-1])
+
+    def test_unknown_analysis(self):
+        with self.assertRaises(ValueError):
+            batch_analysis.run_batch([self.tmp_dir.name], ['fourier'], cache_file=None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the SampleBuffer class and USBHandler of chrono_frame.py, and the ChronoSettings
+class in properties.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import threading
+import unittest
+from unittest import mock
+
+# installed libraries
+import numpy as np
+
+# local files
+import acquisition_pipeline
+import chrono_frame
+import properties
+
+
+class TestSampleBuffer(unittest.TestCase):
+    def test_grows_and_trims(self):
+        """ Test the buffer keeps every sample when it has to grow and trim drops the end """
+        buffer = chrono_frame.SampleBuffer(4)
+        buffer.extend([1, 2, 3])
+        buffer.extend(np.arange(4, 11))
+        self.assertEqual(len(buffer), 10)
+        self.assertEqual(buffer.values().tolist(), list(range(1, 11)))
+        buffer.trim(6)
+        self.assertEqual(buffer.values().tolist(), list(range(1, 7)))
+
+    def test_display_stride(self):
+        self.assertEqual(chrono_frame.display_stride(10), 1)
+        self.assertEqual(chrono_frame.display_stride(10001, max_points=5000), 3)
+
+
+class TestChronoSettings(unittest.TestCase):
+    def setUp(self) -> None:
+        self.settings = properties.ChronoSettings(properties.PWM_FREQ)
+
+    def test_steps_skip_zero_times(self):
+        """ Test a step with no time is left out of the run and the run is sized from the
+        others """
+        self.settings.update_settings(initial_time=0.5, step_time=2, final_time=0,
+                                      sampling_rate=1000)
+        self.assertEqual(self.settings.steps(), [(0, 0.5), (500, 2.0)])
+        self.assertEqual(self.settings.total_time, 2.5)
+        self.assertEqual(self.settings.number_samples, 2500)
+
+    def test_bad_settings_are_not_saved(self):
+        for bad_setting in [{'step_time': 0}, {'initial_time': -1},
+                            {'sampling_rate': 10 ** 6}, {'step_volts': 10}]:
+            with self.assertRaises(ValueError):
+                self.settings.update_settings(**bad_setting)
+        self.assertEqual(self.settings.step_time,
+                         properties.DEFAULT_CHRONO_SETTINGS['step_time'])
+
+
+class TestChronoUSBHandler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.master = mock.Mock()
+        self.master.device_params = properties.DeviceParameters()
+        self.master.device_params.chrono_settings = properties.ChronoSettings(
+            properties.PWM_FREQ)
+        device = mock.Mock()
+        device.device_params = self.master.device_params
+        device.io_lock = threading.RLock()
+        self.handler = chrono_frame.ChronoFrame.USBHandler(mock.Mock(), device, self.master)
+
+    def test_lost_samples_keep_the_time_axis(self):
+        """ Test lost samples are filled with NaN so the samples after them keep their time """
+        self.handler.device.process_data.return_value = [1.0, 2.0]
+        self.handler.data.extend(self.handler.convert_packet(([10, 20], 0)))
+        self.handler.data.extend(self.handler.convert_packet(([30, 40], 3)))
+        values = self.handler.data.values()
+        self.assertEqual(len(values), 7)
+        self.assertTrue(np.isnan(values[2:5]).all())
+        self.assertAlmostEqual(self.handler.times()[6], 6 * self.handler.time_step)
+
+    def test_steps_are_sent_by_the_sequencer(self):
+        """ Test the first voltage starts the stream and the later steps are sent on time """
+        self.master.device_params.chrono_settings.update_settings(
+            initial_time=0.05, step_time=0.05, final_time=0.05, step_voltage=200)
+        self.handler.device.deframer = None
+        self.handler.amp_run(mock.Mock(), mock.Mock())
+        self.assertTrue(self.handler.sequencer.wait(2.0))
+        commands = [call.args for call in self.handler.device.send_command.call_args_list]
+        self.assertEqual(commands[0][0], 'amperometry')
+        self.assertEqual(commands[0][1], self.handler.format_voltage(0))
+        self.assertEqual(commands[1:], [('anode_voltage', self.handler.format_voltage(200)),
+                                        ('anode_voltage', self.handler.format_voltage(0))])
+        self.assertEqual(self.handler.data._data.size, 150)
+
+    def queued_pipeline(self, *packets):
+        """ Give the handler a stopped run with packets still waiting to be drained """
+        self.handler.running = True
+        self.handler.frame = mock.Mock()
+        self.handler.sequencer = mock.Mock(transitions=[])
+        self.handler.data = chrono_frame.SampleBuffer(10)
+        self.handler.pipeline = acquisition_pipeline.Pipeline(lambda: None, name="test")
+        for packet in packets:
+            self.handler.pipeline.out_queue.put(packet)
+
+    def test_cancel_keeps_queued_samples(self):
+        """ Test a cancel adds the samples still in the pipeline and resets the device """
+        self.queued_pipeline(np.array([1.0, 2.0]), np.array([3.0]))
+        self.handler.cancel_run()
+        self.assertEqual(self.handler.data.values().tolist(), [1.0, 2.0, 3.0])
+        self.handler.device.send_command.assert_called_with('reset')
+        self.handler.device.clear_in_buffer.assert_called_once_with()
+
+    def test_finish_trims_queued_samples(self):
+        """ Test finishing a run with packets still queued keeps no more than the run's
+        samples and tells the frame the run is over """
+        number_samples = self.handler.settings.number_samples
+        self.queued_pipeline(np.ones(number_samples - 2), np.full(5, 2.0))
+        self.handler.finish_run()
+        values = self.handler.data.values()
+        self.assertEqual(len(values), number_samples)
+        self.assertEqual(values[-3:].tolist(), [1.0, 2.0, 2.0])
+        self.handler.device.send_command.assert_called_with('reset')
+        self.handler.frame.run_finished.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
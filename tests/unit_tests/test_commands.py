@@ -0,0 +1,64 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the command encoders in commands.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import unittest
+
+# local files
+import commands
+
+
+class TestCommands(unittest.TestCase):
+    def test_ascii_commands(self):
+        """ Test the ASCII commands are the same as the ones the device has always been sent """
+        self.assertEqual(commands.encode_ascii('cv_sweep', 1148, 2068, 479, "CS"),
+                         "S|1148|2068|00479|CS")
+        self.assertEqual(commands.encode_ascii('adc_tia', 1, 0, 0, 'F', 2), "A|1|0|0|F|2")
+        self.assertEqual(commands.encode_ascii('pwm_compare', 1919.0), "C|01919")
+        self.assertEqual(commands.encode_ascii('dpv_sweep', 1148, 2068, 25, 5, 2399),
+                         "G|1148|2068|025|005|02399")
+        self.assertEqual(commands.encode_ascii('voltage_source', 2), "VS2")
+        self.assertEqual(commands.encode_ascii('export', 0), "E0")
+        self.assertEqual(commands.encode_ascii('run'), "R")
+
+    def test_binary_round_trip(self):
+        """ Test a binary frame is decoded back to the same command and values """
+        frame = commands.encode_binary('cv_sweep', 1148, 2068, 479, "CS")
+        self.assertEqual(frame[0], commands.SYNC)
+        self.assertEqual(len(frame), 3 + 2 + 2 + 4 + 2 + 1)
+        self.assertEqual(sum(frame[1:]) % 256, 0)
+        self.assertEqual(commands.decode_binary(frame), ('cv_sweep', [1148, 2068, 479, "CS"]))
+        frame = commands.encode_binary('reset')
+        self.assertEqual(commands.decode_binary(frame), ('reset', []))
+
+    def test_bad_values_raise(self):
+        """ Test values that do not fit their field raise instead of being sent """
+        bad_commands = [('pwm_compare', 100000), ('pwm_compare', -1), ('anode_voltage', 10.5),
+                        ('cv_sweep', 1148, 2068, 479, "C"), ('electrode_config', 10),
+                        ('pwm_compare',), ('no_command',)]
+        for command in bad_commands:
+            with self.subTest(command=command):
+                with self.assertRaises(commands.CommandError):
+                    commands.encode_ascii(*command)
+
+    def test_corrupt_frame_raises(self):
+        """ Test a frame with a changed byte or missing bytes is not decoded """
+        frame = bytearray(commands.encode_binary('pwm_period', 23999))
+        frame[4] ^= 0x01
+        with self.assertRaises(commands.CommandError):
+            commands.decode_binary(bytes(frame))
+        with self.assertRaises(commands.CommandError):
+            commands.decode_binary(commands.encode_binary('pwm_period', 23999)[:-1])
+
+    def test_negotiate(self):
+        """ Test binary frames are only used if the device says it can read them """
+        self.assertEqual(commands.negotiate(b"Naresuan Potentiostat\r\n"), commands.ASCII)
+        self.assertEqual(commands.negotiate(None), commands.ASCII)
+        self.assertEqual(commands.negotiate(b"Naresuan Potentiostat BIN1\r\n"), commands.BINARY)
+        encoder = commands.CommandEncoder(commands.BINARY)
+        self.assertIsInstance(encoder.encode('pwm_period', 23999), bytes)
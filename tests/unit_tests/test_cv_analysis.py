@@ -0,0 +1,82 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the peak analysis in cv_analysis.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import unittest
+
+# installed libraries
+import numpy as np
+
+# local files
+import cv_analysis
+import make_voltage_lines
+import pyplot_data_class
+
+VOLTAGE = np.array(make_voltage_lines.make_voltage_profile(-500, 500, 5, "CV", "Start"),
+                   dtype=np.float64)
+
+
+def make_cv(height, anodic_peak=100, cathodic_peak=40, slope=0.001, offset=0.2):
+    """ Make a CV with gaussian peaks on a sloped background """
+    going_up = np.diff(VOLTAGE, append=VOLTAGE[-1] - 1) > 0
+    peaks = np.where(going_up, height * np.exp(-((VOLTAGE - anodic_peak) / 40.0) ** 2),
+                     -0.8 * height * np.exp(-((VOLTAGE - cathodic_peak) / 40.0) ** 2))
+    return offset + slope * VOLTAGE + peaks
+
+
+class TestAnalyzeRuns(unittest.TestCase):
+    def test_peaks_of_many_runs(self):
+        """ Test the peaks, separation, half wave potential and ratio are found for each run
+        after the background is removed """
+        currents = np.array([make_cv(height) for height in [1.0, 2.0, 3.0]])
+        results = cv_analysis.analyze_runs(VOLTAGE, currents, sweep_rates=[0.1] * 3)
+        np.testing.assert_allclose(results['anodic_potential'], 100)
+        np.testing.assert_allclose(results['cathodic_potential'], 40)
+        np.testing.assert_allclose(results['delta_ep'], 60)
+        np.testing.assert_allclose(results['half_wave_potential'], 70)
+        np.testing.assert_allclose(results['anodic_current'], [1.0, 2.0, 3.0], rtol=0.02)
+        np.testing.assert_allclose(results['peak_ratio'], 0.8, rtol=0.02)
+        # area of the gaussian is height * 40 * sqrt(pi) uA mV, over 100 mV/s
+        np.testing.assert_allclose(results['anodic_charge'],
+                                   np.array([1.0, 2.0, 3.0]) * 40 * np.sqrt(np.pi) / 100,
+                                   rtol=0.02)
+        self.assertTrue((results['cathodic_charge'] < 0).all())
+
+    def test_linear_sweep_and_short_runs(self):
+        """ Test a sweep that only goes up has no cathodic peak and a run cut short is only
+        searched up to its length """
+        voltage = VOLTAGE[:201]
+        current = make_cv(1.0)[:201]
+        results = cv_analysis.analyze_runs(voltage, [current, current], lengths=[201, 100])
+        self.assertAlmostEqual(results['anodic_potential'][0], 100)
+        self.assertLess(results['anodic_potential'][1], 0)
+        self.assertTrue(np.isnan(results['cathodic_potential']).all())
+        self.assertTrue(np.isnan(results['anodic_charge']).all())
+
+    def test_flat_points_keep_direction(self):
+        direction = cv_analysis.sweep_direction(np.array([0, 0, 1, 2, 2, 1, 0]))
+        self.assertEqual(direction.tolist(), [1, 1, 1, 1, -1, -1, -1])
+
+
+class TestAnalyzeData(unittest.TestCase):
+    def test_groups_by_voltage_axis(self):
+        """ Test runs with different protocols are each analyzed and kept in order """
+        data = pyplot_data_class.PyplotData()
+        data.add_data(VOLTAGE, make_cv(1.0), run_info={'sweep_rate': 0.1})
+        data.add_data(VOLTAGE[:201], make_cv(2.0)[:201])
+        data.add_data(VOLTAGE, make_cv(3.0, anodic_peak=150), _label="shifted")
+        results = cv_analysis.analyze_data(data)
+        np.testing.assert_allclose(results['anodic_potential'], [100, 100, 150])
+        np.testing.assert_allclose(results['anodic_current'], [1.0, 2.0, 3.0], rtol=0.03)
+        self.assertFalse(np.isnan(results['anodic_charge'][0]))
+        self.assertTrue(np.isnan(results['anodic_charge'][2]))
+        self.assertEqual(results['label'], ["data 1", "data 2", "shifted"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the trace events and binary capture in data_trace.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# installed libraries
+import numpy as np
+
+# local files
+import data_trace
+
+
+class Unprintable(object):
+    """ Fails the test if the trace tries to format it """
+    def __str__(self):
+        raise AssertionError("formatted while tracing is off")
+
+
+class TestTraceEvents(unittest.TestCase):
+    def setUp(self):
+        self.level = data_trace.get_level()
+
+    def tearDown(self):
+        data_trace.set_level(self.level)
+        data_trace.set_sampling("test", 1)
+
+    def test_off_does_not_format(self):
+        data_trace.set_level(data_trace.OFF)
+        self.assertEqual(data_trace.get_level_name(), 'OFF')
+        with mock.patch.object(data_trace._logger, 'log') as mocked_log:
+            data_trace.event(data_trace.WARNING, "test", "%s", Unprintable())
+        mocked_log.assert_not_called()
+
+    def test_levels_and_sampling(self):
+        data_trace.set_level('debug')
+        self.assertTrue(data_trace.is_enabled(data_trace.DEBUG))
+        self.assertFalse(data_trace.is_enabled(data_trace.PACKET))
+        with self.assertLogs(data_trace.LOGGER_NAME, level=data_trace.PACKET) as logs:
+            data_trace.event(data_trace.PACKET, "test", "skipped")
+            data_trace.event(data_trace.DEBUG, "test", "kept %s", 1)
+            data_trace.set_sampling("test", 3)
+            for i in range(7):
+                data_trace.event(data_trace.DEBUG, "test", "sample %s", i)
+        self.assertEqual([record.getMessage() for record in logs.records],
+                         ["test: kept 1", "test: sample 0", "test: sample 3",
+                          "test: sample 6"])
+        self.assertEqual(logs.records[0].trace_event, "test")
+
+
+class TestCapture(unittest.TestCase):
+    def test_capture_round_trip(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "run.trace")
+            data_trace.capture("ignored", b"no file open")
+            data_trace.start_capture(filename)
+            self.assertTrue(data_trace.is_capturing())
+            data_trace.capture("serial read", b"\x01\x02")
+            data_trace.capture("usb packet", [1, -2, 3])
+            data_trace.capture("currents", np.array([0.5, 1.5], dtype=np.float32))
+            data_trace.stop_capture()
+            self.assertFalse(data_trace.is_capturing())
+            records = list(data_trace.read_capture(filename))
+        self.assertEqual([name for _, name, _ in records],
+                         ["serial read", "usb packet", "currents"])
+        self.assertEqual(records[0][2], b"\x01\x02")
+        self.assertEqual(records[1][2].dtype, np.int16)
+        np.testing.assert_array_equal(records[1][2], [1, -2, 3])
+        np.testing.assert_array_equal(records[2][2], [0.5, 1.5])
+        self.assertLessEqual(records[0][0], records[2][0])
+
+    def test_stop_while_capturing(self):
+        """ Test a capture that is stopped by another thread while a record is being made
+        is dropped instead of written to the closed file """
+        encode_record = data_trace.encode_record
+
+        def stop_while_encoding(*args):
+            data_trace.stop_capture()
+            return encode_record(*args)
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "run.trace")
+            data_trace.start_capture(filename)
+            with mock.patch("data_trace.encode_record", side_effect=stop_while_encoding):
+                data_trace.capture("serial read", b"\x01\x02")
+            self.assertEqual(list(data_trace.read_capture(filename)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
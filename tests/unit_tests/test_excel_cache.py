@@ -0,0 +1,83 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test loading recordings through the columnar cache of TIA_R_analysis/excel_cache.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# installed libraries
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                                "TIA_R_analysis"))
+import excel_cache  # noqa: E402 the analysis folder is not a package
+
+RECORDING = ("voltage,current 1,current 2,note\n"
+             "-100,1.5,2.5,start\n"
+             "0,2.0,3.0,\n"
+             "100,2.5,3.5,end\n")
+HEADER_ROWS = ("electrode,A\n"
+               "sample,blank\n"
+               "1,0.5\n"
+               "2,0.75\n")
+
+
+class TestExcelCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def round_trip(self, text, **read_options):
+        """ Load a csv file cold and then from the cache and check they are the same
+        :return: the frame from the cache
+        """
+        filename = os.path.join(self.tmp_dir.name, "recording.csv")
+        with open(filename, 'w') as _file:
+            _file.write(text)
+        cold = excel_cache.load_frame(filename, **read_options)
+        self.assertTrue(os.path.exists(excel_cache.cache_filename(filename,
+                                                                  read_options=read_options)))
+        with mock.patch.object(excel_cache.pd, "read_csv",
+                               side_effect=AssertionError("not loaded from the cache")):
+            warm = excel_cache.load_frame(filename, **read_options)
+        pd.testing.assert_frame_equal(warm, cold)
+        return warm
+
+    def test_index_is_kept(self):
+        """ Test a frame read with an index column gets the index back from the cache """
+        frame = self.round_trip(RECORDING, index_col="voltage")
+        self.assertEqual(frame.index.name, "voltage")
+        self.assertEqual(frame.index.tolist(), [-100, 0, 100])
+        self.assertEqual(frame.loc[100, "current 2"], 3.5)
+        self.assertEqual(frame["note"].tolist()[0], "start")
+
+    def test_default_index_and_number_labels(self):
+        """ Test integer column labels stay integers and the default index is kept """
+        frame = self.round_trip(RECORDING, header=None)
+        self.assertEqual(list(frame.columns), [0, 1, 2, 3])
+        self.assertIsInstance(frame.index, pd.RangeIndex)
+
+    def test_text_cells_above_numbers(self):
+        """ Test a column with text header cells above its numbers loads the same cells """
+        frame = self.round_trip(HEADER_ROWS)
+        self.assertEqual(frame["A"].tolist(), ["blank", "0.5", "0.75"])
+
+    def test_multi_index(self):
+        frame = self.round_trip(RECORDING, index_col=["voltage", "note"])
+        self.assertEqual(frame.index.names, ["voltage", "note"])
+
+
+if __name__ == "__main__":
+    unittest.main()
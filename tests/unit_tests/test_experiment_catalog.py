@@ -0,0 +1,94 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the ExperimentCatalog class in experiment_catalog.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+import tempfile
+import unittest
+
+# installed libraries
+import numpy as np
+
+# local files
+import experiment_catalog
+import pyplot_data_class
+import session_file
+
+
+def make_run_info(sweep_rate, current_range, run_time):
+    return {'technique': 'CV', 'time': run_time, 'sweep_rate': sweep_rate,
+            'current_range': current_range, 'tia_resistor': 20}
+
+
+class TestExperimentCatalog(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.catalog = experiment_catalog.ExperimentCatalog(":memory:")
+        self.data = pyplot_data_class.PyplotData()
+        self.data.add_data([0, 10, 20], [1, 2, 3], _label="fast",
+                           run_info=make_run_info(0.1, 25.0, "2023-05-02 10:00:00"))
+        self.data.add_data([0, 10, 20], [4, 5, 6], _label="slow",
+                           run_info=make_run_info(0.05, 25.0, "2023-05-31 18:00:00"))
+        self.data.add_data([0, 10, 20], [7, 8, 9], _label="fast again",
+                           run_info=make_run_info(0.1, 100.0, "2023-06-01 09:00:00"))
+        self.data.notes[2] = "lead sample"
+
+    def tearDown(self) -> None:
+        self.catalog.close()
+        self.tmp_dir.cleanup()
+
+    def save_csv(self, name):
+        filename = os.path.join(self.tmp_dir.name, name)
+        with open(filename, 'w', newline='') as _file:
+            self.data.save_all_data(_file)
+        self.catalog.add_pyplot_data(filename, self.data, 'CV')
+        return filename
+
+    def test_query(self):
+        """ Test finding runs by their settings, time and notes """
+        self.save_csv("data.csv")
+        rows = self.catalog.query('CV', sweep_rate=0.1)
+        self.assertEqual([row['label'] for row in rows], ["fast", "fast again"])
+        rows = self.catalog.query(sweep_rate=0.1, current_range=25.0)
+        self.assertEqual([row['label'] for row in rows], ["fast"])
+        rows = self.catalog.query(since="2023-05", until="2023-05-31")
+        self.assertEqual([row['label'] for row in rows], ["fast", "slow"])
+        rows = self.catalog.query(notes="lead")
+        self.assertEqual([row['label'] for row in rows], ["fast again"])
+        self.assertEqual(self.catalog.query('ASV'), [])
+        with self.assertRaises(ValueError):
+            self.catalog.query(not_a_column=1)
+
+    def test_saving_again_replaces_runs(self):
+        """ Test that saving over a file does not leave the old runs in the catalog """
+        self.save_csv("data.csv")
+        self.data.remove_data(0)
+        self.save_csv("data.csv")
+        self.assertEqual(len(self.catalog.query()), 2)
+
+    def test_load_csv_and_session(self):
+        """ Test loading runs from a csv file and a session file into a PyplotData """
+        self.save_csv("data.csv")
+        session_name = os.path.join(self.tmp_dir.name, "data" + session_file.SESSION_EXTENSION)
+        runs = session_file.runs_from_pyplot_data(self.data, 'CV')
+        session_file.save_session(session_name, runs)
+        self.catalog.add_runs(session_name, 'session', runs)
+
+        rows = self.catalog.query(sweep_rate=0.1, order_by='file')
+        self.assertEqual(len(rows), 4)
+        data = self.catalog.load(rows)
+        self.assertEqual(data.index, 4)
+        self.assertEqual(data.label, ["fast", "fast again", "fast", "fast again"])
+        np.testing.assert_array_equal(data.current_data[1], [7, 8, 9])
+        np.testing.assert_array_equal(data.current_data[3], [7, 8, 9])
+        self.assertEqual(data.run_info[1]['current_range'], 100.0)
+        self.assertEqual(data.notes[3], "lead sample")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the stage timings and counters in instrumentation.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import json
+import os
+import tempfile
+import unittest
+
+# local files
+import instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.was_enabled = instrumentation.is_enabled()
+        instrumentation.reset()
+
+    def tearDown(self):
+        if self.was_enabled:
+            instrumentation.enable()
+        else:
+            instrumentation.disable()
+        instrumentation.reset()
+
+    def test_disabled_records_nothing(self):
+        instrumentation.disable()
+        self.assertIs(instrumentation.stage("test"), instrumentation._NULL_STAGE)
+
+        @instrumentation.timed("test")
+        def add(a, b):
+            return a + b
+
+        with instrumentation.stage("test"):
+            self.assertEqual(add(1, 2), 3)
+        instrumentation.count("bytes", 10)
+        self.assertEqual(instrumentation.report()['stages'], {})
+        self.assertEqual(instrumentation.report()['counters'], {})
+
+    def test_enabled_records_stages(self):
+        instrumentation.enable()
+
+        @instrumentation.timed("decorated")
+        def fail():
+            raise ValueError
+
+        with instrumentation.stage("block"):
+            pass
+        with self.assertRaises(ValueError):
+            fail()
+        instrumentation.count("bytes", 10)
+        instrumentation.count("bytes", 5)
+        results = instrumentation.report()
+        self.assertEqual(results['stages']['block']['count'], 1)
+        self.assertEqual(results['stages']['decorated']['count'], 1)
+        self.assertEqual(results['counters'], {'bytes': 15})
+        self.assertEqual(len(instrumentation.format_report()), 4)
+
+    def test_percentiles(self):
+        histogram = instrumentation.StageHistogram("test")
+        self.assertEqual(histogram.percentile(0.5), 0.0)
+        for _ in range(90):
+            histogram.add(0.0015)  # goes in the 2 ms bucket
+        for _ in range(10):
+            histogram.add(0.03)  # goes in the 50 ms bucket
+        histogram.add(20.0)  # slower than every bucket
+        self.assertEqual(histogram.percentile(0.5), 0.002)
+        self.assertEqual(histogram.percentile(0.95), 0.05)
+        self.assertEqual(histogram.percentile(1.0), 20.0)
+        self.assertEqual(sum(histogram.buckets), 101)
+
+    def test_dump(self):
+        instrumentation.record(instrumentation.DRAW, 0.01)
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "timings.json")
+            instrumentation.dump(filename)
+            with open(filename) as _file:
+                results = json.load(_file)
+        self.assertEqual(results['stages'][instrumentation.DRAW]['count'], 1)
+        self.assertEqual(results['bucket_edges'], instrumentation.BUCKET_EDGES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the memory accounting in memory_report.py, with a soak test of many simulated CV
+runs added to and deleted from a graph
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import gc
+import types
+import tracemalloc
+import unittest
+from unittest import mock
+
+# installed libraries
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# local files
+import cv_frame
+import memory_report
+import pyplot_data_class
+import tkinter_pyplot
+
+SOAK_RUNS = 300
+RUNS_BEFORE_DELETE = 25
+ALLOWED_GROWTH = 512 * 1024  # bytes the soak test can grow by after the first cycles
+
+VOLTAGE = np.linspace(-500, 500, 2000)
+
+
+def make_graph():
+    """ Make a PyplotEmbed that draws to an Agg canvas, so no display is needed """
+    graph = tkinter_pyplot.PyplotEmbed.__new__(tkinter_pyplot.PyplotEmbed)
+    tkinter_pyplot.load_matplotlib()
+    figure = tkinter_pyplot.FIGURE_POOL.acquire(figsize=(5, 4))
+    graph.graph_area = types.SimpleNamespace(figure_bed=figure, axis=figure.add_subplot(111),
+                                             canvas=FigureCanvasAgg(figure))
+    graph.traces = tkinter_pyplot.MultiTrace(graph.graph_area.axis)
+    graph.legend_displayed = False
+    graph.user_sets_labels_after_run = False
+    graph.data = pyplot_data_class.PyplotData()
+    graph.l = None
+    return graph
+
+
+def make_frame(graph):
+    """ Make a CVFrame with only the graph and data, to call delete_all_data on """
+    frame = cv_frame.CVFrame.__new__(cv_frame.CVFrame)
+    frame.graph = graph
+    frame.data = graph.data
+    return frame
+
+
+def simulated_cv(run):
+    current = 10 * np.sin(VOLTAGE / 100.0 + run)
+    raw = (current * 100).astype(np.int16)
+    return VOLTAGE, current, raw
+
+
+class TestMemoryReport(unittest.TestCase):
+    def test_summaries(self):
+        graph = make_graph()
+        frame = make_frame(graph)
+        for run in range(3):
+            graph.update_data(*simulated_cv(run))
+        graph.data.add_data(VOLTAGE[:10], np.zeros(10))
+        summary = memory_report.frame_summaries({'cv': frame})['cv']
+        self.assertEqual(summary['data']['runs'], 4)
+        self.assertEqual(summary['data']['voltage_axes'], 2)
+        self.assertEqual(summary['data']['run_bytes'], 3 * [2000 * 4 + 2000 * 2] + [10 * 4 + 2])
+        self.assertEqual(summary['graph']['traces'], 3)
+        self.assertEqual(summary['graph']['collections'], 1)
+        self.assertEqual(summary['graph']['legend_entries'], 3)
+        self.assertTrue(summary['graph']['shares_data'])
+        frame.data = pyplot_data_class.PyplotData()
+        lines = memory_report.format_report({'cv': frame})
+        self.assertIn("  WARNING: the graph does not show the frame's data", lines)
+
+    def test_delete_all_data_keeps_the_graph_data(self):
+        graph = make_graph()
+        frame = make_frame(graph)
+        graph.update_data(*simulated_cv(0))
+        frame.delete_all_data()
+        self.assertIs(frame.data, graph.data)
+        self.assertEqual(graph.data.index, 0)
+        self.assertEqual(graph.data.capacity, pyplot_data_class.INITIAL_RUN_CAPACITY)
+        graph.update_data(*simulated_cv(1))
+        self.assertEqual(frame.data.index, 1)
+
+    def test_soak_memory_stays_flat(self):
+        """ Test that adding runs and deleting them, one at a time and all at once, does not
+        grow the memory, the way a long session of CV runs would.  The figure is drawn once
+        for each set of runs instead of after every run to keep the test fast """
+        graph = make_graph()
+        frame = make_frame(graph)
+        canvas = graph.graph_area.canvas
+        graph.graph_area.canvas = mock.Mock()
+        tracemalloc.start()
+        try:
+            baseline = None
+            for run in range(SOAK_RUNS):
+                graph.update_data(*simulated_cv(run))
+                if run % RUNS_BEFORE_DELETE == RUNS_BEFORE_DELETE - 1:
+                    canvas.draw()
+                    graph.delete_a_line(0)
+                    frame.delete_all_data()
+                    canvas.draw()
+                    counts = memory_report.graph_summary(graph, frame)
+                    self.assertEqual(counts['collections'], 0)
+                    self.assertEqual(counts['traces'], 0)
+                    self.assertEqual(counts['legend_entries'], 0)
+                    self.assertTrue(counts['shares_data'])
+                    # the replaced legends are freed by the garbage collector, not right away
+                    gc.collect()
+                    if baseline is None and run > 2 * RUNS_BEFORE_DELETE:
+                        baseline = tracemalloc.get_traced_memory()[0]
+            growth = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+        self.assertLess(growth, ALLOWED_GROWTH)
+        self.assertEqual(graph.data.nbytes, pyplot_data_class.PyplotData().nbytes)
+
+
+class TestTracing(unittest.TestCase):
+    def tearDown(self):
+        memory_report.stop_tracing()
+
+    def test_snapshots(self):
+        self.assertEqual(len(memory_report.take_snapshot()), 1)  # starts tracing
+        kept = [bytearray(1000) for _ in range(100)]
+        lines = memory_report.take_snapshot()
+        self.assertTrue(any("test_memory_report.py" in line for line in lines))
+        self.assertEqual(len(kept), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
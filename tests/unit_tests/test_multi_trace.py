@@ -0,0 +1,87 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test drawing many runs with the LineCollections of multi_trace.MultiTrace
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import unittest
+
+# installed libraries
+import matplotlib
+from matplotlib.figure import Figure
+import numpy as np
+
+# local files
+import multi_trace
+
+X_DATA = np.linspace(-500, 500, 50)
+
+
+def run_y(run):
+    return np.full(len(X_DATA), float(run))
+
+
+def shown_runs(traces):
+    """ Get the first y value of each segment shown in each collection """
+    return [[segment[0, 1] for segment in batch.get_segments()] for batch in traces.batches]
+
+
+class TestMultiTrace(unittest.TestCase):
+    def setUp(self):
+        self.axis = Figure().add_subplot(111)
+        self.traces = multi_trace.MultiTrace(self.axis, batch_size=4, page_size=3)
+        for run in range(10):
+            self.traces.add(X_DATA, run_y(run))
+
+    def test_runs_are_batched(self):
+        self.assertEqual(len(self.traces), 10)
+        self.assertEqual(len(self.axis.collections), 3)
+        self.assertEqual(len(self.axis.lines), 0)
+        self.assertEqual(shown_runs(self.traces), [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+
+    def test_color_cycle(self):
+        """ Test the runs take the colors of the color cycle in order and start it over """
+        cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        for run in range(10, len(cycle) + 1):
+            self.traces.add(X_DATA, run_y(run))
+        self.assertEqual(self.traces.colors[:len(cycle)], cycle)
+        self.assertEqual(self.traces.colors[len(cycle)], self.traces.colors[0])
+        self.assertNotEqual(self.traces.colors[1], self.traces.colors[0])
+
+    def test_show_hide_and_color_keep_the_collections(self):
+        batches = list(self.traces.batches)
+        self.traces.set_visible(5, False)
+        self.traces.set_color(8, 'black')
+        self.assertEqual(self.traces.batches, batches)
+        self.assertEqual(shown_runs(self.traces), [[0, 1, 2, 3], [4, 6, 7], [8, 9]])
+        self.assertEqual(tuple(self.traces.batches[2].get_colors()[0]), (0, 0, 0, 1))
+        self.traces.set_visible(5, True)
+        self.assertEqual(shown_runs(self.traces)[1], [4, 5, 6, 7])
+
+    def test_remove_and_clear(self):
+        self.traces.remove(1)
+        self.traces.remove(1)
+        self.assertEqual(shown_runs(self.traces), [[0, 3, 4, 5], [6, 7, 8, 9]])
+        self.assertEqual(len(self.axis.collections), 2)
+        self.traces.clear()
+        self.assertEqual(len(self.traces), 0)
+        self.assertEqual(len(self.axis.collections), 0)
+
+    def test_legend_pages(self):
+        """ Test the legend shows the newest page and can be paged back """
+        self.assertEqual(list(self.traces.page_range()), [9])
+        self.assertFalse(self.traces.change_page(1))
+        self.assertTrue(self.traces.change_page(-2))
+        self.assertEqual(list(self.traces.page_range()), [3, 4, 5])
+        self.traces.set_visible(4, False)
+        self.assertEqual([handle.get_alpha() for handle in self.traces.legend_handles()],
+                         [1.0, multi_trace.HIDDEN_ALPHA, 1.0])
+        self.traces.add(X_DATA, run_y(10))
+        self.assertEqual(list(self.traces.page_range()), [9, 10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the Deframer class in packet_framing.py and how AmpUsb reads framed data with it
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import unittest
+from unittest import mock
+
+# local files
+import packet_framing
+import properties
+import usb_comm
+
+
+def make_stream(number_packets, samples_per_packet=10, first_sequence=0):
+    packets = [list(range(i * samples_per_packet, (i + 1) * samples_per_packet))
+               for i in range(number_packets)]
+    frames = [packet_framing.frame_packet(first_sequence + i, packet)
+              for i, packet in enumerate(packets)]
+    return packets, frames
+
+
+class TestDeframer(unittest.TestCase):
+    def test_split_reads(self):
+        """ Test packets are put back together when read in pieces of any size """
+        packets, frames = make_stream(5)
+        stream = b"".join(frames)
+        deframer = packet_framing.Deframer()
+        got = []
+        for i in range(0, len(stream), 7):
+            got.extend(packet.samples.tolist() for packet in deframer.feed(stream[i:i + 7]))
+        self.assertEqual(got, packets)
+        self.assertEqual(deframer.counters['lost_packets'], 0)
+        self.assertEqual(deframer.counters['discarded_bytes'], 0)
+
+    def test_resync_after_corruption(self):
+        """ Test a dropped byte and a changed byte only lose the packets they were in """
+        packets, frames = make_stream(5)
+        frames[1] = frames[1][:9] + frames[1][10:]  # dropped byte
+        frames[3] = frames[3][:12] + b"\x00" + frames[3][13:]  # changed byte
+        deframer = packet_framing.Deframer()
+        got = deframer.feed(b"\x01\x02" + b"".join(frames))
+        self.assertEqual([packet.samples.tolist() for packet in got],
+                         [packets[0], packets[2], packets[4]])
+        self.assertEqual([packet.lost for packet in got], [0, 1, 1])
+        self.assertEqual(deframer.counters['lost_packets'], 2)
+        self.assertGreater(deframer.counters['crc_errors'], 0)
+        self.assertGreater(deframer.counters['resyncs'], 0)
+
+    def test_sequence_wraps_and_duplicates(self):
+        """ Test the sequence number wrapping is not a gap and repeated packets are dropped """
+        packets, frames = make_stream(3, first_sequence=65535)
+        deframer = packet_framing.Deframer()
+        got = deframer.feed(b"".join(frames) + frames[2])
+        self.assertEqual([packet.sequence for packet in got], [65535, 0, 1])
+        self.assertEqual(deframer.counters['lost_packets'], 0)
+        self.assertEqual(deframer.counters['duplicates'], 1)
+
+
+class TestFramedAmpUsb(unittest.TestCase):
+    def test_get_framed_data(self):
+        """ Test get_data reads framed packets up to the termination code and counts the
+        samples in a lost packet """
+        usb = usb_comm.AmpUsb(mock.Mock(), properties.DeviceParameters())
+        usb.connected = True
+        usb.deframer = packet_framing.Deframer()
+        packets, frames = make_stream(3)
+        frames.append(packet_framing.frame_packet(3, [7, usb_comm.TERMINATION_CODE]))
+        stream = frames[0] + frames[2] + frames[3]  # the second packet was lost
+        usb.device = mock.Mock()
+        usb.device.read_data.side_effect = [stream[i:i + usb_comm.USB_IN_BYTE_SIZE]
+                                            for i in range(0, len(stream),
+                                                           usb_comm.USB_IN_BYTE_SIZE)]
+        data = usb.get_data(4)
+        self.assertEqual(data, packets[0] + packets[2] + [7])
+        self.assertEqual(usb.take_lost_samples(), 10)
+        self.assertEqual(usb.take_lost_samples(), 0)
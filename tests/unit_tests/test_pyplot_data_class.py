@@ -0,0 +1,168 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the PyplotData class in pyplot_data_class.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import io
+import os
+import tempfile
+import unittest
+
+# installed libraries
+import numpy as np
+
+# local files
+import pyplot_data_class
+
+
+class TestPyplotData(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data = pyplot_data_class.PyplotData(capacity=2)
+        self.voltage = [-20, -10, 0, 10, 20]
+
+    def test_add_data_grows_blocks(self):
+        """ Test that adding more runs than the capacity keeps all the data """
+        for i in range(5):
+            self.data.add_data(self.voltage, [i, i, i, i, i], [i, i])
+        self.assertEqual(self.data.index, 5)
+        self.assertEqual(self.data.label, ["data 1", "data 2", "data 3", "data 4", "data 5"])
+        for i, current in enumerate(self.data.current_data):
+            self.assertListEqual(current.tolist(), 5 * [i])
+        self.assertListEqual(self.data.y_raw_data[4].tolist(), [4, 4])
+
+    def test_voltage_axis_is_shared(self):
+        """ Test that runs with the same voltages share one voltage axis """
+        self.data.add_data(self.voltage, [1, 2, 3, 4, 5])
+        self.data.add_data(list(self.voltage), [1, 2, 3, 4, 5])
+        self.assertIs(self.data.voltage_data[0], self.data.voltage_data[1])
+        self.assertIsNotNone(self.data.shared_voltage)
+        self.assertEqual(self.data.axis_count, 1)
+        self.data.add_data([0, 10, 20], [1, 2, 3])
+        self.assertIsNone(self.data.shared_voltage)
+        self.assertEqual(self.data.axis_count, 2)
+
+    def test_ragged_runs(self):
+        """ Test that runs of different lengths are trimmed to their own length """
+        self.data.add_data(self.voltage, [1, 2, 3, 4, 5])
+        self.data.add_data(self.voltage[:3], [1, 2, 3])
+        self.assertEqual(len(self.data.current_data[1]), 3)
+        self.assertEqual(len(self.data.voltage_data[1]), 3)
+        self.assertListEqual(self.data.y_raw_data[0].tolist(), [0])
+
+    def test_run_arrays(self):
+        """ Test that run_arrays gives the same arrays as the lists of every run """
+        self.data.add_data(self.voltage, [1, 2, 3, 4, 5], [7, 8])
+        self.data.add_data(self.voltage[:3], [1, 2, 3])
+        voltage, current, raw = self.data.run_arrays(0)
+        self.assertIs(voltage, self.data.voltage_data[0])
+        self.assertListEqual(current.tolist(), [1, 2, 3, 4, 5])
+        self.assertListEqual(raw.tolist(), [7, 8])
+        self.assertEqual(len(self.data.run_arrays(1)[1]), 3)
+        with self.assertRaises(IndexError):
+            self.data.run_arrays(2)
+
+    def test_remove_data(self):
+        """ Test that removing runs keeps the metadata and data lined up """
+        for i in range(4):
+            self.data.add_data(self.voltage if i != 2 else [0, 1], [i, i], _label=str(i))
+            self.data.colors.append("color {0}".format(i))
+        self.data.remove_data(2)
+        self.assertEqual(self.data.index, 3)
+        self.assertEqual(self.data.label, ["0", "1", "3"])
+        self.assertEqual(self.data.colors, ["color 0", "color 1", "color 3"])
+        self.assertListEqual([current[0] for current in self.data.current_data], [0, 1, 3])
+        # the voltage axis only run 2 used is released
+        self.assertIsNotNone(self.data.shared_voltage)
+        self.data.remove_data([0, 2])
+        self.assertEqual(self.data.label, ["1"])
+        np.testing.assert_array_equal(self.data.current_data[0], [1, 1])
+
+    def test_save_shared_voltage(self):
+        """ Test saving runs with the same voltages uses one voltage column """
+        self.data.add_data(self.voltage, [0.5, 1, 1.5, 2, 2.5], _label="a")
+        self.data.add_data(self.voltage, [1, 2, 3], _label="b")
+        self.data.notes[1] = "note"
+        _file = io.StringIO()
+        self.data.save_all_data(_file, chunk_rows=2)
+        lines = _file.getvalue().splitlines()
+        self.assertEqual(lines[0], "voltage,a,b")
+        self.assertEqual(lines[1], " , ,note")
+        self.assertEqual(lines[2], "-20.0,0.5,1.0")
+        self.assertEqual(lines[6], "20.0,2.5,")
+        self.assertEqual(len(lines), 7)
+
+    def test_save_different_voltages(self):
+        """ Test saving runs with different voltages gives each run a voltage column """
+        self.data.add_data(self.voltage, [1, 2, 3, 4, 5], [7, 8], _label="a")
+        self.data.add_data([0, 10], [6, 7], [9], _label="b")
+        _file = io.StringIO()
+        self.data.save_all_data(_file, save_type="Raw Counts")
+        lines = _file.getvalue().splitlines()
+        self.assertEqual(lines[0], "voltage,a,voltage,b")
+        self.assertEqual(lines[2], "-20.0,7,0.0,9")
+        self.assertEqual(lines[3], "-10.0,8,10.0,")
+        self.assertEqual(lines[4], "0.0,,,")
+
+
+
+class TestReadCSVData(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "data.csv")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def save(self, data):
+        with open(self.filename, 'w', newline='') as _file:
+            data.save_all_data(_file)
+
+    def test_read_saved_cv_data(self):
+        """ Test that data saved by PyplotData is read back the same, in chunks """
+        data = pyplot_data_class.PyplotData()
+        data.add_data([0, 10, 20, 10], [0.5, 1, 1.5, 2], _label="a")
+        data.add_data([0, 10, 20, 10], [2, 3], _label="b, c")
+        data.notes[0] = "first\nrun"
+        self.save(data)
+        saved_data = pyplot_data_class.read_csv_data(self.filename, chunk_rows=3)
+        self.assertEqual(saved_data['type'], "cv")
+        self.assertEqual(saved_data['labels'], ["a", "b, c"])
+        self.assertEqual(saved_data['notes'], ["first\nrun", " "])
+        np.testing.assert_array_equal(saved_data['x'][0], [0, 10, 20, 10])
+        np.testing.assert_array_equal(saved_data['y'][0], [0.5, 1, 1.5, 2])
+        np.testing.assert_array_equal(saved_data['x'][1], [0, 10])
+        np.testing.assert_array_equal(saved_data['y'][1], [2, 3])
+
+        opened = pyplot_data_class.PyplotData()
+        opened.add_runs(saved_data['x'], saved_data['y'],
+                        saved_data['labels'], saved_data['notes'])
+        self.assertEqual(opened.index, 2)
+        self.assertEqual(opened.notes, ["first\nrun", " "])
+
+    def test_read_paired_voltages(self):
+        """ Test reading a file where each run has its own voltage column """
+        data = pyplot_data_class.PyplotData()
+        data.add_data([0, 10, 20], [1, 2, 3], _label="a")
+        data.add_data([5, 15], [4, 5], _label="b")
+        self.save(data)
+        saved_data = pyplot_data_class.read_csv_data(self.filename)
+        self.assertEqual(saved_data['labels'], ["a", "b"])
+        np.testing.assert_array_equal(saved_data['x'][1], [5, 15])
+        np.testing.assert_array_equal(saved_data['y'][1], [4, 5])
+
+    def test_read_amperometry_data(self):
+        """ Test reading a file saved by the amperometry frame """
+        with open(self.filename, 'w', newline='') as _file:
+            _file.write("time,current\n0.001, 1.5\n0.002, -2.25\n")
+        saved_data = pyplot_data_class.read_csv_data(self.filename)
+        self.assertEqual(saved_data['type'], "amp")
+        np.testing.assert_array_equal(saved_data['x'][0], [0.001, 0.002])
+        np.testing.assert_array_equal(saved_data['y'][0], [1.5, -2.25])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the fitting functions in resistance_fit.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+import tempfile
+import unittest
+
+# installed libraries
+import numpy as np
+
+# local files
+import pyplot_data_class
+import resistance_fit
+
+VOLTAGE = np.arange(-1000, 1001, 20, dtype=np.float64)
+
+
+def saturated_line(resistance, offset=0.0):
+    """ Current (uA) through a resistance (ohms) that saturates at +-60 uA """
+    return np.clip(1000.0 * VOLTAGE / resistance + offset, -60, 60)
+
+
+class TestFitLines(unittest.TestCase):
+    def test_cutoff_and_padding_are_masked(self):
+        """ Test the saturated points and the NaN padding of a short column are not fit """
+        currents = np.array([saturated_line(10000, 1.0), saturated_line(20000),
+                             np.full(len(VOLTAGE), np.nan)])
+        currents[1, 80:] = np.nan
+        results = resistance_fit.fit_lines(VOLTAGE, currents)
+        np.testing.assert_allclose(results['resistance'][:2], [10000, 20000])
+        np.testing.assert_allclose(results['intercept'][:2], [1.0, 0.0], atol=1e-9)
+        np.testing.assert_allclose(results['residual'][:2], 0, atol=1e-9)
+        self.assertEqual(results['points'].tolist(), [50, 79, 0])
+        self.assertTrue(np.isnan(results['resistance'][2]))
+
+    def test_same_as_polyfit(self):
+        """ Test the vectorized fit gives what np.polyfit gives for each column """
+        rng = np.random.default_rng(0)
+        currents = 1000.0 * VOLTAGE / 40000 + rng.normal(0, 0.5, (4, len(VOLTAGE)))
+        results = resistance_fit.fit_lines(VOLTAGE, currents, cutoff=None)
+        for i, current in enumerate(currents):
+            (slope, intercept), (squared_errors,), *_ = np.polyfit(VOLTAGE, current, 1,
+                                                                  full=True)
+            self.assertAlmostEqual(results['slope'][i], slope)
+            self.assertAlmostEqual(results['intercept'][i], intercept)
+            # the residual is the regression standard error, with 2 degrees of freedom used
+            self.assertAlmostEqual(results['residual'][i],
+                                   np.sqrt(squared_errors / (len(VOLTAGE) - 2)))
+
+
+class TestFitDataAndFiles(unittest.TestCase):
+    def test_fit_data_and_files(self):
+        """ Test the runs of a PyplotData and the columns of saved files are fit """
+        data = pyplot_data_class.PyplotData()
+        data.add_data(VOLTAGE, saturated_line(10000))
+        data.add_data(VOLTAGE[:50], saturated_line(30000)[:50])
+        results = resistance_fit.fit_data(data)
+        np.testing.assert_allclose(results['resistance'], [10000, 30000], rtol=1e-4)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "board.csv")
+            with open(filename, 'w', newline='') as _file:
+                data.save_all_data(_file)
+            rows = resistance_fit.fit_files([filename, filename])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1]['file'], "board.csv")
+        self.assertAlmostEqual(rows[3]['resistance'], 30000, delta=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test recording the serial traffic of SerialComm and playing it back through AmpUsb with
+serial_capture.ReplaySerial
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+# local files
+import properties
+import serial_capture
+import usb_comm
+
+PACKET_1 = list(range(32))
+PACKET_2 = list(range(100, 110)) + [usb_comm.TERMINATION_CODE] + 21 * [0]
+
+
+def packet_bytes(packet):
+    return struct.pack("<{0}h".format(len(packet)), *packet)
+
+
+class TestCaptureReplay(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.folder.name, "run.capture")
+        # record a run through a SerialComm with a mocked serial port
+        serial_comm = usb_comm.SerialComm()
+        serial_comm.device = mock.Mock()
+        serial_comm.device.read.side_effect = [packet_bytes(PACKET_1),
+                                               packet_bytes(PACKET_2), b"\x05\x00"]
+        serial_comm.device.in_waiting = 2
+        serial_comm.connected = True
+        serial_comm.identity = b"Naresuan Potentiostat"
+        serial_comm.start_capture(self.filename)
+        self.usb = self.make_usb(serial_comm)
+        self.usb.usb_write("E0")
+        self.recorded = self.usb.get_data(1)
+        self.usb.usb_write("R")
+        self.usb.clear_in_buffer()
+        serial_comm.stop_capture()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    @staticmethod
+    def make_usb(transport):
+        usb = usb_comm.AmpUsb(mock.Mock(), properties.DeviceParameters())
+        usb.device = transport
+        usb.connected = True
+        return usb
+
+    def test_replay_gives_the_recorded_data(self):
+        replay = serial_capture.ReplaySerial(self.filename, speed=None)
+        self.assertEqual(replay.identity, b"Naresuan Potentiostat")
+        usb = self.make_usb(replay)
+        usb.usb_write("E0")
+        self.assertEqual(usb.get_data(1), self.recorded)
+        self.assertEqual(self.recorded, PACKET_1 + PACKET_2[:-1])
+        usb.usb_write("R")
+        self.assertEqual(replay.bytes_waiting(), 2)  # the bytes the clear threw away
+        usb.clear_in_buffer()
+        self.assertEqual(replay.bytes_waiting(), 0)
+        self.assertTrue(replay.finished)
+        self.assertEqual(replay.mismatches, 0)
+
+    def test_reads_wait_for_the_next_write(self):
+        replay = serial_capture.ReplaySerial(self.filename, speed=None)
+        self.assertEqual(replay.bytes_waiting(), 0)
+        replay.write_data("E0")
+        self.assertEqual(replay.bytes_waiting(), 128)
+        self.assertEqual(replay.read_data(64, 'int16'), PACKET_1)
+
+    def test_mismatched_writes_are_counted(self):
+        replay = serial_capture.ReplaySerial(self.filename, speed=None)
+        replay.write_data("E1")
+        replay.write_data("R")
+        replay.write_data("X")
+        self.assertEqual(replay.mismatches, 2)
+
+    def test_recorded_speed(self):
+        """ Test the reads are not given before their recorded time after the write """
+        replay = serial_capture.ReplaySerial(self.filename, speed=1e-9)
+        replay.write_data("E0")
+        self.assertEqual(replay.bytes_waiting(), 0)
+        self.assertEqual(replay.poll_for_data(), b"")
+
+
+
+class TestSerialRecorder(unittest.TestCase):
+    def test_close_while_recording(self):
+        """ Test a recorder closed by another thread while a read is being recorded drops
+        the record instead of writing to the closed file """
+        with tempfile.TemporaryDirectory() as folder:
+            recorder = serial_capture.SerialRecorder(os.path.join(folder, "run.capture"))
+            encode_record = serial_capture.data_trace.encode_record
+
+            def close_while_encoding(*args):
+                recorder.close()
+                return encode_record(*args)
+            with mock.patch("data_trace.encode_record", side_effect=close_while_encoding):
+                recorder.record(serial_capture.READ, b"\x01\x02")
+            self.assertEqual(list(serial_capture.data_trace.read_capture(recorder.filename)),
+                             [])
+
+
+if __name__ == '__main__':
+    unittest.main()
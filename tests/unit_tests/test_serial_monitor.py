@@ -0,0 +1,169 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the chunk sorting, storing and formatting of tools/serial_monitor.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import queue
+import struct
+import unittest
+from unittest import mock
+
+# local files
+import packet_framing
+from tools import serial_monitor
+import usb_comm
+
+TERMINATION = struct.pack("<h", usb_comm.TERMINATION_CODE)
+
+
+class TestClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = serial_monitor.Classifier()
+
+    def test_amp_stream_continues_until_termination_code(self):
+        """ Test the chunks of a data packet split over reads stay amperometry data """
+        self.assertEqual(self.classifier.classify(b"\x01\x02\x03\x04"), serial_monitor.AMP)
+        # an odd length chunk in the middle of the stream is still part of it
+        self.assertEqual(self.classifier.classify(b"\x05\x06\x07"), serial_monitor.AMP)
+        self.assertEqual(self.classifier.classify(b"\x08\x09" + TERMINATION),
+                         serial_monitor.AMP)
+        self.assertEqual(self.classifier.classify(b"\x01\x02\x03"), serial_monitor.BINARY)
+
+    def test_text(self):
+        """ Test printable chunks are text and end the stream they interrupt """
+        self.assertEqual(self.classifier.classify(b"\x01\x02\x03\x04"), serial_monitor.AMP)
+        self.assertEqual(self.classifier.classify(b"Done\n"), serial_monitor.TEXT)
+        self.assertEqual(self.classifier.classify(b"\x01\x02\x03"), serial_monitor.BINARY)
+
+    def test_sync_bytes_start_framed_packet(self):
+        """ Test sync bytes start a framed packet even in the middle of an amperometry stream """
+        self.assertEqual(self.classifier.classify(b"\x01\x02\x03\x04"), serial_monitor.AMP)
+        self.assertEqual(self.classifier.classify(packet_framing.SYNC + b"\x01\x02\x03"),
+                         serial_monitor.FRAMED)
+        # the rest of the framed packet keeps its kind, even with a termination code in it
+        self.assertEqual(self.classifier.classify(b"\x04\x05" + TERMINATION),
+                         serial_monitor.FRAMED)
+
+
+class TestFormatRow(unittest.TestCase):
+    def test_hex(self):
+        row = serial_monitor.format_row(b"AB\x00\x7f", "hex")
+        self.assertEqual(row, "{0:<47}  |AB..|".format("41 42 00 7f"))
+        full_row = serial_monitor.format_row(bytes(range(65, 81)), "hex")
+        self.assertTrue(full_row.endswith("4f 50  |ABCDEFGHIJKLMNOP|"))
+
+    def test_int16(self):
+        """ Test int16 rows are little endian and show a trailing odd byte in hex """
+        self.assertEqual(serial_monitor.format_row(b"\x01\x00\xff\xff", "int16"),
+                         "     1     -1")
+        self.assertEqual(serial_monitor.format_row(b"\x01\x00\x07", "int16"),
+                         "     1     07")
+
+
+class TestChunkStore(unittest.TestCase):
+    def setUp(self):
+        self.store = serial_monitor.ChunkStore(max_bytes=64)
+        self.store.start_time = 0
+
+    def test_rows_and_row_lookup(self):
+        """ Test each chunk makes a row per 16 bytes and rows are found in the right chunk """
+        self.store.add(1.0, serial_monitor.AMP, bytes(range(20)))
+        self.store.add(2.0, serial_monitor.TEXT, b"")
+        self.store.add(3.0, serial_monitor.BINARY, bytes(range(100, 116)))
+        self.assertEqual(self.store.rows, 4)
+        self.assertTrue(self.store.row(0, "hex").startswith("     1.000 amp data 0000  00 01"))
+        self.assertTrue(self.store.row(1, "hex").startswith(20 * " " + "0010  10 11 12 13  "))
+        self.assertTrue(self.store.row(2, "hex").startswith("     2.000 text     0000  "))
+        self.assertTrue(self.store.row(3, "hex").startswith("     3.000 binary   0000  64"))
+
+    def test_hidden_kinds(self):
+        self.store.add(1.0, serial_monitor.AMP, bytes(20))
+        self.store.add(2.0, serial_monitor.TEXT, b"ok")
+        self.store.set_hidden([serial_monitor.AMP])
+        self.assertEqual(self.store.rows, 1)
+        self.assertIn("text", self.store.row(0, "hex"))
+        # hidden chunks are kept and come back when shown again
+        self.store.add(3.0, serial_monitor.AMP, bytes(4))
+        self.assertEqual(self.store.rows, 1)
+        self.store.set_hidden([])
+        self.assertEqual(self.store.rows, 4)
+        self.assertIn("amp data", self.store.row(3, "hex"))
+
+    def test_eviction_drops_to_three_quarters(self):
+        """ Test a full store drops the oldest chunks to 3/4 full and counts the rows dropped """
+        for i in range(4):
+            self.assertEqual(self.store.add(float(i), serial_monitor.AMP, bytes(16)), 0)
+        self.assertEqual(self.store.add(4.0, serial_monitor.AMP, bytes(16)), 2)
+        self.assertEqual(self.store.stored_bytes, 48)
+        self.assertEqual(self.store.dropped_bytes, 32)
+        self.assertEqual([chunk[0] for chunk in self.store.chunks], [2.0, 3.0, 4.0])
+        self.assertEqual(self.store.rows, 3)
+        self.assertTrue(self.store.row(0, "hex").startswith("     2.000"))
+
+    def test_eviction_of_hidden_chunks_drops_no_rows(self):
+        self.store.set_hidden([serial_monitor.TEXT])
+        self.store.add(0.0, serial_monitor.TEXT, bytes(32))
+        self.store.add(1.0, serial_monitor.AMP, bytes(32))
+        self.assertEqual(self.store.add(2.0, serial_monitor.AMP, bytes(16)), 0)
+        self.assertEqual(self.store.rows, 3)
+
+
+class TestThroughput(unittest.TestCase):
+    def test_rates_over_the_window(self):
+        throughput = serial_monitor.Throughput(window=2.0)
+        throughput.add(0.0, 100)
+        throughput.add(1.5, 200)
+        throughput.add(2.5, 300)
+        self.assertEqual(throughput.rates(now=2.5), (250.0, 1.0))
+        # the chunk at 0 s is past the window
+        self.assertEqual(throughput.rates(now=3.0), (250.0, 1.0))
+        self.assertEqual(throughput.rates(now=10.0), (0.0, 0.0))
+        self.assertEqual(throughput.total_bytes, 600)
+        self.assertEqual(throughput.total_chunks, 3)
+
+
+class TestMonitorDrain(unittest.TestCase):
+    def make_monitor(self, follow):
+        monitor = mock.Mock()
+        monitor.store = serial_monitor.ChunkStore(max_bytes=64)
+        monitor.throughput = serial_monitor.Throughput()
+        monitor.classifier = serial_monitor.Classifier()
+        monitor.queue = queue.Queue()
+        monitor.follow = follow
+        for i in range(4):
+            monitor.store.add(float(i), serial_monitor.BINARY, bytes(15) + b"\x01")
+        return monitor
+
+    def test_scrolled_view_keeps_its_rows(self):
+        """ Test the rows in view stay in view when older rows are dropped """
+        monitor = self.make_monitor(follow=False)
+        monitor.top_row = 3
+        shown = monitor.store.row(3, "hex")
+        monitor.queue.put((4.0, bytes(15) + b"\x01"))
+        serial_monitor.Monitor.drain(monitor)
+        self.assertEqual(monitor.top_row, 1)
+        self.assertEqual(monitor.store.row(monitor.top_row, "hex"), shown)
+        monitor.render.assert_called_once_with()
+
+    def test_top_row_stops_at_first_row(self):
+        monitor = self.make_monitor(follow=False)
+        monitor.top_row = 1
+        monitor.queue.put((4.0, bytes(15) + b"\x01"))
+        serial_monitor.Monitor.drain(monitor)
+        self.assertEqual(monitor.top_row, 0)
+
+    def test_follow_is_not_shifted(self):
+        monitor = self.make_monitor(follow=True)
+        monitor.top_row = 3
+        monitor.queue.put((4.0, bytes(15) + b"\x01"))
+        serial_monitor.Monitor.drain(monitor)
+        self.assertEqual(monitor.top_row, 3)  # render moves it to the newest rows
+        monitor.render.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
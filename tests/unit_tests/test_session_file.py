@@ -0,0 +1,123 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test saving and opening session files with session_file.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+import tempfile
+import unittest
+
+# installed libraries
+import numpy as np
+
+# local files
+import pyplot_data_class
+import session_file
+
+
+class TestSessionFile(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "data" + session_file.SESSION_EXTENSION)
+        self.data = pyplot_data_class.PyplotData()
+        self.data.add_data([-20, 0, 20], [1.5, 2, 2.5], [7, 8, 9], _label="a",
+                           run_info={'technique': 'CV', 'sweep_rate': 0.1})
+        self.data.add_data([-20, 0, 20], [3, 4], _label="b")
+        self.data.notes[1] = "second\nrun"
+        self.data.colors.extend(["red", "blue"])
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_save_and_open(self):
+        """ Test that the runs, settings and raw counts are opened the same as they were saved """
+        amp_run = {'technique': 'amp', 'label': "amperometry", 'run_info': {'voltage': 100},
+                   'x': np.array([0.0, 0.001, 0.002]), 'y': np.array([1.0, -1.0, 0.5])}
+        runs = session_file.runs_from_pyplot_data(self.data, 'CV') + [amp_run]
+        header_runs = session_file.save_session(self.filename, runs)
+        # the runs with the same voltages share one array
+        self.assertEqual(header_runs[0]['x'], header_runs[1]['x'])
+        for run in header_runs:
+            for key in ('x', 'y', 'raw'):
+                self.assertEqual(run[key]['offset'] % session_file.ALIGNMENT, 0)
+
+        session = session_file.SessionFile(self.filename)
+        self.assertEqual(len(session), 3)
+        self.assertEqual(session.indexes('CV'), [0, 1])
+        saved_data = session.saved_data('CV')
+        self.assertEqual(saved_data['type'], 'cv')
+        self.assertEqual(saved_data['labels'], ["a", "b"])
+        self.assertEqual(saved_data['notes'], [" ", "second\nrun"])
+        self.assertEqual(saved_data['colors'], ["red", "blue"])
+        self.assertEqual(saved_data['run_info'][0], {'technique': 'CV', 'sweep_rate': 0.1})
+        np.testing.assert_array_equal(saved_data['x'][1], [-20, 0, 20])
+        np.testing.assert_array_equal(saved_data['y'][1], [3, 4])
+        self.assertListEqual(saved_data['raw'][0].tolist(), [7, 8, 9])
+        self.assertEqual(saved_data['y'][0].dtype, pyplot_data_class.CURRENT_DTYPE)
+
+        amp_data = session.saved_data('amp')
+        self.assertEqual(amp_data['type'], 'amp')
+        np.testing.assert_array_equal(amp_data['x'][0], [0.0, 0.001, 0.002])
+
+        opened = pyplot_data_class.PyplotData()
+        opened.add_runs(saved_data['x'], saved_data['y'], saved_data['labels'],
+                        saved_data['notes'], saved_data['raw'], saved_data['run_info'])
+        session.close()
+        self.assertEqual(opened.run_info[0]['sweep_rate'], 0.1)
+        self.assertListEqual(opened.y_raw_data[0].tolist(), [7, 8, 9])
+        np.testing.assert_array_equal(opened.current_data[0], [1.5, 2, 2.5])
+
+    def test_arrays_readable_after_close(self):
+        """ Test that arrays returned before close can still be read after it """
+        session_file.save_session(self.filename,
+                                  session_file.runs_from_pyplot_data(self.data, 'CV'))
+        session = session_file.SessionFile(self.filename)
+        current = session.y(0)
+        saved_data = session.saved_data('CV')
+        session.close()
+        np.testing.assert_array_equal(current, [1.5, 2, 2.5])
+        self.assertListEqual(saved_data['raw'][0].tolist(), [7, 8, 9])
+        with self.assertRaises(ValueError):
+            session.y(0)
+
+    def test_load_runs_on_request(self):
+        """ Test the runs given out are remembered, and the others can be copied out and saved
+        again over the same file """
+        runs = session_file.runs_from_pyplot_data(self.data, 'CV')
+        amp_run = {'technique': 'amp', 'label': "amperometry", 'x': np.array([0.0, 0.001]),
+                   'y': np.array([1.0, -1.0])}
+        session_file.save_session(self.filename, runs + [amp_run])
+        session = session_file.SessionFile(self.filename)
+        shown = session.load_runs('CV', session.unloaded_indexes('CV')[:1])
+        self.assertEqual(shown['labels'], ["a"])
+        self.assertEqual(session.unloaded_indexes(), [1, 2])
+        self.assertEqual(session.unloaded_indexes('amp'), [2])
+
+        shared = session.copy_runs([0, 1])
+        self.assertIs(shared[0]['x'], shared[1]['x'])  # the copies still share the voltages
+        copies = session.copy_runs([1, 2])
+        session.close()
+        session_file.save_session(self.filename, runs[:1] + copies)
+        session = session_file.SessionFile(self.filename)
+        saved_data = session.saved_data('CV')
+        self.assertEqual(saved_data['labels'], ["a", "b"])
+        self.assertEqual(saved_data['notes'][1], "second\nrun")
+        self.assertEqual(saved_data['colors'], ["red", "blue"])
+        np.testing.assert_array_equal(saved_data['y'][1], [3, 4])
+        np.testing.assert_array_equal(session.y(2), [1.0, -1.0])
+        session.close()
+
+    def test_not_a_session_file(self):
+        """ Test that opening a file that is not a session file raises a ValueError """
+        with open(self.filename, 'wb') as _file:
+            _file.write(b"voltage,a,b\n1,2,3\n")
+        with self.assertRaises(ValueError):
+            session_file.SessionFile(self.filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the SettingsStore class in settings_store.py and how the settings classes in
+properties.py use it
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# local files
+import properties
+import settings_store
+
+OLD_SETTINGS_FILE = """start_dac_value = 1148
+end_voltage = 50
+sweep_start_type = Start
+sweep_type = XX
+sweep_rate = 0.2
+use_swv = True
+start_voltage = 0
+low_voltage = -50
+"""
+
+
+class TestSettingsStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, "settings.txt")
+        with open(self.filename, 'w') as _file:
+            _file.write(OLD_SETTINGS_FILE)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def make_store(self, write_delay=60):
+        return settings_store.SettingsStore(self.filename, properties.SETTINGS_SECTIONS,
+                                            properties.SETTINGS_CHOICES, write_delay)
+
+    def test_load_old_settings_file(self):
+        """ Test that the old settings.txt loads with the right types and bad values are
+        replaced with the defaults """
+        store = self.make_store()
+        self.assertEqual(store.get('', 'end_voltage'), 50)
+        self.assertEqual(store.get('', 'start_voltage'), 0)
+        self.assertIs(store.get('', 'use_swv'), True)
+        self.assertEqual(store.get('', 'sweep_rate'), 0.2)
+        self.assertEqual(store.get('', 'sweep_type'), "CV")  # XX is not a sweep type
+        self.assertEqual(store.section('asv'), properties.DEFAULT_ASV_SETTINGS)
+
+    def test_changes_are_written_once(self):
+        """ Test that many changes are saved with one write and unchanged values do not
+        make a write """
+        store = self.make_store()
+        store.update('', sweep_rate=0.2)
+        self.assertFalse(store.dirty)
+        for voltage in range(100, 110):
+            store.update('asv', clean_volt=voltage)
+        store.update('amp', sampling_rate=2000)
+        self.assertTrue(store.dirty)
+        store.close()
+        self.assertEqual(store.writes, 1)
+        self.assertFalse(os.path.exists(self.filename + ".tmp"))
+
+        reloaded = self.make_store()
+        self.assertEqual(reloaded.get('asv', 'clean_volt'), 109)
+        self.assertEqual(reloaded.get('amp', 'sampling_rate'), 2000)
+        self.assertEqual(reloaded.get('', 'end_voltage'), 50)
+
+    def test_timer_writes_the_changes(self):
+        """ Test that the changes are written after the write delay without calling flush """
+        store = self.make_store(write_delay=0.05)
+        store.update('amp', voltage=200)
+        timer = store._timer
+        timer.join()
+        self.assertEqual(store.writes, 1)
+        self.assertFalse(store.dirty)
+
+    def test_failed_write_keeps_old_file(self):
+        """ Test that an error while writing leaves the old settings file as it was """
+        store = self.make_store()
+        store.update('amp', voltage=200)
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            store.flush()
+        self.assertTrue(store.dirty)
+        with open(self.filename, 'r') as _file:
+            self.assertEqual(_file.read(), OLD_SETTINGS_FILE)
+
+    def test_settings_classes_use_store(self):
+        """ Test that the ASV settings are loaded from and saved to the store """
+        store = self.make_store()
+        store.update('asv', plate_volt=-1000, sweep_type="DPV")
+        dac = properties.DAC("DVDAC", voltage_range=4080)
+        asv_settings = properties.ASVSettings(properties.PWM_FREQ, dac, store)
+        self.assertEqual(asv_settings.low_voltage, -1000)
+        self.assertEqual(asv_settings.sweep_type, "DPV")
+        asv_settings.update_settings(800, 2, -1200, 5, 500, 0.5)
+        self.assertEqual(store.get('asv', 'plate_volt'), -1200)
+        self.assertEqual(store.get('asv', 'sweep_type'), "LS")
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
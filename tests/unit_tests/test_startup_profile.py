@@ -0,0 +1,63 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the import timing in startup_profile.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import builtins
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# local files
+import startup_profile
+
+
+class TestStartupProfile(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp_dir.name, "timed_outer.py"), 'w') as _file:
+            _file.write("import timed_inner\n")
+        with open(os.path.join(self.tmp_dir.name, "timed_inner.py"), 'w') as _file:
+            _file.write("VALUE = 1\n")
+        sys.path.insert(0, self.tmp_dir.name)
+        self.original_import = builtins.__import__
+
+    def tearDown(self) -> None:
+        startup_profile.uninstall()
+        sys.path.remove(self.tmp_dir.name)
+        for name in ("timed_outer", "timed_inner"):
+            sys.modules.pop(name, None)
+        self.tmp_dir.cleanup()
+
+    def test_report(self):
+        """ Test that nested imports are reported with their depth and only once """
+        startup_profile.install()
+        import timed_outer  # noqa: F401
+        import timed_outer  # noqa: F401, F811 already imported so it is not timed again
+        stream = io.StringIO()
+        lines = startup_profile.report("test", stream)
+        self.assertEqual(lines[0], "import time: self [us] | cumulative | imported package")
+        self.assertTrue(lines[1].endswith("|   timed_inner"))
+        self.assertTrue(lines[2].endswith("| timed_outer"))
+        self.assertTrue(lines[3].startswith("test: 2 imports took"))
+        self.assertEqual(stream.getvalue().splitlines(), lines)
+        # the records are cleared after each report
+        self.assertEqual(len(startup_profile.report("test", io.StringIO())), 2)
+
+    def test_uninstall(self):
+        """ Test that uninstalling puts back the original import and stops reports """
+        startup_profile.install()
+        self.assertIsNot(builtins.__import__, self.original_import)
+        startup_profile.uninstall()
+        self.assertIs(builtins.__import__, self.original_import)
+        self.assertEqual(startup_profile.report(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
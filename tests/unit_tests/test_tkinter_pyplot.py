@@ -0,0 +1,64 @@
+# Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Unit test the FigurePool class and drawing runs in tkinter_pyplot.py
+"""
+
+__author__ = "Kyle Vitautas Lopin"
+
+# standard libraries
+import sys
+import unittest
+from unittest import mock
+
+# installed libraries
+from matplotlib.figure import Figure
+
+# local files
+import pyplot_data_class
+import tkinter_pyplot
+
+
+class TestFigurePool(unittest.TestCase):
+    def test_figures_are_reused(self):
+        """ Test that released figures are cleared and given to the next graph """
+        pool = tkinter_pyplot.FigurePool()
+        figure = pool.acquire((5, 4))
+        figure.add_subplot(111).plot([1, 2], [3, 4])
+        pool.release(figure)
+        self.assertIs(pool.acquire((6, 3)), figure)
+        self.assertEqual(figure.axes, [])
+        self.assertEqual(list(figure.get_size_inches()), [6, 3])
+        self.assertIsNot(pool.acquire((5, 4)), figure)
+        self.assertEqual(pool.made, 2)
+
+    def test_pyplot_not_imported(self):
+        """ Test that the graphs do not import pyplot, which keeps every figure it makes """
+        tkinter_pyplot.FigurePool().acquire((5, 4))
+        self.assertNotIn("matplotlib.pyplot", sys.modules)
+
+
+class TestPlotRun(unittest.TestCase):
+    def test_saved_colors_are_used(self):
+        """ Test runs opened with a color are drawn in it and runs without one get the next
+        color of the cycle """
+        tkinter_pyplot.load_matplotlib()
+        graph = tkinter_pyplot.PyplotEmbed.__new__(tkinter_pyplot.PyplotEmbed)
+        axis = Figure().add_subplot(111)
+        graph.graph_area = mock.Mock(axis=axis)
+        graph.traces = tkinter_pyplot.MultiTrace(axis)
+        graph.legend_displayed = True
+        graph.data = pyplot_data_class.PyplotData()
+        graph.data.add_runs(3 * [[0, 1, 2]], [[1, 2, 3], [2, 3, 4], [3, 4, 5]])
+        graph.data.colors.extend(["#ff0000", None])
+        for index in range(3):
+            graph.plot_run(index)
+        self.assertEqual(graph.data.colors[0], "#ff0000")
+        self.assertEqual(graph.data.colors[1], graph.traces.colors[1])
+        self.assertIsNotNone(graph.data.colors[1])
+        self.assertEqual(len(graph.data.colors), 3)
+        self.assertEqual(graph.traces.colors, graph.data.colors)
+
+
+if __name__ == "__main__":
+    unittest.main()
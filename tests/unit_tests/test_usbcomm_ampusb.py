@@ -8,6 +8,7 @@ __author__ = "Kyle Vitautas Lopin"
 
 
 # standard libraries
+import threading
 import unittest
 from unittest import mock
 
@@ -31,3 +32,76 @@ class TestAmpUSB(unittest.TestCase):
         output = usb.process_data(_input, swv=True)
         correct_output = [0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25]
         self.assertListEqual(output, correct_output)
+
+
+class TestDeviceState(unittest.TestCase):
+    def setUp(self) -> None:
+        mocked_root = mock.Mock()
+        self.usb = usb_comm.AmpUsb(mocked_root, properties.DeviceParameters())
+        self.usb.device = mock.Mock()
+        self.usb.device.connected = True
+        self.usb.calibrate = mock.Mock()
+
+    def written(self):
+        return [call.args[0] for call in self.usb.device.write_data.call_args_list]
+
+    def test_repeated_commands_are_not_sent(self):
+        """ Test that a command is only sent if it changes the device state """
+        self.assertTrue(self.usb.send_state('lut', "S|1000|2000|01000|CS"))
+        self.assertFalse(self.usb.send_state('lut', "S|1000|2000|01000|CS"))
+        self.usb.write_timer_compare(500)
+        self.usb.write_timer_compare(500)
+        self.usb.set_electrode_config(3)
+        self.usb.set_electrode_config(3)
+        self.assertEqual(self.written(), ["S|1000|2000|01000|CS", "C|00500", "L|3"])
+
+    def test_overwritten_state_is_sent_again(self):
+        """ Test that changing the PWM period makes the look up table and compare be sent
+        again, and that a connection test forgets all the state """
+        self.usb.send_state('lut', "S|1000|2000|01000|CS")
+        self.usb.write_timer_compare(500)
+        self.usb.send_state('pwm_period', "T|23999")
+        self.usb.send_state('lut', "S|1000|2000|01000|CS")
+        self.usb.write_timer_compare(500)
+        self.assertEqual(len(self.written()), 5)
+        self.usb.usb_read_message = mock.Mock(return_value="USB Test")
+        self.usb.connection_test()
+        self.usb.set_electrode_config(3)
+        self.assertEqual(self.written()[-1], "L|3")
+        self.assertFalse(self.usb.state.is_current('lut', "S|1000|2000|01000|CS"))
+
+    def test_failed_write_is_not_remembered(self):
+        """ Test that a command the device did not get is sent again """
+        self.usb.device.write_data.side_effect = [IOError("unplugged"), None, None]
+        self.usb.usb_read_message = mock.Mock(return_value="USB Test")
+        self.assertFalse(self.usb.send_state('lut', "S|1000|2000|01000|CS"))
+        self.assertTrue(self.usb.send_state('lut', "S|1000|2000|01000|CS"))
+
+    def test_same_current_range_skips_calibration(self):
+        """ Test that picking the current range the device already has does not recalibrate """
+        self.usb.set_adc_tia(2)
+        self.usb.set_adc_tia(2)
+        self.assertEqual(len(self.written()), 1)
+        self.usb.calibrate.assert_called_once()
+
+    def test_current_range_is_resent_after_custom_resistor(self):
+        """ Test that picking the same current range after switching to the custom resistor
+        sends the range again and recalibrates """
+        self.usb.set_adc_tia(2)
+        self.usb.set_custom_resistor_channel(1)
+        self.usb.set_adc_tia(2)
+        written = self.written()
+        self.assertEqual(len(written), 3)
+        self.assertEqual(written[2], written[0])
+        self.assertEqual(self.usb.calibrate.call_count, 2)
+
+    def test_writes_wait_for_the_io_lock(self):
+        """ Test a write from another thread waits while a command and read hold the device """
+        with self.usb.io_lock:
+            writer = threading.Thread(target=self.usb.send_command, args=('reset',))
+            writer.start()
+            writer.join(0.2)
+            self.assertTrue(writer.is_alive())
+            self.usb.device.write_data.assert_not_called()
+        writer.join(2)
+        self.assertEqual(len(self.written()), 1)
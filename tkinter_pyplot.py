@@ -4,17 +4,12 @@
 """ Graphical user interface to control PSoC electrochemical device main file
 """
 # standard libraries
+import importlib.util
 import logging
 import tkinter as tk
-# installed libraries
-import matplotlib
-
-matplotlib.use("TkAgg")
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk as NavToolbar
 # local files
 import change_toplevel as toplevel
+import instrumentation
 
 __author__ = 'Kyle Vitautas Lopin'
 
@@ -22,6 +17,70 @@ LEGEND_SPACE_RATIO = 0.9
 
 logging.getLogger('matplotlib.font_manager').disabled = True
 
+# matplotlib takes longer to import than the rest of the program so load_matplotlib imports
+# it when the first graph is made.  pyplot is not used so it is never imported
+Figure = None
+FigureCanvasTkAgg = None
+NavToolbar = None
+MultiTrace = None
+
+
+def check_display_type():
+    """ Check if matplotlib graph can be used, without importing it
+    :return: type that can be used to make display graph, matplotlib or canvas as a string
+    """
+    if importlib.util.find_spec("matplotlib") is None:
+        return "canvas"
+    return "matplotlib"
+
+
+def load_matplotlib():
+    """ Import the matplotlib figure and TkAgg canvas, the first time it is called """
+    global Figure, FigureCanvasTkAgg, NavToolbar, MultiTrace
+    if Figure is not None:
+        return
+    from matplotlib import figure
+    from matplotlib.backends import backend_tkagg
+    import multi_trace
+    Figure = figure.Figure
+    FigureCanvasTkAgg = backend_tkagg.FigureCanvasTkAgg
+    NavToolbar = backend_tkagg.NavigationToolbar2Tk
+    MultiTrace = multi_trace.MultiTrace
+
+
+class FigurePool(object):
+    """ Figures for all the graphs.  When a graph is destroyed its figure is cleared and kept
+    to be used by the next graph made, so opening and closing windows with graphs does not
+    keep making new figures
+    """
+    def __init__(self):
+        self.free = []
+        self.made = 0  # number of figures made, to check figures are reused
+
+    def acquire(self, figsize):
+        """ Get a blank figure
+        :param figsize: (width, height) of the figure in inches
+        :return: matplotlib.figure.Figure
+        """
+        load_matplotlib()
+        if self.free:
+            figure = self.free.pop()
+            figure.set_size_inches(figsize)
+        else:
+            figure = Figure(figsize=figsize)
+            self.made += 1
+        return figure
+
+    def release(self, figure):
+        """ Clear a figure and keep it to be used again
+        :param figure: matplotlib.figure.Figure from acquire that is not used anymore
+        """
+        figure.clear()
+        self.free.append(figure)
+
+
+FIGURE_POOL = FigurePool()  # shared by the graphs of all the tabs
+
 
 class PyplotEmbed(tk.Frame):
     """
@@ -44,7 +103,7 @@ class PyplotEmbed(tk.Frame):
         self.label_instance = ""
         # Make an area to graph the data
         self.graph_area = tk.Frame(self)
-        self.plotted_lines = [] # make a list to hold the Line2D to display in the graph
+        self.traces = None  # multi_trace.MultiTrace that draws the runs, made with the axis
         self.data = _master_frame.data  # alias the data for this class to the main data
 
         self.legend_displayed = False
@@ -60,24 +119,32 @@ class PyplotEmbed(tk.Frame):
         :param plt_props: dictionary of properties of the pyplot
         :return: bind figure and axis to this instance
         """
-        self.graph_area.figure_bed = plt.figure(figsize=(5, 4))
-        self.graph_area.axis = plt.subplot(111)
+        self.graph_area.figure_bed = FIGURE_POOL.acquire(figsize=(5, 4))
+        self.bind("<Destroy>", self.release_figure, add="+")
+        self.graph_area.axis = self.graph_area.figure_bed.add_subplot(111)
         self.graph_area.axis.format_coord = lambda x, y: ""  # remove the coordinates in the toolbox
-        # go through the plot properties and apply each one that is listed
+        self.traces = MultiTrace(self.graph_area.axis)
+        # go through the plot properties and apply each one that is listed, subplots_adjust is
+        # a figure method and the rest are set_ methods of the axis
         if plt_props:
             for key, value in plt_props.items():
-                eval("plt." + key + "(" + value + ")")
+                if key == 'subplots_adjust':
+                    eval("figure." + key + "(" + value + ")", {},
+                         {'figure': self.graph_area.figure_bed})
+                else:
+                    eval("axis.set_" + key + "(" + value + ")", {},
+                         {'axis': self.graph_area.axis})
         # get the limits of the x axis from the parameters if they are not in the properties
         if plt_props and "xlim" not in plt_props:
             logging.info("setting xlim (low, high): {0}, {1}".format(x_low, x_high))
-            plt.xlim(x_low, x_high)
+            self.graph_area.axis.set_xlim(x_low, x_high)
 
         # calculate the current limit that can be reached, which depends on the resistor value
         #  of the TIAassume the adc can read +- 1V (1000 mV)
         if isinstance(y_lim, list):
-            plt.ylim(y_lim[0], y_lim[1])
+            self.graph_area.axis.set_ylim(y_lim[0], y_lim[1])
         else:
-            plt.ylim(-y_lim, y_lim)
+            self.graph_area.axis.set_ylim(-y_lim, y_lim)
         # format the graph area, make the canvas and show it
         self.graph_area.figure_bed.set_facecolor('white')
         self.graph_area.canvas = FigureCanvasTkAgg(self.graph_area.figure_bed, master=self)
@@ -85,6 +152,7 @@ class PyplotEmbed(tk.Frame):
         # Make a binding for the user to change the data legend
         # uncomment below to start making a data legend editor
         self.graph_area.canvas.mpl_connect('button_press_event', self.legend_handler)
+        self.graph_area.canvas.mpl_connect('scroll_event', self.legend_scroll)
         # Make the toolbar and then unpack it.  allow the user to display or remove it later
         self.toolbar = NavToolbar(self.graph_area.canvas, toolbox_frame)
         self.toolbar.pack_forget()
@@ -92,16 +160,22 @@ class PyplotEmbed(tk.Frame):
         self.graph_area.canvas.draw()
         self.graph_area.canvas.get_tk_widget().pack(side='left', fill=tk.BOTH, expand=1)
 
-    def update_data(self, x_data, y_data, _raw_y_data=None, label=None):
+    def release_figure(self, event):
+        """ Give the figure back to the pool when the graph is destroyed """
+        if event.widget is self and self.graph_area.figure_bed is not None:
+            FIGURE_POOL.release(self.graph_area.figure_bed)
+            self.graph_area.figure_bed = None
+
+    def update_data(self, x_data, y_data, _raw_y_data=None, label=None, run_info=None):
         if self.user_sets_labels_after_run:
-            self.data.add_data(x_data, y_data, _raw_y_data)
+            self.data.add_data(x_data, y_data, _raw_y_data, run_info=run_info)
             self.display_data()
             if not label:
                 toplevel.UserSetDataLabel(self)
             else:
                 self.change_label(label)
         else:
-            self.data.add_data(x_data, y_data, _raw_y_data)
+            self.data.add_data(x_data, y_data, _raw_y_data, run_info=run_info)
             self.display_data()
 
     def simple_update_data(self, x_data, y_data):
@@ -140,10 +214,25 @@ class PyplotEmbed(tk.Frame):
     def display_data(self):
         """ Take in a x and y data set and plot them in the self instance of the pyplot
         """
-        index = self.data.index - 1  # it was incremented at the end of the add_data method
-        x_data = self.data.voltage_data[index]
-        y_data = self.data.current_data[index]
-        _label = self.data.label[index]
+        self.plot_run(self.data.index - 1)  # it was incremented at the end of the add_data method
+        self.update_legend()
+
+    def display_runs(self, first_index):
+        """ Plot all the runs from first_index to the last run saved in the data and redraw the
+        graph only once, used when many runs are added at the same time
+        :param first_index: int - index of the first run to plot
+        """
+        for index in range(first_index, self.data.index):
+            self.plot_run(index)
+        self.update_legend()
+
+    def plot_run(self, index):
+        """ Add a line to the plot area for a run saved in the data, does not redraw the graph.
+        The run is drawn in the color the data has for it, e.g. from a session file, or the
+        next color of the color cycle if it has none
+        :param index: int - index of the run in the data
+        """
+        x_data, y_data, _ = self.data.run_arrays(index)
         # if this is the first data series to be added the legend has to be displayed also
         if not self.legend_displayed:
             _box = self.graph_area.axis.get_position()
@@ -151,10 +240,6 @@ class PyplotEmbed(tk.Frame):
                                                _box.height])
             self.legend_displayed = True
         # add the data to the plot area and update the legend
-        # print 'len x: ', len(x_data)
-        # print 'len y: ', len(y_data)
-        # print 'types: ', type(x_data), type(y_data)
-
         if len(x_data) > len(y_data):
             x_data = x_data[:len(y_data)]
             logging.error('MISMATCHED DATA LENGTH X DATA IS TOO LONG')
@@ -162,10 +247,10 @@ class PyplotEmbed(tk.Frame):
         elif len(y_data) > len(x_data):
             y_data = y_data[:len(x_data)]
             logging.error('MISMATCHED DATA LENGTH Y DATA IS TOO LONG')
-        l = self.graph_area.axis.plot(x_data, y_data, label=_label)
-        self.data.colors.append(l[0].get_color())
-        self.plotted_lines.append(l)
-        self.update_legend()
+        if index < len(self.data.colors):
+            self.data.colors[index] = self.traces.add(x_data, y_data, self.data.colors[index])
+        else:
+            self.data.colors.append(self.traces.add(x_data, y_data))
 
     def update_amp_data(self, t, y, time_displayed):
 
@@ -178,30 +263,47 @@ class PyplotEmbed(tk.Frame):
             self.l.set_xdata(t)
             self.graph_area.axis.set_xlim(t[-1] - time_displayed, t[-1])
             # self.graph_area.axis.set_ylim(0, 60000)
-        self.graph_area.canvas.draw()
+        self.update_graph()
+
+    def update_time_course(self, t, y, x_max):
+        """ Show a time course that starts at 0, the line is updated in place so long runs do
+        not make new lines
+        :param t: array of the times
+        :param y: array of the currents
+        :param x_max: time the run will end at, the x axis is set to show the whole run
+        """
+        if self.l is None:
+            self.l, = self.graph_area.axis.plot(t, y)
+        else:
+            self.l.set_data(t, y)
+        self.graph_area.axis.set_xlim(0, x_max)
+        self.graph_area.canvas.draw_idle()
 
     def update_legend(self):
         """ Update the legend and redraw the graph
         """
-        handle, labels = self.graph_area.axis.get_legend_handles_labels()
-
-        self.graph_area.axis.legend(handle, self.data.label,
+        # only the runs on the legend page are put in the legend, so it takes the same time
+        # to make no matter how many runs there are
+        page = self.traces.page_range()
+        title = 'Data series'
+        if len(self.traces) > len(page):
+            title = "Data series {0}-{1} of {2}".format(page.start + 1, page.stop,
+                                                        len(self.traces))
+        self.graph_area.axis.legend(self.traces.legend_handles(),
+                                    self.data.label[page.start:page.stop],
                                     loc='center left',
                                     bbox_to_anchor=(1, 0.5),
-                                    title='Data series',
+                                    title=title,
                                     prop={'size': 10},
                                     fancybox=True)  # not adding all this screws it up
         # up for some reason
-        self.graph_area.canvas.draw()  # update the canvas where the data is being shown
+        self.update_graph()  # update the canvas where the data is being shown
 
     def delete_all_lines(self):
         """ Remove all the lines from the graph
         """
         logging.debug("deleting all lines")
-        while self.plotted_lines:  # remove lines release all the memory
-            l = self.plotted_lines.pop(0)
-            l.pop().remove()  # self.plotted_lines is a list of list so you have to pop twice
-            del l  # see stackoverflow "how to remove lines in a matplotlib"
+        self.traces.clear()  # removes the collections so their memory is released
 
         # Update the legend with an empty data set but will keep the title and box showing
         # in the graph area
@@ -209,28 +311,34 @@ class PyplotEmbed(tk.Frame):
 
     def delete_a_line(self, index):
         """ Delete a single line from the graph
-        :param index:  int, index of which line to delete. the lines are saved in a list called
-        self.plotted_lines
+        :param index:  int, index of which run to delete
         """
         logging.debug("deleting line: %i", index)
-        line = self.plotted_lines.pop(index)
+        self.traces.remove(index)
         self.data.remove_data(index)
-        line.pop().remove()
-        del line  # release memory
         self.update_legend()
 
     def change_line_color(self, _color, index):
         """ Change the color of a line
         :param _color: tkinter color option to change to
-        :param index: index of which line in the self.plotted_lines list to change
+        :param index: index of which run to change
         """
-        self.plotted_lines[index][0].set_color(_color)
+        self.traces.set_color(index, _color)
         self.data.colors[index] = _color
 
+    def set_run_visible(self, index, visible):
+        """ Show or hide a run without deleting it, its legend entry is faded when hidden
+        :param index: index of the run
+        :param visible: True to show the run
+        """
+        self.traces.set_visible(index, visible)
+        self.update_legend()
+
     def update_graph(self):
         """ Redraw the graoh
         """
-        self.graph_area.canvas.draw()
+        with instrumentation.stage(instrumentation.DRAW):
+            self.graph_area.canvas.draw()
 
     def toolbar_toggle(self):
         """ Display or remove the toolbar from the GUI
@@ -250,17 +358,26 @@ class PyplotEmbed(tk.Frame):
         if event.x > (0.82 * self.winfo_width()):  # if mouse is clicked on the right side
             self.master.change_data_labels()
 
+    def legend_scroll(self, event):
+        """ Show the next or previous page of the legend when the mouse wheel is turned over
+        it
+        :param event: matplotlib scroll event
+        """
+        if event.x > (0.82 * self.winfo_width()):
+            if self.traces.change_page(-1 if event.button == 'up' else 1):
+                self.update_legend()
+
     def resize_x(self, x_low, x_high):
         """ Change the scale of the x axis
         :param x_low: lower limit on x axis
         :param x_high: upper limit on x axis
         """
         self.graph_area.axis.set_xlim([x_low, x_high])
-        self.graph_area.canvas.draw()
+        self.update_graph()
 
     def resize_y(self, _current_limit):
         """ Change the scale of the y axis
         :param _current_limit: most current (positive or negative)
         """
         self.graph_area.axis.set_ylim(-_current_limit * 1.2, _current_limit * 1.2)
-        self.graph_area.canvas.draw()
+        self.update_graph()
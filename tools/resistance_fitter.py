@@ -1,39 +1,32 @@
 # Copyright (c) 2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
 
 """
-Functions to fit I-V curves to a resistance
+Fit I-V curves to a resistance, for every column of the files given, e.g.
+    python resistance_fitter.py Rs.xlsx board_2.csv --cutoff 40
+The fitting is done by resistance_fit in the main folder.
 """
 
 __author__ = "Kyle Vitautas Lopin"
 
-# installed libraries
-import numpy as np
-import pandas as pd
+# standard libraries
+import argparse
+import os
+import sys
 
-CUTOFF = 50
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import resistance_fit  # noqa: E402, the main folder has to be on the path first
 
 
-def load_data(filename: str) -> pd.DataFrame:
-    data = pd.read_excel(filename, index_col="voltage")
-    return data
-
-
-def remove_cutoff_values(_series: pd.Series) -> pd.DataFrame:
-    return _series[(_series < CUTOFF) & (_series > -CUTOFF)]
-
-
-def fit_lines(_df: pd.DataFrame):
-    for column in _df.columns:
-        print(column)
-        fixed_df = remove_cutoff_values(_df[column])
-        # print(fixed_df.values)
-        z = np.polyfit(x=fixed_df.index,
-                       y=fixed_df.values,
-                       deg=1)
-        # print(f"z: {z}")
-        print(f"Calculated R: {1000/z[0]}")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit I-V curves to a resistance")
+    parser.add_argument('files', nargs='*', default=["Rs.xlsx"])
+    parser.add_argument('--cutoff', type=float, default=resistance_fit.CUTOFF,
+                        help="currents (uA) past this are not used")
+    args = parser.parse_args(argv)
+    for row in resistance_fit.fit_files(args.files, args.cutoff):
+        print("{file} {label}: R = {resistance:.1f} ohms, intercept = {intercept:.3f} uA, "
+              "residual = {residual:.3f} uA, {points} points".format(**row))
 
 
 if __name__ == '__main__':
-    data = load_data("Rs.xlsx")
-    fit_lines(data)
+    main()
@@ -1,42 +1,382 @@
-# Copyright (c) 2022 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+# Copyright (c) 2022-2023 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
 
 """
-Make a simple GUI to put in inputs, in an entry box and receive messages and print them
-to the console
+GUI to send messages to the device and watch what it sends back, fast enough to keep up with
+a streaming run.
+
+A reader thread reads the serial port and queues each chunk it gets with the time it came in.
+The tkinter side takes the queued chunks every DRAIN_INTERVAL ms, so the reads never wait on
+the GUI.  The chunks are shown as rows of 16 bytes in hex and ASCII or as int16 values, only
+the rows that fit in the window are formatted so a long stream does not slow the view down.
+Each chunk is sorted into a kind (text, amperometry data, framed packets or other binary) and
+the kinds can be hidden.  The throughput is shown under the view, and the traffic can be
+saved to a serial_capture file to play back later.
+
+    python serial_monitor.py
 """
 
 __author__ = "Kyle Vitautas Lopin"
 
 # standard libraries
+import bisect
+import collections
+import os
+import queue
+import string
+import struct
+import sys
+import threading
 import time
 import tkinter as tk
+import tkinter.font
+from tkinter import filedialog
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # local files
-from usb_comm import SerialComm
+import packet_framing  # noqa: E402, the main folder has to be on the path first
+import usb_comm  # noqa: E402
+
+BYTES_PER_ROW = 16
+MAX_STORED_BYTES = 16 * 1024 * 1024  # older chunks are dropped past this
+DRAIN_INTERVAL = 50  # ms between taking the chunks the reader thread queued
+STATS_INTERVAL = 500  # ms between updates of the throughput counters
+RATE_WINDOW = 2.0  # seconds the throughput is averaged over
+IDLE_WAIT = 0.002  # seconds the reader waits when no data is waiting
+
+TEXT = "text"
+AMP = "amp data"
+FRAMED = "framed"
+BINARY = "binary"
+KINDS = [TEXT, AMP, FRAMED, BINARY]
+VIEWS = ["hex", "int16"]
+
+_TERMINATION_BYTES = struct.pack("<h", usb_comm.TERMINATION_CODE)
+_PRINTABLE = set(string.printable.encode())
+
+
+class Classifier(object):
+    """ Sort the chunks read into kinds.  A read can end in the middle of a data packet so
+    binary chunks carry on the kind of the chunk before them until an amperometry termination
+    code ends it or sync bytes start a framed packet """
+    def __init__(self):
+        self._stream = None  # kind of the binary data being received
+
+    def classify(self, data):
+        if data.startswith(packet_framing.SYNC):
+            self._stream = FRAMED
+        elif all(byte in _PRINTABLE for byte in data):
+            self._stream = None
+            return TEXT
+        elif self._stream is None:
+            self._stream = AMP if len(data) % 2 == 0 else BINARY
+        kind = self._stream
+        if kind == AMP and _TERMINATION_BYTES in data[-2:]:
+            self._stream = None
+        return kind
+
+
+def format_row(data, view):
+    """ Format up to BYTES_PER_ROW bytes
+    :param data: bytes of the row
+    :param view: "hex" for hex and ASCII, "int16" for little endian int16 values
+    :return: str of the row
+    """
+    if view == "int16":
+        values = struct.unpack("<{0}h".format(len(data) // 2), data[:2 * (len(data) // 2)])
+        text = " ".join("{0:6d}".format(value) for value in values)
+        if len(data) % 2:
+            text += "     {0:02x}".format(data[-1])
+        return text
+    ascii_text = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in data)
+    return "{0:<47}  |{1}|".format(data.hex(" "), ascii_text)
+
+
+def _chunk_rows(data):
+    return max(1, -(-len(data) // BYTES_PER_ROW))
+
+
+class ChunkStore(object):
+    """ The chunks read and the rows they make, only the chunks of the kinds that are not
+    hidden make rows """
+    def __init__(self, max_bytes=MAX_STORED_BYTES):
+        self.max_bytes = max_bytes
+        self.chunks = collections.deque()  # tuples of the time, kind and bytes
+        self.stored_bytes = 0
+        self.dropped_bytes = 0
+        self.hidden = set()
+        self.rows = 0
+        self._visible = []  # chunks that are shown
+        self._row_starts = []  # first row of each shown chunk
+        self.start_time = time.monotonic()
+
+    def add(self, timestamp, kind, data):
+        """ Store a chunk, dropping the oldest chunks if the store is full
+        :param timestamp: time the chunk was read
+        :param kind: one of KINDS
+        :param data: bytes read
+        :return: int of how many rows were dropped from the start
+        """
+        self.chunks.append((timestamp, kind, data))
+        self.stored_bytes += len(data)
+        dropped_rows = 0
+        if self.stored_bytes > self.max_bytes:
+            # drop down to 3/4 full so the rows are not remade for every chunk
+            while self.stored_bytes > 3 * self.max_bytes // 4:
+                _, old_kind, old = self.chunks.popleft()
+                self.stored_bytes -= len(old)
+                self.dropped_bytes += len(old)
+                if old_kind not in self.hidden:
+                    dropped_rows += _chunk_rows(old)
+            self.rebuild()
+        elif kind not in self.hidden:
+            self._show(self.chunks[-1])
+        return dropped_rows
+
+    def set_hidden(self, kinds):
+        self.hidden = set(kinds)
+        self.rebuild()
+
+    def rebuild(self):
+        self._visible = []
+        self._row_starts = []
+        self.rows = 0
+        for chunk in self.chunks:
+            if chunk[1] not in self.hidden:
+                self._show(chunk)
+
+    def _show(self, chunk):
+        self._visible.append(chunk)
+        self._row_starts.append(self.rows)
+        self.rows += _chunk_rows(chunk[2])
+
+    def row(self, index, view):
+        """ Format one row
+        :param index: row number, from 0 to self.rows - 1
+        :param view: one of VIEWS
+        :return: str of the row, the first row of a chunk has its time and kind
+        """
+        chunk_index = bisect.bisect_right(self._row_starts, index) - 1
+        timestamp, kind, data = self._visible[chunk_index]
+        part = index - self._row_starts[chunk_index]
+        if part == 0:
+            prefix = "{0:10.3f} {1:<8} ".format(timestamp - self.start_time, kind)
+        else:
+            prefix = " " * 20
+        offset = part * BYTES_PER_ROW
+        return "{0}{1:04x}  {2}".format(prefix, offset,
+                                        format_row(data[offset:offset + BYTES_PER_ROW], view))
+
+
+class Throughput(object):
+    """ Bytes and chunks received, in total and per second over the last RATE_WINDOW s """
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self.total_bytes = 0
+        self.total_chunks = 0
+        self._recent = collections.deque()  # tuples of the time and size of the chunks
+
+    def add(self, timestamp, size):
+        self.total_bytes += size
+        self.total_chunks += 1
+        self._recent.append((timestamp, size))
+
+    def rates(self, now=None):
+        """ :return: tuple of the bytes per second and chunks per second """
+        now = time.monotonic() if now is None else now
+        while self._recent and self._recent[0][0] < now - self.window:
+            self._recent.popleft()
+        return (sum(size for _, size in self._recent) / self.window,
+                len(self._recent) / self.window)
+
+
+class Reader(threading.Thread):
+    """ Thread that reads the serial port and queues the chunks with the time they came in """
+    def __init__(self, device, chunks):
+        threading.Thread.__init__(self, daemon=True)
+        self.device = device
+        self.chunks = chunks
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                data = self.device.poll_for_data()
+            except Exception as error:  # e.g. the device was unplugged
+                self.error = error
+                return
+            if data:
+                self.chunks.put((time.monotonic(), data))
+            else:
+                self._stop_event.wait(IDLE_WAIT)
+
+    def stop(self):
+        self._stop_event.set()
 
 
 class Monitor(tk.Tk):
     def __init__(self):
         tk.Tk.__init__(self)
-        self.device = SerialComm()
-        self.entry = tk.Entry(self)
-        self.entry.pack()
-        tk.Button(self, text="Send message", command=self.send_message).pack()
-        self.poll_for_input()
+        self.title("Serial monitor")
+        self.device = usb_comm.SerialComm()
+        self.store = ChunkStore()
+        self.throughput = Throughput()
+        self.classifier = Classifier()
+        self.queue = queue.Queue()
+        self.top_row = 0
+        self.follow = True  # keep the newest rows in view
+        self.view = tk.StringVar(self, value=VIEWS[0])
+        self.hide = {kind: tk.BooleanVar(self, value=False) for kind in KINDS}
+        self.stats = tk.StringVar(self)
+        self.make_controls()
+        self.make_view()
+
+        self.reader = None
+        if self.device.device:
+            self.reader = Reader(self.device, self.queue)
+            self.reader.start()
+        else:
+            self.stats.set("No device found")
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.after(DRAIN_INTERVAL, self.drain)
+        self.after(STATS_INTERVAL, self.update_stats)
+
+    def make_controls(self):
+        controls = tk.Frame(self)
+        controls.pack(side='top', fill=tk.X)
+        self.entry = tk.Entry(controls)
+        self.entry.pack(side='left', fill=tk.X, expand=True)
+        self.entry.bind('<Return>', lambda event: self.send_message())
+        tk.Button(controls, text="Send message", command=self.send_message).pack(side='left')
+        for view in VIEWS:
+            tk.Radiobutton(controls, text=view, variable=self.view, value=view,
+                           command=self.render).pack(side='left')
+        self.capture_button = tk.Button(controls, text="Capture to file",
+                                        command=self.toggle_capture)
+        self.capture_button.pack(side='left')
+
+        filters = tk.Frame(self)
+        filters.pack(side='top', fill=tk.X)
+        tk.Label(filters, text="Hide:").pack(side='left')
+        for kind in KINDS:
+            tk.Checkbutton(filters, text=kind, variable=self.hide[kind],
+                           command=self.change_filters).pack(side='left')
+        tk.Button(filters, text="Clear", command=self.clear).pack(side='right')
+        tk.Label(self, textvariable=self.stats, anchor='w').pack(side='bottom', fill=tk.X)
+
+    def make_view(self):
+        frame = tk.Frame(self)
+        frame.pack(side='top', fill=tk.BOTH, expand=True)
+        self.scrollbar = tk.Scrollbar(frame, command=self.scroll)
+        self.scrollbar.pack(side='right', fill=tk.Y)
+        self.font = tkinter.font.Font(family='Courier', size=10)
+        self.text = tk.Text(frame, font=self.font, wrap='none', width=100)
+        self.text.pack(side='left', fill=tk.BOTH, expand=True)
+        self.text.bind('<Configure>', lambda event: self.render())
+        self.text.bind('<MouseWheel>', lambda event: self.scroll(
+            'scroll', -1 if event.delta > 0 else 1, 'units'))
+        self.text.bind('<Button-4>', lambda event: self.scroll('scroll', -1, 'units'))
+        self.text.bind('<Button-5>', lambda event: self.scroll('scroll', 1, 'units'))
+
+    def visible_rows(self):
+        return max(1, self.text.winfo_height() // self.font.metrics('linespace'))
+
+    def scroll(self, action, amount, units=None):
+        """ Scrollbar and mouse wheel command, moves the first row shown """
+        rows_shown = self.visible_rows()
+        if action == 'moveto':
+            top = int(float(amount) * self.store.rows)
+        else:
+            step = rows_shown if units == 'pages' else 3
+            top = self.top_row + int(amount) * step
+        last_top = max(0, self.store.rows - rows_shown)
+        self.top_row = min(max(top, 0), last_top)
+        self.follow = self.top_row >= last_top
+        self.render()
+
+    def render(self):
+        """ Format and show only the rows that fit in the view """
+        rows_shown = self.visible_rows()
+        if self.follow:
+            self.top_row = max(0, self.store.rows - rows_shown)
+        end = min(self.top_row + rows_shown, self.store.rows)
+        view = self.view.get()
+        self.text.delete('1.0', 'end')
+        self.text.insert('1.0', "\n".join(self.store.row(i, view)
+                                          for i in range(self.top_row, end)))
+        if self.store.rows:
+            self.scrollbar.set(self.top_row / self.store.rows, end / self.store.rows)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def drain(self):
+        """ Take the chunks the reader queued and show them """
+        self.after(DRAIN_INTERVAL, self.drain)
+        new_chunks = False
+        dropped_rows = 0
+        while True:
+            try:
+                timestamp, data = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.throughput.add(timestamp, len(data))
+            dropped_rows += self.store.add(timestamp, self.classifier.classify(data), data)
+            new_chunks = True
+        if dropped_rows and not self.follow:
+            # keep the same rows in view when older rows are dropped from the start
+            self.top_row = max(0, self.top_row - dropped_rows)
+            self.render()
+        elif new_chunks and self.follow:
+            self.render()
+
+    def update_stats(self):
+        self.after(STATS_INTERVAL, self.update_stats)
+        if self.reader and self.reader.error:
+            self.stats.set("Read failed: {0}".format(self.reader.error))
+            return
+        if not self.reader:
+            return
+        bytes_per_second, chunks_per_second = self.throughput.rates()
+        self.stats.set("{0:,.0f} B/s  {1:.1f} reads/s  total {2:,} B in {3:,} reads  "
+                       "dropped {4:,} B{5}".format(
+                           bytes_per_second, chunks_per_second, self.throughput.total_bytes,
+                           self.throughput.total_chunks, self.store.dropped_bytes,
+                           "  capturing" if self.device.recorder else ""))
+
+    def change_filters(self):
+        self.store.set_hidden(kind for kind in KINDS if self.hide[kind].get())
+        self.top_row = min(self.top_row, self.store.rows)
+        self.render()
+
+    def clear(self):
+        self.store = ChunkStore()
+        self.store.set_hidden(kind for kind in KINDS if self.hide[kind].get())
+        self.top_row = 0
+        self.follow = True
+        self.render()
 
     def send_message(self):
         self.device.write_data(self.entry.get())
 
-    def poll_for_input(self):
-        self.after(10, self.poll_for_input)
-        data = self.device.poll_for_data()
-        if data:
-            print(f"Got data: {data}")
-            print(f"len data: {len(data)}")
+    def toggle_capture(self):
+        if self.device.recorder:
+            self.device.stop_capture()
+            self.capture_button.config(text="Capture to file")
+            return
+        filename = filedialog.asksaveasfilename(defaultextension='.capture',
+                                                filetypes=[('serial capture', '*.capture')])
+        if filename:
+            self.device.start_capture(filename)
+            self.capture_button.config(text="Stop capture")
+
+    def close(self):
+        if self.reader:
+            self.reader.stop()
+        self.device.stop_capture()
+        self.destroy()
 
 
 if __name__ == '__main__':
     app = Monitor()
-    print("check1")
-    app.geometry("400x400")
+    app.geometry("900x500")
     app.mainloop()
@@ -5,7 +5,9 @@
 """
 
 # standard libraries
+import logging
 import tkinter as tk
+from tkinter import ttk
 
 __author__ = 'Kyle Vitautas Lopin'
 
@@ -20,7 +22,7 @@ class VoltageSourceSelect(tk.Toplevel):
         self.geometry("300x200")
         self.source_selected = None
         self.master = master
-        print('current value: ', current_value)
+        logging.debug("current value: %s", current_value)
         if current_value == 0:  # no choice has been made yet
             _label = "No voltage selected yet"
         else:
@@ -38,10 +40,59 @@ class VoltageSourceSelect(tk.Toplevel):
         self.attributes("-topmost", True)
 
     def send_selection(self, source_selected):
-        print('source: ', source_selected)
+        logging.debug("source: %s", source_selected)
 
         if source_selected == 'VDAC':
-            self.master.device.usb_write('VS1')
+            device = self.master.device
+            device.send_state('dac_source', device.command('voltage_source', 1))
 
         self.source_selected = source_selected
         self.destroy()
+
+
+class ResultsTable(tk.Toplevel):
+    """
+    Toplevel to show a table of analysis results, one row for each run
+    """
+
+    def __init__(self, master, title, labels, columns):
+        """
+        :param master: root application
+        :param title: title of the window
+        :param labels: list of the run labels, the first column
+        :param columns: list of tuples of the column heading and the list of values of the
+        column, numbers are shown with 4 significant figures
+        """
+        tk.Toplevel.__init__(self, master=master)
+        self.title(title)
+        headings = ["run"] + [heading for heading, _ in columns]
+        table = ttk.Treeview(self, columns=headings, show='headings')
+        for heading in headings:
+            table.heading(heading, text=heading)
+            table.column(heading, width=110, anchor='e')
+        for i, label in enumerate(labels):
+            table.insert('', 'end', values=[label] + ["{0:.4g}".format(values[i])
+                                                      for _, values in columns])
+        table.pack(side='top', expand=True, fill=tk.BOTH)
+        tk.Button(self, text="Close", command=self.destroy).pack(side='bottom')
+
+
+class TextReport(tk.Toplevel):
+    """
+    Toplevel to show lines of text in a fixed width font, e.g. the timing report
+    """
+
+    def __init__(self, master, title, lines):
+        """
+        :param master: root application
+        :param title: title of the window
+        :param lines: list of the lines of text to show
+        """
+        tk.Toplevel.__init__(self, master=master)
+        self.title(title)
+        text = tk.Text(self, font=('Courier', 10), wrap='none',
+                       width=max([len(line) for line in lines] + [40]), height=len(lines) + 1)
+        text.insert('1.0', "\n".join(lines))
+        text.config(state='disabled')
+        text.pack(side='top', expand=True, fill=tk.BOTH)
+        tk.Button(self, text="Close", command=self.destroy).pack(side='bottom')
@@ -4,8 +4,11 @@
 """ Communicate with a USB device for a PSoC electrochemical device
 """
 # standard libraries
+import functools
 import logging
+import os
 import struct
+import threading
 import time
 
 # installed libraries
@@ -13,9 +16,14 @@ import serial
 import serial.tools.list_ports
 
 # local files
+import commands
 import cv_frame
 import change_toplevel as toplevel
+import data_trace
 import globals as _globals
+import instrumentation
+import packet_framing
+import serial_capture
 
 # import toplevels
 
@@ -49,6 +57,47 @@ MAX_TIA_SETTING = 7
 # CURRENT_LIMIT_VALUES = [100, 66, 50, 25, 16, 8, 4, 2, 1, 0.5, 0.25]
 CURRENT_LIMIT_VALUES = _globals.CURRENT_LIMIT_VALUES
 
+# parts of the device state that sending a command for the first part also changes, loading a
+# look up table also sets the PWM period and the compare is written after it
+STATE_OVERWRITES = {'lut': ['pwm_period', 'pwm_compare'],
+                    'pwm_period': ['lut', 'pwm_compare']}
+
+
+def _with_io_lock(method):
+    """ Make an AmpUsb method hold the device's io_lock while it runs """
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.io_lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class DeviceState(object):
+    """ Copy of the settings the device was last sent, so commands that would not change the
+    device are not sent again.  The parts of the state are 'lut' (the CV / ASV look up table
+    command), 'pwm_period', 'pwm_compare', 'dac_source', 'adc_tia' and 'electrode_config' and
+    each one holds the last command sent to set it
+    """
+    def __init__(self):
+        self.commands = {}
+
+    def is_current(self, key, command):
+        """ Check if the device was already sent command to set the key part of its state """
+        return self.commands.get(key) == command
+
+    def set(self, key, command):
+        """ Record that command was sent, forgetting the parts of the state it overwrites """
+        self.forget(*STATE_OVERWRITES.get(key, []))
+        self.commands[key] = command
+
+    def forget(self, *keys):
+        for key in keys:
+            self.commands.pop(key, None)
+
+    def clear(self):
+        """ Forget everything, for when the device may have reset """
+        self.commands.clear()
+
 
 class AmpUsb(object):
     """
@@ -58,7 +107,8 @@ class AmpUsb(object):
     function handles the specifics
     """
 
-    def __init__(self, _master, _device_params, vendor_id=USB_VENDOR_ID, product_id=USB_PRODUCT_ID):
+    def __init__(self, _master, _device_params, vendor_id=USB_VENDOR_ID, product_id=USB_PRODUCT_ID,
+                 transport=None):
         """ Initialize a communication channel to a PSoC with a USBUART module.
 
         :param _master: the master program that is using the usb
@@ -67,6 +117,9 @@ class AmpUsb(object):
         :param vendor_id: the USB vendor id, used to identify the proper device connected to
         the computer
         :param product_id: the USB product id
+        :param transport: object with the methods of SerialComm to talk through, e.g. a
+        serial_capture.ReplaySerial, None to find the device (or replay the capture file in
+        the serial_capture.REPLAY_VARIABLE environment variable)
         :return:
         """
         # attempt to connect the device
@@ -75,20 +128,34 @@ class AmpUsb(object):
         self.master = _master
         self.device_type = None
         self.last_experiment = "CV"  # keep track of what type of experiment was run last, CV or ASV
+        self.state = DeviceState()  # what the device has been set to
+        self.codec = commands.CommandEncoder()  # ASCII until the device says it reads binary
+        self.deframer = None  # packet_framing.Deframer if the device frames its data
+        self.lost_samples = 0  # estimate of the samples in framed packets that were lost
         self.samples_to_smooth = 1  # TODO: python 3 use properties to limit its value
+        # held for every read and write, and by callers for a command and the read of its reply,
+        # so the tkinter, pipeline, sequencer and background threads do not mix their messages
+        self.io_lock = threading.RLock()
         logging.info("attempting connection")
-        self.device = SerialComm()
+        if transport is None and serial_capture.replay_filename():
+            logging.info("replaying %s", serial_capture.replay_filename())
+            transport = serial_capture.ReplaySerial(serial_capture.replay_filename())
+        self.device = transport if transport is not None else SerialComm()
 
         # If it was found to be working properly initialize the device
         if self.device.connected:
             self.connected = True
-            print("Initializing run parameters")
+            self.codec = commands.CommandEncoder(commands.negotiate(self.device.identity))
+            logging.info("using the %s command protocol", self.codec.protocol)
+            if packet_framing.supported(self.device.identity):
+                logging.info("device sends framed data packets")
+                self.deframer = packet_framing.Deframer()
             logging.info("Initializing run parameters")
 
             self.find_voltage_source()
             time.sleep(0.5)
             # self.send_cv_parameters()
-            self.usb_write("A|1|0|0|F|2")  # set the TIA resistor to 20k ohm on startup
+            self.send_state('adc_tia', self.command('adc_tia', 1, 0, 0, 'F', 2))  # set the TIA resistor to 20k ohm on startup
             self.calibrate()  # calibrate the TIA settings
 
     def connection_test(self, fails=0):
@@ -96,9 +163,10 @@ class AmpUsb(object):
         by sending a message and check if the amperometry responses with the proper message
         """
         # clear the IN BUFFER of the device incase it was stopped or the program was restarted
-        self.device.clear_in_buffer()
+        self.clear_in_buffer()
+        self.state.clear()  # the device may have reset so send everything again
         self.device.connected = True  # for usb_write to work it needs to be in connected state
-        self.usb_write("I")
+        self.send_command('identify')
 
         received_message = self.usb_read_message()
         # time.sleep(0.5)
@@ -131,21 +199,23 @@ class AmpUsb(object):
         """ Test the device to see if it is using the 8-bit VDAC or the 12-bit DVDAC
         :return: None, bind voltage source to self.device_params.dac
         """
-        self.usb_write("VR")
+        self.send_command('read_voltage_source')
         time.sleep(0.2)
         source_input = self.usb_read_data(2)
-        print(f"source input: {source_input}")
+        logging.debug("source input: %s", source_input)
         if not source_input:
             return
         if source_input[1] == 0:
             toplevel.VoltageSourceSelect(self.master, source_input[1])
         elif source_input[1] == 1:
             logging.info("VDAC is set in device")
+            self.state.set('dac_source', self.command('voltage_source', 1))
             self.master.set_voltage_source_label(
                 "Voltage source: 8-bit VDAC (no capacitor installed)")
             self.device_params.dac.set_source("8-bit DAC")
         elif source_input[1] == 2:
             logging.info("DVDAC is voltage source")
+            self.state.set('dac_source', self.command('voltage_source', 2))
             self.master.set_voltage_source_label(
                 "Voltage source: Dithering VDAC (capacitor installed)")
             self.device_params.dac.set_source("DVDAC")
@@ -158,11 +228,13 @@ class AmpUsb(object):
         :return:
         """
         logging.info('selecting source: {0}'.format(source))
-        # if source == self.device_params.dac.source:
-        # return  # selected source that is already chosen
+        source_number = {"8-bit DAC": 1, "DVDAC": 2}.get(source)
+        if source_number and self.state.is_current('dac_source',
+                                                   self.command('voltage_source', source_number)):
+            return  # selected source that is already chosen
         if source == "8-bit DAC":
             # tell the device to set the voltage source as the DVDAC
-            self.usb_write("VS1")
+            self.send_state('dac_source', self.command('voltage_source', 1))
             # set the device dac attribute to VDAC
             self.master.set_voltage_source_label(
                 "Voltage source: 8-bit VDAC (no capacitor installed)")
@@ -171,7 +243,7 @@ class AmpUsb(object):
             self.send_cv_parameters()
         elif source == "DVDAC":
             # tell the device to set the voltage source as the DVDAC
-            self.usb_write("VS2")
+            self.send_state('dac_source', self.command('voltage_source', 2))
             # set the device dac attribute to DVDAC
             self.device_params.dac.set_source("DVDAC")
             self.master.set_voltage_source_label(
@@ -180,7 +252,7 @@ class AmpUsb(object):
             self.send_cv_parameters()
 
     def start_hardware(self):
-        self.usb_write('H')
+        self.send_command('start_hardware')
 
     def send_cv_parameters(self):
         """ Make it easier to update the Cyclic Voltammetry frames, send it to the cv usb handler
@@ -192,9 +264,9 @@ class AmpUsb(object):
         :param value: the value to write in the timer compare
         """
         self.master.device_params.PWM_compare = int(value)
-        _formatted_value = '{0:05d}'.format(int(value))
-        self.usb_write('C|' + _formatted_value)
+        self.send_state('pwm_compare', self.command('pwm_compare', int(value)))
 
+    @_with_io_lock
     def get_data(self, number_packets=None):
         """ Get the raw adc counts from the device
 
@@ -207,24 +279,81 @@ class AmpUsb(object):
         # from the uint16 it is acquired in
         if not number_packets:
             number_packets = ((self.device_params.usb_count + 1) / (USB_IN_BYTE_SIZE / 2) - 1)
+        if self.deframer:
+            return self.get_framed_data(number_packets)
 
         count = 0
         while number_packets + 1 > count:
             try:
                 data_array = self.device.read_data(USB_IN_BYTE_SIZE, 'int16')
-                print(f"got usb data: {data_array}, asked for size: {USB_IN_BYTE_SIZE}")
+                data_trace.event(data_trace.PACKET, "usb packet", "%s, asked for size: %s",
+                                 data_array, USB_IN_BYTE_SIZE)
+                data_trace.capture("usb packet", data_array)
                 full_array.extend(data_array)
                 if TERMINATION_CODE in data_array:
                     # TODO: Delete the last point that was the TERMINATION code, or find its index?
-                    print(f"full array: {full_array}")
+                    data_trace.event(data_trace.DEBUG, "usb data", "%s points",
+                                     len(full_array))
                     return full_array[:-1]
                 count += 1
             except Exception as _error:
-                print(f"Got error reading data: {_error}")
+                logging.error("Got error reading data: %s", _error)
             if self.samples_to_smooth > 1:
                 return rolling_mean(data_array, self.samples_to_smooth)
         return full_array
 
+    def get_framed_data(self, number_packets):
+        """ Get the raw adc counts from a device that sends framed packets, see
+        packet_framing.py.  Corrupted packets are skipped instead of misaligning the rest of
+        the data, and the samples in lost packets are added to self.lost_samples.
+        :param number_packets: number of USB packets the data should take without framing
+        :return: a list of adc counts
+        """
+        full_array = []
+        # the headers and CRCs take more room so allow for extra reads
+        for _ in range(2 * int(number_packets) + 2):
+            try:
+                data = self.device.read_data(USB_IN_BYTE_SIZE)
+            except Exception as _error:
+                logging.error("Got error reading data: %s", _error)
+                continue
+            if not data:
+                break  # read timed out
+            for packet in self.deframer.feed(data):
+                self.lost_samples += packet.lost * len(packet.samples)
+                full_array.extend(packet.samples.tolist())
+            if TERMINATION_CODE in full_array:
+                if self.deframer.counters['lost_packets']:
+                    logging.info("framed data counters: %s", self.deframer.counters)
+                return full_array[:full_array.index(TERMINATION_CODE)]
+        return full_array
+
+    @_with_io_lock
+    def bytes_waiting(self):
+        """ Get the number of bytes the device sent that have not been read yet """
+        if not self.connected:
+            return 0
+        try:
+            return self.device.bytes_waiting()
+        except (OSError, serial.SerialException) as error:
+            logging.debug("could not check the bytes waiting: %s", error)
+            return 0
+
+    def take_lost_samples(self):
+        """ Get the number of samples lost since the last call
+        :return: int - estimated number of samples lost
+        """
+        lost, self.lost_samples = self.lost_samples, 0
+        return lost
+
+    @_with_io_lock
+    def clear_in_buffer(self):
+        """ Clear the data waiting to be read from the device, and any partial packet """
+        self.device.clear_in_buffer()
+        if self.deframer:
+            self.deframer.reset()
+
+    @instrumentation.timed(instrumentation.CONVERT)
     def process_data(self, _raw_data, swv=False):
         """ Take in the raw adc counts and output the corresponding current values
         TODO: should put this somewhere, if the amp_frame, cv_frame get a parent class that
@@ -257,21 +386,19 @@ class AmpUsb(object):
             return _raw_data
 
     def reset(self):
-        self.usb_write('X')
+        self.send_command('reset')
 
     def calibrate(self):
         """ Start calibrating the ADC - TIA module by first sending the proper command to the
         device for it to measure the data, then call _calibrate_data to get the data and send
         it to the adc_tia to be processed
         """
-        print(f"calibrating data, connected: {self.connected}")
+        logging.debug("calibrating data, connected: %s", self.connected)
         if self.connected:
-            self.usb_write('B')
-            print("setting after")
+            self.send_command('calibrate')
             # self.master.after(400, func=self._calibrate_data)
             time.sleep(2)  # the after is not working for some reason, fix this when threading is put in
             self._calibrate_data()
-            print("done setting after")
             logging.debug("running calibration")
 
     def _calibrate_data(self):
@@ -279,9 +406,7 @@ class AmpUsb(object):
         sent.  Gets the data from the device and sends it to the adc_tia module to be processed
         """
         raw_data = self.usb_read_data(20, encoding='int16')
-        print(f"raw data: {raw_data}")
-        logging.debug("Calibration data: {0}".format(raw_data))
-        print("Calibration data: {0}".format(raw_data))
+        logging.debug("Calibration data: %s", raw_data)
         self.device_params.adc_tia.calibrate(raw_data)
 
     def get_export_channel(self, channel=None):
@@ -292,12 +417,12 @@ class AmpUsb(object):
         """
         canvas = self.master.preview_graph
         #TODO fix this
-        print("TODO update this")
+        logging.warning("get_export_channel is not working yet")
 
     def get_look_up_table(self):
-        self.usb_write('l|1000')
+        self.send_command('look_up_table', 1000)
         look_up_table = self.usb_read_data(2000, encoding='int16')
-        print(f"look up table: {look_up_table}")
+        logging.debug("look up table: %s", look_up_table)
         return look_up_table
 
     def set_electrode_config(self, num_electrodes):
@@ -305,7 +430,8 @@ class AmpUsb(object):
         command 'L|X' to change its config where X is either 2 or 3 for the # of electrodes to use
         :param num_electrodes: int, number of electrodes the user wants to use
         """
-        self.usb_write('L|' + str(num_electrodes))  # tell the device
+        # tell the device
+        self.send_state('electrode_config', self.command('electrode_config', num_electrodes))
         # update the gui
         self.master.electrode_config_label.set("{0} electrode configuration".format(num_electrodes))
 
@@ -313,18 +439,17 @@ class AmpUsb(object):
         logging.debug("setting anode voltage to {0} mV".format(voltage))
         formatted_voltage_to_send = self.device_params.dac.get_dac_count(voltage,
                                                                          actual=True)
-        # voltage_str = str(formatted_voltage_to_send).zfill(4)
-        self.usb_write("D|{0:04d}".format(formatted_voltage_to_send))
+        self.send_command('anode_voltage', formatted_voltage_to_send)
 
     def short_tia_resistor(self):
         """ Short the TIA resistor so the working electrode can short any current """
         logging.debug("Shorting TIA resistor")
-        self.usb_write('s')
+        self.send_command('short_tia')
 
     def stop_shorting_tia_resistor(self):
         """ Stop shorting the TIA resistor """
         logging.debug("Stop shorting tia resistor")
-        self.usb_write('d')
+        self.send_command('open_tia')
 
     def set_custom_resistor_channel(self, channel):
         """ Incase the currents are too large and a smaller external TIA resistor is needed
@@ -333,7 +458,8 @@ class AmpUsb(object):
         the virtual ground will cause the working electrode voltage to shift significantly
         :param channel:
         """
-        self.usb_write("A|2|7|0|T|" + channel)
+        # send it as the adc_tia state so picking a current range after it is sent again
+        self.send_state('adc_tia', self.command('adc_tia', 2, 7, 0, 'T', int(channel)))
         # set the adc configuration to 2 for a smaller (1024 mV) Vref,set the TIA resistor to
         # 1M (with the 7) to minimize the change it will have on the equivalent resistance
 
@@ -344,8 +470,12 @@ class AmpUsb(object):
         :param current_range_index: int - index of the current range from the global.py CURRENT_OPTION_LIST
         """
         adc_config, tia_position, adc_gain = get_tia_settings(current_range_index)
+        command = self.command('adc_tia', adc_config, tia_position, adc_gain, 'F', 0)
+        if self.state.is_current('adc_tia', command):
+            logging.debug("tia/adc already set to current range %s", current_range_index)
+            return  # no need to update or calibrate again
         logging.debug('setting tia/adc to position: %s, gain: %s, config: %s', tia_position, adc_gain, adc_config)
-        self.usb_write("A|{0}|{1}|{2}|F|0".format(adc_config, tia_position, adc_gain))  # update device
+        self.send_state('adc_tia', command)  # update device
         self.device_params.adc_tia.set_value(TIA_RESISTOR_VALUES[tia_position],
                                              adc_gain, adc_config, current_range_index)  # update params
         logging.debug("TIA resistor changed to: %s", self.device_params.adc_tia.tia_resistor)
@@ -360,34 +490,72 @@ class AmpUsb(object):
         into the PWM used to set the time between the interrupts that change the dac values
         (_sweep_rate * 1000) is used to convert the sweep rate from V/s to mV/s
         :param _sweep_rate: the users desired sweep rate
-        :return: integer that is to be put into the interrupt PWM timer that's padded with zeros to
-        be 5 integers long to properly send it to the device
+        :return: integer that is to be put into the interrupt PWM timer
         """
         clk_freq = self.device_params.clk_freq_isr_pwm
         # take the clock frequency that is driving the PWM and divide it by the number of voltage
         # steps per second: this is how many clk ticks between each interrupt
         raw_divider = int(
             round(clk_freq / (_sweep_rate * 1000 / self.device_params.dac.voltage_step_size)) - 1)
-        return '{0:05d}'.format(raw_divider), raw_divider
+        return raw_divider
 
     def format_voltage(self, _in_volts):
         """ Takes in the voltage (in millivolts) the user wants to apply to the electrode and
         convert it to the integer that represent the value to be put into the pidac
         :param _in_volts: user desired electrode voltage value in millivolts
-        :return: integer that is the value to be put into the pidac, padded with zeros to be 4
-        values long to be transmitted to the device
+        :return: integer that is the value to be put into the pidac
         """
         # shift the user's voltage by the amount of the virtual ground
         input_voltage = self.device_params.virtual_ground_shift + _in_volts  # mV
 
         # get the value needed (number of increments needed to get desired voltage, ex. desire
-        # 500mV with 1 mV increments then put in 500) to put into the dac and pad it with zeros
-        dac_value = self.device_params.dac.get_dac_count(input_voltage)
-        return '{0:04d}'.format(dac_value), dac_value
+        # 500mV with 1 mV increments then put in 500) to put into the dac
+        return self.device_params.dac.get_dac_count(input_voltage)
+
+    def command(self, name, *values):
+        """ Encode a command with the protocol the device uses, see commands.py
+        :param name: name of the command in commands.COMMANDS
+        :param values: values of the command's fields
+        :return: the command to pass to usb_write or send_state
+        """
+        return self.codec.encode(name, *values)
 
+    def has_capability(self, token):
+        """ Check if the device listed a capability in its reply to the identify command
+        :param token: bytes - the capability, e.g. commands.BINARY_CAPABILITY
+        :return: True if the device has it
+        """
+        identity = getattr(self.device, 'identity', None)
+        return isinstance(identity, bytes) and token in identity
+
+    def send_command(self, name, *values):
+        """ Encode a command and write it to the device
+        :param name: name of the command in commands.COMMANDS
+        :param values: values of the command's fields
+        :return: True if the command was written
+        """
+        return self.usb_write(self.command(name, *values))
+
+    def send_state(self, key, message):
+        """ Send a command that sets part of the device's state, if the device is not already
+        in that state
+        :param key: part of the device state the command sets, see DeviceState
+        :param message: command to send
+        :return: True if the command was sent
+        """
+        if self.state.is_current(key, message):
+            logging.debug("device already has %s: %s", key, message)
+            return False
+        if self.usb_write(message):  # only remember commands the device got
+            self.state.set(key, message)
+            return True
+        return False
+
+    @_with_io_lock
     def usb_write(self, message):
         """ Write the message to the device
         :param message: message, in bytes, to send
+        :return: True if the message was written
         """
         if not self.device.connected:
             logging.info("Device not connected")
@@ -396,11 +564,13 @@ class AmpUsb(object):
             logging.debug("writing message: %s", message)
             try:
                 self.device.write_data(message)
+                return True
             except Exception as error:
-                print(f"Error in writing to device: {error}")
-                logging.debug(f"Error in writing to device: {error}")
+                logging.error("Error in writing to device: %s", error)
                 self.connection_test()
+        return False
 
+    @_with_io_lock
     def usb_read_data(self, _size: int = USB_IN_BYTE_SIZE, encoding: str=None) -> list:
         """
         Abstraction layer of reading from an USB port.
@@ -413,7 +583,6 @@ class AmpUsb(object):
         Returns: list of data read in the format specified by encoding, else a bytestring is returned
 
         """
-        print("reading data", self.connected)
         if not self.connected:
             logging.info("not working")
             return None
@@ -430,7 +599,7 @@ class AmpUsb(object):
         :return: data from the device
         """
         message = self.usb_read_data(_size, encoding='str')
-        print(f"usb read message: {message}")
+        logging.debug("usb read message: %s", message)
         return message
 
     def attempt_reconnection(self):
@@ -457,7 +626,7 @@ class AmpUsb(object):
             _channel = self.params.adc_channel
 
         # the correct complete message was received so attempt to collect the data
-        self.usb_write('E'+str(_channel))  # step 4
+        self.send_command('export', int(_channel))  # step 4
 
         # Get the raw data from the ADC
         raw_data = self.get_data()
@@ -481,37 +650,63 @@ class SerialComm:
     def __init__(self):
         self.connected = False
         self.found = False
+        self.identity = None  # reply to the identify command, tells what protocols it can use
+        self.recorder = None  # serial_capture.SerialRecorder when the traffic is captured
         self.device = self.auto_find_com_port()
-        print(f"Done initializing SerialComm with state: {self.connected}")
+        logging.info("Done initializing SerialComm with state: %s", self.connected)
+        if os.environ.get(serial_capture.CAPTURE_VARIABLE):
+            self.start_capture(os.environ[serial_capture.CAPTURE_VARIABLE])
 
     def auto_find_com_port(self):
         available_ports = serial.tools.list_ports
         for port in available_ports.comports():
             # can not use product string on Windows
             if USB_VENDOR_ID == port.vid and USB_PRODUCT_ID == port.pid:
-                print("found device")
+                logging.info("found device on %s", port.device)
                 self.found = True
                 device = serial.Serial(port.device, BAUD_RATE, timeout=1.0)
-                print("made serial")
                 device.write(b"I")
                 for i in range(3):
                     _input = device.readline()
                     if b"Naresuan Potentiostat" in _input:
                         self.connected = True
-                        print("got device")
+                        self.identity = _input
+                        logging.info("got device: %s", _input)
                         return device
         return None
 
+    def start_capture(self, filename):
+        """ Save all the writes and reads to a capture file, see serial_capture.py """
+        self.stop_capture()
+        self.recorder = serial_capture.SerialRecorder(filename, self.identity)
+
+    def stop_capture(self):
+        if self.recorder:
+            self.recorder.close()
+        self.recorder = None
+
     def clear_in_buffer(self):
         if self.device:
+            if self.recorder:
+                # read the bytes that are thrown away so the replay has them to throw away
+                dropped = self.device.read(self.device.in_waiting)
+                self.recorder.record(serial_capture.READ, dropped)
+                self.recorder.record_clear(len(dropped))
             self.device.reset_input_buffer()
 
     def read_data(self, data_length, encoding=None):
-        data = self.device.read(data_length)  # type: bytes
-        print(f"read byte data: {data}, lenght asked for: {data_length}")
+        with instrumentation.stage(instrumentation.SERIAL_READ):
+            data = self.device.read(data_length)  # type: bytes
+        instrumentation.count("bytes read", len(data))
+        if self.recorder:
+            self.recorder.record(serial_capture.READ, data)
+        data_trace.event(data_trace.PACKET, "serial read", "%s, length asked for: %s", data,
+                         data_length)
+        data_trace.capture("serial read", data)
         if encoding == 'int16':
-            size = int(len(data)/2)  # may not be data_length ?
-            converted_data = struct.unpack(f"{size}h", data)
+            with instrumentation.stage(instrumentation.DECODE):
+                size = int(len(data)/2)  # may not be data_length ?
+                converted_data = struct.unpack(f"{size}h", data)
             return list(converted_data)
         elif encoding == 'str':
             return data.decode("utf-8")
@@ -523,12 +718,23 @@ class SerialComm:
         if self.connected:
             if type(message) is str:
                 message = message.encode('utf-8')
-            print(f"writing data: {message}")
-            self.device.write(message)
+            data_trace.event(data_trace.DEBUG, "serial write", "%s", message)
+            data_trace.capture("serial write", message)
+            with instrumentation.stage(instrumentation.SERIAL_WRITE):
+                self.device.write(message)
+            if self.recorder:
+                self.recorder.record(serial_capture.WRITE, message)
+            instrumentation.count("bytes written", len(message))
+
+    def bytes_waiting(self):
+        return self.device.in_waiting if self.device else 0
 
     def poll_for_data(self):
         if self.device.in_waiting:
-            return self.device.read_all()
+            data = self.device.read_all()
+            if self.recorder:
+                self.recorder.record(serial_capture.READ, data)
+            return data
 
 
 def get_tia_settings(range_selected):